@@ -12,15 +12,20 @@ import logging
 import sys
 import os
 
-import subprocess
+import time
 
 # Add utils to path to ensure modules are found
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from utils.db import DatabaseConnection
+from utils.db import get_database, DatabaseBusyError
 from utils.metrics import MetricsCalculator
 from utils.logger import setup_logger
 from utils.cache import cached_query
+from utils.screener import screen, SCREENER_METRICS
+from utils.snapshot import read_or_fallback
+from utils.downsample import downsample_frame
+from utils.jobs import enqueue_job, get_run, sync_invalidation
+from utils.instrumentation import PageTimer, start_metrics_server
 
 # ============================================================
 # CONFIGURATION
@@ -35,18 +40,33 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Endpoint /metrics (METRICS_PORT) i pomiar czasu sekcji strony
+start_metrics_server()
+page_timer = PageTimer('main')
+page_timer.section('sidebar')
+
 # ============================================================
-# SESSION STATE
+# DATABASE (one engine shared by all sessions)
 # ============================================================
 
-if 'db_connection' not in st.session_state:
-    try:
-        st.session_state.db_connection = DatabaseConnection()
-    except Exception as e:
-        st.error(f"Critical Error: Database connection failed. {e}")
-        st.stop()
+@st.cache_resource
+def shared_database():
+    """One DatabaseConnection (engine and pool) for every session of this server process"""
+    return get_database()
+
 
-db = st.session_state.db_connection
+def database_busy():
+    """Load shedding: the request waited too long for a connection, ask the user to retry"""
+    st.warning("⏳ The database is busy right now. Please retry in a moment.")
+    st.button("Retry")
+    st.stop()
+
+
+try:
+    db = shared_database()
+except Exception as e:
+    st.error(f"Critical Error: Database connection failed. {e}")
+    st.stop()
 
 # ============================================================
 # UI: SIDEBAR
@@ -55,26 +75,57 @@ db = st.session_state.db_connection
 st.sidebar.title("📊 FinTech Analysis")
 st.sidebar.write("Fundamental analysis tool for GPW stocks")
 
-# Update data button
+# Dane zapisane przez joby w tle: unieważnij cache tylko zmienionych tickerów
+# (baza sprawdzana najwyżej raz na CACHE_SYNC_INTERVAL_SECONDS na proces)
+sync_invalidation(db)
+
+# Co ile sekund odświeżać stronę, gdy śledzony job jeszcze trwa
+JOB_POLL_SECONDS = 2
+# Jak długo odświeżać automatycznie: job w kolejce / trwający; potem tylko na żądanie
+JOB_QUEUED_POLL_LIMIT_SECONDS = 60
+JOB_RUNNING_POLL_LIMIT_SECONDS = 30 * 60
+
+# Update data button - kolejkuje job dla schedulera albo podłącza się do już trwającego
 if st.sidebar.button("🔄 Force Update All Data"):
-    with st.spinner('Updating all data... This may take a moment.'):
-        try:
-            # Execute the update script
-            result = subprocess.run(
-                ["python", "scripts/update_all_data.py"],
-                capture_output=True,
-                text=True,
-                check=True  # Raise an exception if the script fails
-            )
-            logger.info(result.stdout)
-            st.success("Data updated successfully!")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Data update failed: {e.stderr}")
-            st.error(f"Data update failed. See logs for details: {e.stderr}")
-        except FileNotFoundError:
-            st.error("Error: 'update_all_data.py' script not found.")
-    st.cache_data.clear()
-    st.rerun()
+    queued = enqueue_job(db, 'full_update')
+    if queued is None:
+        st.sidebar.error("Could not queue the update (is the scheduler running?). See logs for details.")
+    else:
+        st.session_state.update_run_id = queued[0]
+        st.session_state.update_polled_since = time.time()
+        if not queued[1]:
+            st.sidebar.info("An update is already running, showing its progress.")
+
+update_run = get_run(db, st.session_state.update_run_id) if st.session_state.get('update_run_id') else None
+update_active = bool(update_run) and update_run['status'] in ('queued', 'running')
+update_polling = False
+if update_active:
+    poll_limit = JOB_QUEUED_POLL_LIMIT_SECONDS if update_run['status'] == 'queued' else JOB_RUNNING_POLL_LIMIT_SECONDS
+    update_polling = time.time() - st.session_state.get('update_polled_since', 0) < poll_limit
+    progress = update_run['progress'] or {}
+    if update_run['status'] == 'queued':
+        st.sidebar.caption("⏳ Update queued, waiting for the scheduler...")
+    elif progress.get('total'):
+        st.sidebar.progress(
+            min(progress['done'] / progress['total'], 1.0),
+            text=f"{update_run['stage']}: {progress['done']}/{progress['total']} {progress.get('item') or ''}",
+        )
+    else:
+        st.sidebar.caption(f"⏳ {update_run['stage'] or 'starting'}: {progress.get('done', 0)} rows")
+    if not update_polling:
+        if update_run['status'] == 'queued':
+            st.sidebar.warning("The update has not started yet - the scheduler may be down.")
+        if st.sidebar.button("🔃 Check progress"):
+            st.session_state.update_polled_since = time.time()
+            st.rerun()
+elif update_run:
+    # Własny job właśnie się zakończył: nowe dane widoczne od razu, bez czekania na interwał
+    sync_invalidation(db, force=True)
+    if update_run['status'] == 'success':
+        st.sidebar.success(f"Data updated successfully! ({update_run['rows'] or 0} rows)")
+    else:
+        st.sidebar.error(f"Data update failed: {update_run['error']}")
+    del st.session_state.update_run_id
 
 
 # Last update info
@@ -102,6 +153,8 @@ st.markdown("---")
 # SECTION 1: COMPANY SELECTOR
 # ============================================================
 
+page_timer.section('company_selector')
+
 st.subheader("1. Select Company")
 
 try:
@@ -119,15 +172,26 @@ try:
     )
     selected_ticker = company_options[selected_company_display]
     
+except DatabaseBusyError:
+    database_busy()
 except Exception as e:
     st.error(f"❌ Error loading companies: {str(e)}")
     logger.error(f"Error loading companies: {e}")
     st.stop()
 
+# One cached round-trip per ticker: widget-only reruns don't touch the DB
+# (apart from the finished-jobs check, throttled per process in sync_invalidation)
+try:
+    page_data = db.get_ticker_page_data(selected_ticker, quarters=20) or {}
+except DatabaseBusyError:
+    database_busy()
+
 # ============================================================
 # SECTION 2: LIVE METRICS
 # ============================================================
 
+page_timer.section('live_metrics')
+
 st.markdown("---")
 st.subheader("2. Live Metrics")
 
@@ -145,8 +209,8 @@ def get_real_time_price(ticker):
 
 try:
     # Fetch latest price and fundamentals
-    latest_price_from_db = db.get_latest_price(selected_ticker)
-    latest_financials = db.get_latest_financials(selected_ticker)
+    latest_price_from_db = page_data.get('price')
+    latest_financials = page_data.get('financials')
     
     if not latest_price_from_db or not latest_financials:
         st.warning(f"⚠️ Incomplete data for {selected_ticker}. Price or Financials missing.")
@@ -234,11 +298,13 @@ except Exception as e:
 # SECTION 3: FINANCIAL STATEMENTS
 # ============================================================
 
+page_timer.section('financial_statements')
+
 st.markdown("---")
 st.subheader("3. Financial Statements (Last 5 Years)")
 
 try:
-    financials_df = db.get_financials_history(selected_ticker, quarters=20)
+    financials_df = page_data.get('history')
     
     if financials_df is None or len(financials_df) == 0:
         st.info("No financial data available")
@@ -275,11 +341,15 @@ except Exception as e:
 # SECTION 4: CHARTS
 # ============================================================
 
+page_timer.section('charts')
+
 st.markdown("---")
 st.subheader("4. Trends & Analysis")
 
 try:
-    financials_df = db.get_financials_history(selected_ticker, quarters=16)
+    financials_df = page_data.get('history')
+    if financials_df is not None:
+        financials_df = financials_df.tail(16)
     
     if financials_df is not None and len(financials_df) > 0:
         col1, col2 = st.columns(2)
@@ -327,6 +397,8 @@ except Exception as e:
 # SECTION 5: HISTORICAL METRICS
 # ============================================================
 
+page_timer.section('historical_metrics')
+
 st.markdown("---")
 st.subheader("5. Historical Metrics")
 
@@ -363,12 +435,165 @@ except Exception as e:
 
 
 # ============================================================
-# SECTION 6: FOOTER
+# SECTION 6: PRICE HISTORY
+# ============================================================
+
+page_timer.section('price_history')
+
+st.markdown("---")
+st.subheader("6. Price History")
+
+PRICE_RANGES = {'1Y': 365, '5Y': 5 * 365, 'Max': None}
+CHART_MAX_POINTS = 1500
+
+try:
+    col1, col2 = st.columns(2)
+    with col1:
+        price_interval = st.radio("Interval:", options=['daily', 'weekly', 'monthly'], horizontal=True)
+    with col2:
+        price_range = st.radio("Range:", options=list(PRICE_RANGES.keys()), index=1, horizontal=True)
+
+    range_days = PRICE_RANGES[price_range]
+    price_start = (datetime.now() - timedelta(days=range_days)).date() if range_days else None
+    price_df = db.get_price_history(
+        selected_ticker,
+        start=price_start,
+        interval=price_interval,
+        max_points=CHART_MAX_POINTS,
+    )
+
+    if price_df is None or price_df.empty:
+        st.info("No price history available")
+    else:
+        fig_price = px.line(
+            price_df,
+            x='date',
+            y='close',
+            title=f"{selected_ticker} Close ({price_interval})",
+            labels={'date': 'Date', 'close': 'Close'},
+        )
+        fig_price.update_layout(
+            hovermode='x unified',
+            height=400,
+            template='plotly_dark'
+        )
+        st.plotly_chart(fig_price, use_container_width=True)
+
+except DatabaseBusyError:
+    database_busy()
+except Exception as e:
+    st.error(f"❌ Error creating price chart: {str(e)}")
+    logger.error(f"Error creating price chart: {e}")
+
+# Historia wycen z valuation_daily (raport obowiązujący w danym dniu, bez look-ahead)
+VALUATION_METRICS = {
+    'pe_ttm': 'P/E (TTM)',
+    'pb': 'P/B',
+    'ev_ebitda': 'EV/EBITDA (TTM)',
+    'earnings_yield': 'Earnings Yield (%)',
+}
+
+try:
+    valuation_metric = st.radio(
+        "Valuation:",
+        options=list(VALUATION_METRICS.keys()),
+        format_func=VALUATION_METRICS.get,
+        horizontal=True,
+    )
+    valuation_df = db.get_valuation_history(selected_ticker, start=price_start)
+    series = valuation_df.dropna(subset=[valuation_metric]) if valuation_df is not None else None
+
+    if series is None or series.empty:
+        st.info("No valuation history available")
+    else:
+        series = downsample_frame(series, 'date', valuation_metric, CHART_MAX_POINTS)
+        fig_valuation = px.line(
+            series,
+            x='date',
+            y=valuation_metric,
+            title=f"{selected_ticker} {VALUATION_METRICS[valuation_metric]}",
+            labels={'date': 'Date', valuation_metric: VALUATION_METRICS[valuation_metric]},
+            hover_data=['close', 'rok', 'kwartal'],
+        )
+        fig_valuation.update_layout(
+            hovermode='x unified',
+            height=350,
+            template='plotly_dark'
+        )
+        st.plotly_chart(fig_valuation, use_container_width=True)
+
+except DatabaseBusyError:
+    database_busy()
+except Exception as e:
+    st.error(f"❌ Error creating valuation chart: {str(e)}")
+    logger.error(f"Error creating valuation chart: {e}")
+
+# ============================================================
+# SECTION 7: STOCK SCREENER
+# ============================================================
+
+page_timer.section('stock_screener')
+
+st.markdown("---")
+st.subheader("7. Stock Screener")
+
+try:
+    screener_cols = ['ticker', 'name', 'close', 'rok', 'kwartal'] + SCREENER_METRICS
+    # Lokalny snapshot Parquet (po imporcie), zapytanie do bazy gdy jest nieaktualny
+    snapshot = read_or_fallback('latest_snapshot', db.get_screener_snapshot, columns=screener_cols)
+
+    if snapshot is None or snapshot.empty:
+        st.info("No data available for screening")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            max_pe = st.number_input("Max P/E", min_value=0.0, value=15.0, step=1.0)
+        with col2:
+            min_roe = st.number_input("Min ROE (%)", value=10.0, step=1.0)
+        with col3:
+            sort_by = st.selectbox(
+                "Rank by:",
+                options=SCREENER_METRICS,
+                index=SCREENER_METRICS.index('roe')
+            )
+
+        results = screen(
+            snapshot,
+            filters=[('pe_ratio', '<', max_pe), ('roe', '>', min_roe)],
+            sort_by=sort_by,
+            ascending=sort_by in ('pe_ratio', 'debt_to_equity'),
+        )
+
+        st.caption(f"{len(results)} of {len(snapshot)} companies match")
+        st.dataframe(
+            results[screener_cols].round(2),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+except DatabaseBusyError:
+    database_busy()
+except Exception as e:
+    st.error(f"❌ Error running screener: {str(e)}")
+    logger.error(f"Error running screener: {e}")
+
+
+# ============================================================
+# SECTION 8: FOOTER
 # ============================================================
 
+page_timer.section('footer')
+
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: gray; font-size: 12px;'>
     <p>FinTech Analysis Tool | Data source: dane_finansowe.xlsx | Last updated: {}</p>
 </div>
-""".format(datetime.now().strftime("%Y-%m-%d %H:%M")), unsafe_allow_html=True)
\ No newline at end of file
+""".format(datetime.now().strftime("%Y-%m-%d %H:%M")), unsafe_allow_html=True)
+
+page_timer.finish()
+
+# Odświeżanie postępu śledzonego joba (ograniczone w czasie, potem przycisk "Check progress")
+if update_polling:
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
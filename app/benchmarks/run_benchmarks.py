@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+This script benchmarks the import, the hot read queries and the metric computation
+on synthetic data against a local Postgres and compares the results with a baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--tickers 100] [--years 20] [--output results.json]
+                                        [--baseline baseline.json] [--save-baseline] [--keep-data]
+
+The suite rebuilds derived tables and runs ANALYZE, so it needs a dedicated
+database in BENCHMARK_DATABASE_URL (never the application's DATABASE_URL).
+Synthetic tickers (SYN0001.WA, ...) are removed afterwards unless --keep-data is given.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import logging
+import asyncio
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+sys.path.append(os.path.join(parent_dir, 'scripts'))
+
+# Benchmark pisze do bazy i przebudowuje tabele pochodne - tylko na osobnej bazie
+BENCHMARK_DATABASE_URL = os.getenv('BENCHMARK_DATABASE_URL')
+APP_DATABASE_URL = os.getenv('DATABASE_URL')
+if BENCHMARK_DATABASE_URL:
+    os.environ['DATABASE_URL'] = BENCHMARK_DATABASE_URL
+
+import pandas as pd
+from sqlalchemy import text
+
+from utils.db import DatabaseConnection, get_database
+from utils.async_db import AsyncDatabaseConnection
+from utils.cache import clear_all
+from utils.metrics import MetricsCalculator, FINANCIAL_INPUTS
+from utils.screener import screen
+from utils.ttm import refresh_ttm
+from utils.indicators import refresh_indicators
+from utils.valuation import refresh_valuation
+from migrate_schema import migrate_schema
+from update_all_data import run_quarterly_import
+from import_prices_from_csv import run_price_import
+from synthetic_data import (
+    synthetic_tickers, seed_companies, cleanup, write_prices_csv, write_financials_xlsx,
+    TICKER_PATTERN, SYNTHETIC_WORKBOOK,
+)
+
+# Setup logowania
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ile razy powtarzać odczyty i ile tickerów próbkować
+READ_RUNS = 5
+SAMPLE_TICKERS = 10
+# Wzrost mediany o więcej niż próg względem baseline = regresja
+REGRESSION_THRESHOLD = 0.20
+
+METRICS_INPUT_SQL = text(f"""
+    SELECT f.ticker, {', '.join(f'f.{c}' for c in FINANCIAL_INPUTS)}, s.close
+    FROM financials f
+    LEFT JOIN latest_snapshot s ON s.ticker = f.ticker
+    WHERE f.ticker ~ :pattern
+""")
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def summarize(samples: list, **extra) -> dict:
+    samples = sorted(samples)
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[max(int(len(samples) * 0.95) - 1, 0)], 3),
+        'min_ms': round(samples[0], 3),
+        'runs': len(samples),
+        **extra,
+    }
+
+
+def bench_once(name: str, results: dict, func, *args, rows: int = None, **kwargs):
+    """Single timed run (imports); a None or False result counts as a failure"""
+    result, elapsed = timed(func, *args, **kwargs)
+    if result is None or result is False:
+        raise RuntimeError(f"{name} failed, see logs")
+    extra = {'rows': rows, 'rows_per_s': round(rows / elapsed * 1000, 1)} if rows else {}
+    results[name] = summarize([elapsed], **extra)
+    logger.info(f"{name}: {elapsed:.1f} ms")
+    return result
+
+
+def bench_reads(name: str, results: dict, call, tickers: list):
+    """Cold-cache latency of call(ticker) over sampled tickers, READ_RUNS times"""
+    samples = []
+    for _ in range(READ_RUNS):
+        for ticker in tickers:
+            clear_all()
+            samples.append(timed(call, ticker)[1])
+    results[name] = summarize(samples)
+    logger.info(f"{name}: median {results[name]['median_ms']} ms")
+
+
+def run_suite(db: DatabaseConnection, n_tickers: int, years: int, seed: int, workdir: str) -> dict:
+    tickers = synthetic_tickers(n_tickers)
+    results = {}
+
+    logger.info(f"Generating {n_tickers} tickers x {years} years of synthetic data in {workdir}")
+    csv_path = os.path.join(workdir, 'prices.csv')
+    xlsx_path = os.path.join(workdir, SYNTHETIC_WORKBOOK)
+    price_rows = write_prices_csv(csv_path, tickers, years, seed)
+    report_rows = write_financials_xlsx(xlsx_path, tickers, years, seed)
+    seed_companies(db, tickers, seed)
+
+    # Import
+    bench_once('import_financials', results, run_quarterly_import, xlsx_path, force=True, rows=report_rows)
+    bench_once('import_prices', results, run_price_import, csv_path, rows=price_rows)
+    bench_once('refresh_ttm_full', results, refresh_ttm, db, full=True)
+    bench_once('refresh_indicators_full', results, refresh_indicators, db, full=True, rows=price_rows)
+    bench_once('refresh_valuation_full', results, refresh_valuation, db, full=True, rows=price_rows)
+    bench_once('refresh_latest_snapshot', results, db.refresh_latest_snapshot)
+    with db.get_connection() as conn:
+        conn.execute(text("ANALYZE"))
+
+    # Gorące zapytania aplikacji (cache wyczyszczony przed każdym wywołaniem)
+    sample = tickers[::max(len(tickers) // SAMPLE_TICKERS, 1)][:SAMPLE_TICKERS]
+    start_1y = (pd.Timestamp.today() - pd.DateOffset(years=1)).date()
+    bench_reads('read_latest_price', results, db.get_latest_price, sample)
+    bench_reads('read_latest_financials', results, db.get_latest_financials, sample)
+    bench_reads('read_financials_history_20q', results, lambda t: db.get_financials_history(t, quarters=20), sample)
+    bench_reads('read_ticker_page_data', results, db.get_ticker_page_data, sample)
+    # Ta sama strona przez AsyncDatabaseConnection (równoległe zapytania, jedna pętla na cały pomiar)
+    loop = asyncio.new_event_loop()
+    adb = AsyncDatabaseConnection()
+    try:
+        bench_reads('read_page_data_async', results, lambda t: loop.run_until_complete(adb.get_page_data(t)), sample)
+    finally:
+        loop.run_until_complete(adb.close())
+        loop.close()
+    bench_reads('read_price_history_1y', results, lambda t: db.get_price_history([t], start=start_1y), sample)
+    bench_reads('read_price_history_all_1500pts', results,
+                lambda t: db.get_price_history([t], max_points=1500), sample)
+    bench_reads('read_valuation_history_1y', results, lambda t: db.get_valuation_history(t, start=start_1y), sample)
+    bench_reads('read_screener_snapshot', results, lambda _: db.get_screener_snapshot(), sample[:1])
+
+    # Wskaźniki i screener w pamięci
+    with db.get_connection() as conn:
+        frame = pd.read_sql(METRICS_INPUT_SQL, conn, params={'pattern': TICKER_PATTERN}, coerce_float=True)
+    _, elapsed = timed(MetricsCalculator.calculate_batch, frame)
+    results['metrics_calculate_batch'] = summarize([elapsed], rows=len(frame))
+    snapshot = db.get_screener_snapshot()
+    samples = [timed(screen, snapshot, [('pe_ratio', '<', 15), ('roe', '>', 10)], 'roe')[1] for _ in range(READ_RUNS)]
+    results['screen'] = summarize(samples, rows=len(snapshot))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=parent_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """Print median vs baseline per benchmark. Returns the names of regressions"""
+    regressions = []
+    print(f"{'benchmark':<34} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            print(f"{name:<34} {'-':>12} {current['median_ms']:>12.2f} {'new':>8}")
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        flag = ' ⚠' if change > threshold else ''
+        print(f"{name:<34} {previous['median_ms']:>12.2f} {current['median_ms']:>12.2f} {change:>+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=100, help="number of synthetic tickers (10-5000)")
+    parser.add_argument('--years', type=int, default=20, help="years of daily prices and quarterly reports")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write this run's results")
+    parser.add_argument('--baseline', help="baseline results file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run's results to --baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="relative median slowdown reported as a regression")
+    parser.add_argument('--keep-data', action='store_true', help="do not delete the synthetic tickers afterwards")
+    args = parser.parse_args()
+    if not BENCHMARK_DATABASE_URL:
+        parser.error("BENCHMARK_DATABASE_URL is not set; point it at a dedicated benchmark database")
+    if BENCHMARK_DATABASE_URL == APP_DATABASE_URL:
+        parser.error("BENCHMARK_DATABASE_URL must not be the application's DATABASE_URL")
+
+    db = get_database()
+    # Baza benchmarku zakładana raz z init.sql - dociągnięcie do bieżącego schematu
+    if not migrate_schema(db):
+        sys.exit(1)
+    try:
+        with tempfile.TemporaryDirectory(prefix='fintech-bench-') as workdir:
+            results = run_suite(db, args.tickers, args.years, args.seed, workdir)
+    finally:
+        if not args.keep_data:
+            cleanup(db)
+
+    report = {
+        'meta': {
+            'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'tickers': args.tickers,
+            'years': args.years,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Results written to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['meta']['tickers'], baseline['meta']['years']) != (args.tickers, args.years):
+            logger.warning("Baseline was recorded with a different data size, comparison is indicative only")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            logger.error(f"❌ Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
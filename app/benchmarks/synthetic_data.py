@@ -0,0 +1,178 @@
+"""
+Synthetic market data for benchmarks: companies, daily prices (CSV) and quarterly reports (Excel)
+"""
+
+import os
+import sys
+import csv
+import logging
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import text
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+sys.path.append(os.path.join(parent_dir, 'scripts'))
+
+from import_prices_from_csv import PRICE_COLUMNS
+from update_all_data import FINANCIAL_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Syntetyczne tickery: SYN0001.WA ... SYN9999.WA (mieszczą się w VARCHAR(10))
+TICKER_PREFIX = 'SYN'
+# Sprzątanie i zapytania benchmarku dotykają tylko tickerów dokładnie w tym formacie
+TICKER_PATTERN = rf'^{TICKER_PREFIX}[0-9]{{4}}\.WA$'
+SECTORS = ['Banking', 'Energy', 'IT', 'Retail', 'Chemicals', 'Telecom', 'Mining', 'Gaming']
+QUARTERS = ['Q1', 'Q2', 'Q3', 'Q4']
+# Nazwa pliku raportów - jego skrót trafia do import_fingerprints
+SYNTHETIC_WORKBOOK = 'synthetic_financials.xlsx'
+
+SEED_COMPANIES_SQL = text("""
+    INSERT INTO companies (ticker, name, currency, sector, industry)
+    VALUES (:ticker, :name, 'PLN', :sector, :sector)
+    ON CONFLICT (ticker) DO NOTHING
+""")
+
+CLEANUP_SQL = [
+    text("DELETE FROM financials_ttm WHERE ticker ~ :pattern"),
+    text("DELETE FROM financials WHERE ticker ~ :pattern"),
+    # prices_daily, price_indicators, valuation_daily: ON DELETE CASCADE
+    text("DELETE FROM companies WHERE ticker ~ :pattern"),
+    text(f"DELETE FROM import_fingerprints WHERE source = 'financials:{SYNTHETIC_WORKBOOK}'"),
+]
+
+
+def synthetic_tickers(n: int) -> list:
+    if not 1 <= n <= 9999:
+        raise ValueError("between 1 and 9999 tickers are supported")
+    return [f"{TICKER_PREFIX}{i:04d}.WA" for i in range(1, n + 1)]
+
+
+def seed_companies(db, tickers: list, seed: int = 42) -> int:
+    """Insert the synthetic tickers into companies (prices reference it)"""
+    rng = np.random.default_rng(seed)
+    rows = [
+        {'ticker': t, 'name': f"Synthetic {t.split('.')[0]} SA", 'sector': SECTORS[i]}
+        for t, i in zip(tickers, rng.integers(0, len(SECTORS), len(tickers)))
+    ]
+    with db.get_connection() as conn:
+        conn.execute(SEED_COMPANIES_SQL, rows)
+    return len(rows)
+
+
+def cleanup(db):
+    """Remove every synthetic ticker and its data"""
+    with db.get_connection() as conn:
+        for statement in CLEANUP_SQL:
+            conn.execute(statement, {'pattern': TICKER_PATTERN})
+    db.refresh_latest_snapshot()
+
+
+def price_path(rng, days: int) -> pd.DataFrame:
+    """Geometric Brownian motion OHLCV bars for one ticker"""
+    start = rng.uniform(5, 300)
+    drift, vol = rng.normal(0.05, 0.05), rng.uniform(0.15, 0.6)
+    returns = rng.normal((drift - vol ** 2 / 2) / 252, vol / np.sqrt(252), days)
+    # DECIMAL(10,2) - ceny utrzymane w zakresie kolumny
+    close = np.clip(start * np.exp(np.cumsum(returns)), 0.05, 99999)
+    open_ = np.clip(close * np.exp(rng.normal(0, vol / 40, days)), 0.05, 99999)
+    spread = np.abs(rng.normal(0, vol / 30, days))
+    return pd.DataFrame({
+        'open': open_.round(2),
+        'high': (np.maximum(open_, close) * (1 + spread)).clip(max=99999).round(2),
+        'low': (np.minimum(open_, close) * (1 - spread)).clip(min=0.01).round(2),
+        'close': close.round(2),
+        'volume': rng.lognormal(11, 1, days).astype('int64'),
+    })
+
+
+def write_prices_csv(path: str, tickers: list, years: int = 20, seed: int = 42, end=None) -> int:
+    """
+    Write daily bars (business days) for every ticker to a CSV in the
+    import_prices_from_csv format, one ticker at a time (bounded memory).
+    Returns the number of rows.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+    dates = pd.bdate_range(end=end, periods=years * 252).strftime('%Y-%m-%d')
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PRICE_COLUMNS)
+        for ticker in tickers:
+            bars = price_path(rng, len(dates))
+            bars.insert(0, 'date', dates)
+            bars.insert(0, 'ticker', ticker)
+            bars[PRICE_COLUMNS].to_csv(f, header=False, index=False)
+            rows += len(bars)
+    return rows
+
+
+def excel_header(column: str) -> str:
+    """financials column -> Excel header as in dane_finansowe.xlsx (Zysk_Netto, EBITDA, ...)"""
+    return 'EBITDA' if column == 'ebitda' else '_'.join(part.capitalize() for part in column.split('_'))
+
+
+def report_rows(rng, ticker: str, years: int, end_year: int):
+    """Quarterly reports of one ticker with internally consistent statements"""
+    revenue = rng.uniform(50e6, 20e9)
+    shares = int(rng.uniform(5e6, 1e9))
+    growth, margin = rng.normal(0.015, 0.01), rng.uniform(0.02, 0.25)
+    for rok in range(end_year - years + 1, end_year + 1):
+        for q, kwartal in enumerate(QUARTERS):
+            revenue *= 1 + rng.normal(growth, 0.05)
+            net = revenue * rng.normal(margin, margin / 3)
+            ebitda = revenue * (margin + rng.uniform(0.03, 0.15))
+            assets = revenue * rng.uniform(1.5, 4)
+            equity = assets * rng.uniform(0.25, 0.7)
+            current_assets = assets * rng.uniform(0.2, 0.5)
+            st_liab = current_assets / rng.uniform(0.8, 2.5)
+            st_debt, lt_debt = st_liab * rng.uniform(0.1, 0.5), (assets - equity - st_liab) * rng.uniform(0.2, 0.8)
+            operating = net * rng.uniform(0.8, 1.5)
+            capex = -revenue * rng.uniform(0.02, 0.1)
+            values = {
+                'ticker': ticker, 'waluta': 'PLN',
+                'data_publikacji': pd.Timestamp(rok, 3 * q + 1, 1) + pd.offsets.MonthEnd(4) + pd.Timedelta(days=14),
+                'rok': rok, 'kwartal': kwartal,
+                'przychody': revenue, 'zysk_netto': net, 'zysk_netto_jednostki_dominujacej': net * 0.97,
+                'ebitda': ebitda, 'amortyzacja': ebitda * 0.3, 'ebit': ebitda * 0.7,
+                'zysk_brutto': net / 0.81, 'podatek_dochodowy': net / 0.81 * 0.19,
+                'aktywa_razem': assets, 'pasywa_razem': assets, 'kapital_wlasny': equity,
+                'aktywa_obrotowe': current_assets, 'aktywa_trwale': assets - current_assets,
+                'srodki_pieniezne': current_assets * 0.3, 'zobowiazania_krotkoterminowe': st_liab,
+                'zobowiazania_dlugoterminowe': assets - equity - st_liab,
+                'dlug_krotkoterminowy': st_debt, 'dlug_dlugoterminowy': lt_debt,
+                'przeplywy_operacyjne': operating, 'capex': capex, 'free_cash_flow': operating + capex,
+                'liczba_akcji': shares,
+            }
+            # Pozostałe pozycje: losowe wartości rzędu przychodów
+            yield [
+                values[c] if c in values else float(revenue * rng.uniform(0, 0.3))
+                for c in FINANCIAL_COLUMNS
+            ]
+
+
+def write_financials_xlsx(path: str, tickers: list, years: int = 20, seed: int = 42, end_year: int = None) -> int:
+    """
+    Write quarterly reports to an .xlsx workbook in the dane_finansowe.xlsx
+    layout, streamed with openpyxl's write-only mode. Returns the number of rows.
+    """
+    rng = np.random.default_rng(seed)
+    end_year = end_year or pd.Timestamp.today().year - 1
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append([excel_header(c) for c in FINANCIAL_COLUMNS])
+    rows = 0
+    for ticker in tickers:
+        for row in report_rows(rng, ticker, years, end_year):
+            sheet.append(row)
+            rows += 1
+    workbook.save(path)
+    return rows
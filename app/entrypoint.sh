@@ -15,12 +15,19 @@ until pg_isready -h "$HOST" -p "$PORT" -U "$USER"; do
   sleep 2
 done
 
->&2 echo "Postgres is ready! Running the data update script..."
+>&2 echo "Postgres is ready! Updating the database schema..."
 
-# Run the consolidated Python script to update all data
-python scripts/update_all_data.py
+# init.sql runs only on a fresh volume; tables and columns added since are created here
+python scripts/migrate_schema.py
 
-echo "Script execution finished. Starting the application..."
+>&2 echo "Starting the background data scheduler..."
+
+# Imports and price refresh run in the background (scripts/run_scheduler.py),
+# so the UI comes up immediately and an ingestion failure does not stop it.
+# Runs are recorded in the job_runs table.
+python scripts/run_scheduler.py &
+
+echo "Starting the application..."
 
 # Execute the main command passed in CMD (Streamlit)
 exec "$@"
\ No newline at end of file
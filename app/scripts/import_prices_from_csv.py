@@ -7,8 +7,6 @@ import os
 import sys
 import logging
 import pandas as pd
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
 # ==========================================
 # KONFIGURACJA ŚCIEŻEK
@@ -17,7 +15,8 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from utils.db import DatabaseConnection
+from utils.db import DatabaseConnection, get_database
+from utils.instrumentation import inc
 
 # Setup logowania
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,54 +24,141 @@ logger = logging.getLogger(__name__)
 
 # Ścieżka do pliku w kontenerze
 CSV_PATH = '/app/data/stock_prices.csv'
-DATABASE_URL = os.getenv('DATABASE_URL')
 
-def run_price_import():
-    """Imports stock prices from the CSV file."""
-    logger.info(f"Starting price import from: {CSV_PATH}")
-    
-    if not os.path.exists(CSV_PATH):
-        logger.error(f"❌ File not found: {CSV_PATH}. Check if 'data' folder is correctly mounted.")
-        return
+# Liczba wierszy CSV wczytywanych naraz (pamięć klienta nie rośnie z rozmiarem pliku)
+CHUNK_SIZE = int(os.getenv('PRICE_IMPORT_CHUNK_SIZE', 50000))
 
-    df = None
-    try:
-        df = pd.read_csv(CSV_PATH)
-    except Exception as e:
-        logger.error(f"Critical error during file read: {e}")
-        return
+PRICE_COLUMNS = ['ticker', 'date', 'open', 'high', 'low', 'close', 'volume']
+REQUIRED_COLUMNS = ['ticker', 'date', 'close']
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE staging_prices (
+        seq BIGSERIAL,
+        ticker VARCHAR(10),
+        date DATE,
+        open NUMERIC,
+        high NUMERIC,
+        low NUMERIC,
+        close NUMERIC,
+        volume NUMERIC
+    ) ON COMMIT DROP;
+"""
+
+# Jeden set-based upsert: ostatni wiersz dla (ticker, date) wygrywa,
+# wiersze dla nieznanych tickerów są odrzucane zamiast łamać klucz obcy.
+MERGE_SQL = """
+    WITH latest AS (
+        SELECT DISTINCT ON (s.ticker, s.date)
+               s.ticker, s.date, s.open, s.high, s.low, s.close, s.volume
+        FROM staging_prices s
+        JOIN companies c ON c.ticker = s.ticker
+        ORDER BY s.ticker, s.date, s.seq DESC
+    ),
+    upserted AS (
+        INSERT INTO prices_daily (ticker, date, open, high, low, close, volume)
+        SELECT ticker, date, open, high, low, close, volume::BIGINT
+        FROM latest
+        ON CONFLICT (ticker, date) DO UPDATE SET
+            open = COALESCE(EXCLUDED.open, prices_daily.open),
+            high = COALESCE(EXCLUDED.high, prices_daily.high),
+            low = COALESCE(EXCLUDED.low, prices_daily.low),
+            close = EXCLUDED.close,
+            volume = COALESCE(EXCLUDED.volume, prices_daily.volume),
+            updated_at = NOW()
+        -- Niezmienione notowania zostają nietknięte: updated_at wyznacza przyrostowe przeliczenia
+        WHERE (prices_daily.open, prices_daily.high, prices_daily.low, prices_daily.close, prices_daily.volume)
+            IS DISTINCT FROM (
+                COALESCE(EXCLUDED.open, prices_daily.open), COALESCE(EXCLUDED.high, prices_daily.high),
+                COALESCE(EXCLUDED.low, prices_daily.low), EXCLUDED.close,
+                COALESCE(EXCLUDED.volume, prices_daily.volume)
+            )
+        RETURNING ticker, (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+        ARRAY(SELECT DISTINCT ticker FROM upserted ORDER BY ticker) AS tickers,
+        (SELECT COUNT(*) FROM staging_prices) AS staged,
+        (SELECT COUNT(*) FROM staging_prices s
+         WHERE NOT EXISTS (SELECT 1 FROM companies c WHERE c.ticker = s.ticker)) AS unknown_ticker
+    FROM upserted;
+"""
+
+
+def clean_chunk(chunk: pd.DataFrame):
+    """
+    Normalizes a CSV chunk column-wise.
+    Returns: (clean DataFrame with PRICE_COLUMNS, number of rejected rows)
+    """
+    chunk = chunk.rename(columns=str.lower).reindex(columns=PRICE_COLUMNS)
 
-    if df is None or df.empty:
-        logger.error("❌ DataFrame is empty. Aborting.")
-        return
+    chunk['ticker'] = chunk['ticker'].str.strip().str.upper().mask(lambda t: t == '')
+    chunk['date'] = pd.to_datetime(chunk['date'], errors='coerce').dt.strftime('%Y-%m-%d')
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
 
+    valid = chunk[REQUIRED_COLUMNS].notna().all(axis=1) & (chunk['ticker'].str.len() <= 10)
+    return chunk[valid], int((~valid).sum())
+
+
+def run_price_import(csv_path: str = CSV_PATH, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Imports stock prices from the CSV file.
+
+    The file is read in chunks and each chunk is streamed with COPY into a
+    temporary staging table, then merged into prices_daily with a single
+    set-based upsert. progress(rows read) is called after every chunk.
+    Returns a dict with inserted/updated/rejected counters and the changed
+    tickers, or None if the import failed.
+    """
+    logger.info(f"Starting price import from: {csv_path}")
+    
+    if not os.path.exists(csv_path):
+        logger.error(f"❌ File not found: {csv_path}. Check if 'data' folder is correctly mounted.")
+        return None
+
+    stats = {'inserted': 0, 'updated': 0, 'rejected': 0, 'changed_tickers': []}
     logger.info("Processing and saving to DB...")
     
     try:
-        db = DatabaseConnection()
-        success_count = 0
-        with db.get_connection() as conn:
+        db = get_database()
+        with db.get_raw_connection() as conn:
             with conn.cursor() as cur:
-                for index, row in df.iterrows():
-                    try:
-                        query = """
-                            INSERT INTO prices_daily (ticker, date, close)
-                            VALUES (%s, %s, %s)
-                            ON CONFLICT (ticker, date) DO UPDATE SET 
-                                close = EXCLUDED.close,
-                                updated_at = NOW();
-                        """
-                        values = (row.get('ticker'), row.get('date'), row.get('close'))
-                        cur.execute(query, values)
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"Error importing row for {row.get('ticker')}: {e}")
-                        conn.rollback()
-                        continue
-                conn.commit()
-        logger.info(f"✅ Success! Updated/Added {success_count} prices.")
+                cur.execute(STAGING_TABLE_SQL)
+
+                read = 0
+                for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=str):
+                    clean, rejected = clean_chunk(chunk)
+                    stats['rejected'] += rejected
+                    if not clean.empty:
+                        DatabaseConnection.copy_dataframe(cur, clean, 'staging_prices', PRICE_COLUMNS)
+                    read += len(chunk)
+                    if progress:
+                        progress(read)
+
+                cur.execute(MERGE_SQL)
+                inserted, updated, tickers, staged, unknown_ticker = cur.fetchone()
+
+        if staged == 0:
+            logger.error("❌ No valid rows found in CSV. Aborting.")
+            return None
+
+        # Duplikaty (ticker, date) w pliku są scalane do jednego wiersza
+        stats['inserted'] = inserted
+        stats['updated'] = updated
+        stats['changed_tickers'] = tickers
+        stats['rejected'] += unknown_ticker
+        for result in ('inserted', 'updated', 'rejected'):
+            inc('import_rows_total', stats[result], source='prices_csv', result=result)
+        db.refresh_latest_snapshot()
+        logger.info(
+            f"✅ Success! Prices inserted: {stats['inserted']}, updated: {stats['updated']}, "
+            f"rejected: {stats['rejected']} (unknown ticker: {unknown_ticker})."
+        )
+        return stats
     except Exception as e:
         logger.error(f"General error with database connection or import: {e}")
+        return None
 
 if __name__ == "__main__":
     run_price_import()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+This script migrates prices_daily to yearly range partitions with a BRIN index on date,
+and benchmarks query latency and on-disk size before and after.
+
+Usage:
+    python scripts/migrate_prices_partitioned.py [--benchmark-only] [--drop-old] [--report FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+from sqlalchemy import text
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from utils.db import DatabaseConnection, get_database
+
+# Setup logowania
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BENCHMARK_RUNS = 20
+
+# Partycje nazywane prices_daily_y<rok>, niezależnie od nazwy rodzica w trakcie migracji
+PARTITION_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION create_price_partitions(from_year INT, to_year INT, parent TEXT DEFAULT 'prices_daily')
+    RETURNS void AS $$
+    DECLARE
+        y INT;
+    BEGIN
+        FOR y IN from_year..to_year LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                'prices_daily_y' || y, parent, make_date(y, 1, 1), make_date(y + 1, 1, 1)
+            );
+        END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+PARTITIONED_TABLE_SQL = """
+    CREATE TABLE prices_daily_partitioned (
+        ticker VARCHAR(10) NOT NULL REFERENCES companies(ticker) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        open DECIMAL(10,2),
+        high DECIMAL(10,2),
+        low DECIMAL(10,2),
+        close DECIMAL(10,2) NOT NULL,
+        volume BIGINT,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW(),
+
+        -- Klucz obejmuje kolumnę partycjonującą; służy też ON CONFLICT (ticker, date)
+        PRIMARY KEY (ticker, date)
+    ) PARTITION BY RANGE (date);
+
+    CREATE TABLE prices_daily_default PARTITION OF prices_daily_partitioned DEFAULT;
+
+    -- Dane ładowane są w kolejności dat, więc BRIN zastępuje B-tree na (date DESC) ułamkiem rozmiaru
+    CREATE INDEX idx_prices_date_brin ON prices_daily_partitioned USING BRIN (date) WITH (pages_per_range = 32);
+    CREATE INDEX idx_prices_partitioned_updated_brin ON prices_daily_partitioned USING BRIN (updated_at);
+"""
+
+# Typowe zapytania aplikacji (ticker podstawiany najczęściej notowanym)
+BENCHMARK_QUERIES = {
+    'latest_price': """
+        SELECT date, close FROM prices_daily WHERE ticker = :ticker ORDER BY date DESC LIMIT 1
+    """,
+    'history_1y': """
+        SELECT date, open, high, low, close, volume FROM prices_daily
+        WHERE ticker = :ticker AND date >= CURRENT_DATE - INTERVAL '1 year'
+        ORDER BY date
+    """,
+    'monthly_5y_all': """
+        SELECT ticker, date_trunc('month', date) AS month, MAX(high), MIN(low), SUM(volume)
+        FROM prices_daily
+        WHERE date >= CURRENT_DATE - INTERVAL '5 years'
+        GROUP BY 1, 2
+    """,
+    'last_30d_all': """
+        SELECT ticker, date, close FROM prices_daily WHERE date >= CURRENT_DATE - INTERVAL '30 days'
+    """,
+}
+
+SIZE_SQL = """
+    SELECT COALESCE(SUM(pg_total_relation_size(c.oid)), 0)
+    FROM pg_class c
+    WHERE c.oid = 'prices_daily'::regclass
+       OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'prices_daily'::regclass)
+"""
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'prices_daily'")).scalar() == 'p'
+
+
+def run_benchmark(db: DatabaseConnection) -> dict:
+    """Median/p95 latency (ms) of BENCHMARK_QUERIES and total on-disk size of prices_daily"""
+    with db.get_connection() as conn:
+        ticker = conn.execute(text(
+            "SELECT ticker FROM prices_daily GROUP BY ticker ORDER BY COUNT(*) DESC LIMIT 1"
+        )).scalar()
+        rows = conn.execute(text("SELECT COUNT(*) FROM prices_daily")).scalar()
+        size_bytes = conn.execute(text(SIZE_SQL)).scalar()
+
+        latencies = {}
+        for name, query in BENCHMARK_QUERIES.items():
+            samples = []
+            for _ in range(BENCHMARK_RUNS):
+                started = time.perf_counter()
+                conn.execute(text(query), {'ticker': ticker}).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            latencies[name] = {
+                'median_ms': round(statistics.median(samples), 3),
+                'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+            }
+
+        partitioned = is_partitioned(conn)
+
+    return {
+        'partitioned': partitioned,
+        'rows': rows,
+        'size_bytes': int(size_bytes),
+        'size_mb': round(size_bytes / 1024 / 1024, 2),
+        'queries': latencies,
+    }
+
+
+def migrate(db: DatabaseConnection, drop_old: bool = False) -> bool:
+    """
+    Copy prices_daily into a partitioned table in date order and swap it in, in one
+    transaction. latest_snapshot depends on prices_daily, so it is dropped and
+    recreated from its own definition.
+    """
+    with db.get_connection() as conn:
+        if is_partitioned(conn):
+            logger.info("prices_daily is already partitioned, nothing to migrate")
+            return False
+
+        conn.execute(text("LOCK TABLE prices_daily IN EXCLUSIVE MODE"))
+        conn.execute(text(PARTITION_FUNCTION_SQL))
+        conn.execute(text(PARTITIONED_TABLE_SQL))
+
+        first_year, last_year = conn.execute(text(
+            "SELECT EXTRACT(YEAR FROM MIN(date))::INT, EXTRACT(YEAR FROM MAX(date))::INT FROM prices_daily"
+        )).fetchone()
+        this_year = conn.execute(text("SELECT EXTRACT(YEAR FROM CURRENT_DATE)::INT")).scalar()
+        first_year = first_year or this_year
+        last_year = max(last_year or this_year, this_year) + 1
+        conn.execute(
+            text("SELECT create_price_partitions(:from_year, :to_year, 'prices_daily_partitioned')"),
+            {'from_year': first_year, 'to_year': last_year}
+        )
+        logger.info(f"Created yearly partitions {first_year}-{last_year}")
+
+        moved = conn.execute(text("""
+            INSERT INTO prices_daily_partitioned (ticker, date, open, high, low, close, volume, created_at, updated_at)
+            SELECT ticker, date, open, high, low, close, volume, created_at, updated_at
+            FROM prices_daily
+            ORDER BY date, ticker
+        """)).rowcount
+        logger.info(f"Copied {moved} rows")
+
+        view_sql = conn.execute(text("SELECT pg_get_viewdef('latest_snapshot'::regclass, true)")).scalar()
+        conn.execute(text("DROP MATERIALIZED VIEW latest_snapshot"))
+
+        conn.execute(text("ALTER TABLE prices_daily RENAME TO prices_daily_heap"))
+        conn.execute(text("ALTER TABLE prices_daily_partitioned RENAME TO prices_daily"))
+        if drop_old:
+            conn.execute(text("DROP TABLE prices_daily_heap"))
+
+        conn.execute(text(f"CREATE MATERIALIZED VIEW latest_snapshot AS {view_sql.rstrip().rstrip(';')} WITH DATA"))
+        conn.execute(text("CREATE UNIQUE INDEX idx_latest_snapshot_ticker ON latest_snapshot(ticker)"))
+
+    with db.get_connection() as conn:
+        conn.execute(text("ANALYZE prices_daily"))
+    logger.info("✅ prices_daily is now partitioned by year" + ("" if drop_old else " (old table kept as prices_daily_heap)"))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--benchmark-only', action='store_true', help="only measure the current layout")
+    parser.add_argument('--drop-old', action='store_true', help="drop the old heap table after the swap")
+    parser.add_argument('--report', help="write the before/after report as JSON to this file")
+    args = parser.parse_args()
+
+    db = get_database()
+    report = {'before': run_benchmark(db)}
+    logger.info(f"Before: {json.dumps(report['before'])}")
+
+    if not args.benchmark_only and migrate(db, drop_old=args.drop_old):
+        report['after'] = run_benchmark(db)
+        logger.info(f"After: {json.dumps(report['after'])}")
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
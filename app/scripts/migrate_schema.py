@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+This script brings an existing database up to the current schema.
+database/init.sql only runs when the Postgres volume is created, so tables,
+columns, indexes and views added since then are created here. Every statement
+is idempotent; the scheduler runs it at startup.
+
+Usage:
+    python scripts/migrate_schema.py
+"""
+
+import os
+import sys
+import logging
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from utils.db import DatabaseConnection, get_database
+
+# Setup logowania
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Kilka kontenerów startujących naraz - migracja wykonywana przez jeden na raz
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('fintech.migrate_schema'))"
+
+# Zmiany schematu względem pierwszej wersji init.sql, w kolejności ich wprowadzania.
+# Definicje muszą być zgodne z database/init.sql.
+SCHEMA_SQL = """
+    -- Import raportów: pomijanie niezmienionych wierszy i plików
+    ALTER TABLE financials ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+
+    CREATE TABLE IF NOT EXISTS import_fingerprints (
+        source VARCHAR(255) PRIMARY KEY,
+        file_hash CHAR(64) NOT NULL,
+        imported_at TIMESTAMP DEFAULT NOW()
+    );
+
+    -- Historia i kolejka jobów
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id BIGSERIAL PRIMARY KEY,
+        job VARCHAR(50) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        trigger VARCHAR(20) NOT NULL DEFAULT 'schedule',
+        started_at TIMESTAMP DEFAULT NOW(),
+        finished_at TIMESTAMP,
+        duration_ms INT,
+        rows INT,
+        stage VARCHAR(50),
+        progress JSONB,
+        details JSONB,
+        error TEXT
+    );
+    ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS stage VARCHAR(50);
+    ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS progress JSONB;
+    CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs(job, started_at DESC);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_job_runs_active ON job_runs(job) WHERE status IN ('queued', 'running');
+
+    -- Znacznik zmian notowań (wskaźniki, historia wycen)
+    ALTER TABLE prices_daily ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+    CREATE INDEX IF NOT EXISTS idx_financials_period ON financials(rok, kwartal);
+    CREATE INDEX IF NOT EXISTS idx_financials_ticker_period ON financials(ticker, rok DESC, kwartal DESC);
+    -- Tabela partycjonowana dostaje własny indeks BRIN w scripts/migrate_prices_partitioned.py
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_indexes
+            WHERE tablename = 'prices_daily' AND indexdef LIKE '%USING brin (updated_at)%'
+        ) THEN
+            CREATE INDEX IF NOT EXISTS idx_prices_updated_brin ON prices_daily USING BRIN (updated_at);
+        END IF;
+    END $$;
+
+    -- TTM / YoY
+    CREATE OR REPLACE FUNCTION quarter_index(rok INT, kwartal VARCHAR)
+    RETURNS INT AS $fn$
+        SELECT rok * 4 + substring(kwartal FROM '[1-4]')::INT - 1
+    $fn$ LANGUAGE SQL IMMUTABLE;
+
+    CREATE TABLE IF NOT EXISTS financials_ttm (
+        ticker VARCHAR(10) NOT NULL,
+        rok INT NOT NULL,
+        kwartal VARCHAR(10) NOT NULL,
+        przychody_ttm NUMERIC,
+        ebitda_ttm NUMERIC,
+        zysk_netto_ttm NUMERIC,
+        przeplywy_operacyjne_ttm NUMERIC,
+        przeplywy_inwestycyjne_ttm NUMERIC,
+        przeplywy_finansowe_ttm NUMERIC,
+        capex_ttm NUMERIC,
+        free_cash_flow_ttm NUMERIC,
+        eps_ttm NUMERIC,
+        roe_ttm NUMERIC,
+        net_margin_ttm NUMERIC,
+        przychody_yoy NUMERIC,
+        ebitda_yoy NUMERIC,
+        zysk_netto_yoy NUMERIC,
+        przychody_qoq NUMERIC,
+        ebitda_qoq NUMERIC,
+        zysk_netto_qoq NUMERIC,
+        source_updated_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (ticker, rok, kwartal)
+    );
+
+    -- Wskaźniki techniczne
+    CREATE TABLE IF NOT EXISTS price_indicators (
+        ticker VARCHAR(10) NOT NULL REFERENCES companies(ticker) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        close NUMERIC,
+        sma_20 DOUBLE PRECISION,
+        sma_50 DOUBLE PRECISION,
+        sma_200 DOUBLE PRECISION,
+        ema_12 DOUBLE PRECISION,
+        ema_26 DOUBLE PRECISION,
+        rsi_14 DOUBLE PRECISION,
+        avg_gain_14 DOUBLE PRECISION,
+        avg_loss_14 DOUBLE PRECISION,
+        volatility_20 DOUBLE PRECISION,
+        running_max DOUBLE PRECISION,
+        drawdown DOUBLE PRECISION,
+        high_52w DOUBLE PRECISION,
+        low_52w DOUBLE PRECISION,
+        source_updated_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (ticker, date)
+    );
+    CREATE INDEX IF NOT EXISTS idx_price_indicators_source_updated ON price_indicators(source_updated_at);
+
+    -- Historia wycen
+    CREATE TABLE IF NOT EXISTS valuation_daily (
+        ticker VARCHAR(10) NOT NULL REFERENCES companies(ticker) ON DELETE CASCADE,
+        date DATE NOT NULL,
+        close NUMERIC,
+        rok INT,
+        kwartal VARCHAR(10),
+        market_cap DOUBLE PRECISION,
+        enterprise_value DOUBLE PRECISION,
+        pe_ttm DOUBLE PRECISION,
+        pb DOUBLE PRECISION,
+        ev_ebitda DOUBLE PRECISION,
+        earnings_yield DOUBLE PRECISION,
+        source_updated_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (ticker, date)
+    );
+    CREATE INDEX IF NOT EXISTS idx_valuation_daily_source_updated ON valuation_daily(source_updated_at);
+
+    CREATE TABLE IF NOT EXISTS refresh_watermarks (
+        name VARCHAR(50) PRIMARY KEY,
+        since TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+
+    -- Import hurtowy wyłącza trigger przez SET LOCAL fintech.skip_metrics_trigger = 'on'
+    CREATE OR REPLACE TRIGGER metrics_trigger
+    BEFORE INSERT OR UPDATE ON financials
+    FOR EACH ROW
+    WHEN (current_setting('fintech.skip_metrics_trigger', true) IS DISTINCT FROM 'on')
+    EXECUTE FUNCTION calculate_metrics_trigger_func();
+
+    -- Najnowsze notowanie i raport każdej spółki
+    CREATE MATERIALIZED VIEW IF NOT EXISTS latest_snapshot AS
+    SELECT
+        c.ticker, c.name, c.sector,
+        p.date AS price_date, p.open, p.high, p.low, p.close, p.volume,
+        f.waluta, f.data_publikacji, f.rok, f.kwartal,
+        f.przychody, f.koszty_sprzedanych_produktow, f.zysk_brutto_ze_sprzedazy, f.koszty_operacyjne,
+        f.ebitda, f.amortyzacja, f.ebit, f.przychody_finansowe, f.koszty_finansowe, f.zysk_brutto,
+        f.podatek_dochodowy, f.zysk_netto, f.zysk_netto_jednostki_dominujacej,
+        f.aktywa_obrotowe, f.srodki_pieniezne, f.naleznosci_krotkoterminowe, f.zapasy, f.pozostale_aktywa_obrotowe,
+        f.aktywa_trwale, f.rzeczowe_aktywa_trwale, f.wartosci_niematerialne, f.inwestycje_dlugoterminowe,
+        f.pozostale_aktywa_trwale, f.aktywa_razem,
+        f.zobowiazania_krotkoterminowe, f.dlug_krotkoterminowy, f.zobowiazania_handlowe, f.pozostale_zobowiazania_krotkoterminowe,
+        f.zobowiazania_dlugoterminowe, f.dlug_dlugoterminowy, f.pozostale_zobowiazania_dlugoterminowe,
+        f.kapital_wlasny, f.kapital_zakladowy, f.kapital_zapasowy, f.zyski_zatrzymane, f.pasywa_razem,
+        f.przeplywy_operacyjne, f.przeplywy_inwestycyjne, f.przeplywy_finansowe, f.zmiana_stanu_srodkow,
+        f.capex, f.free_cash_flow, f.liczba_akcji,
+        f.roe, f.roa, f.net_margin, f.debt_to_equity, f.current_ratio, f.eps, f.ebitda_margin,
+        CASE WHEN f.eps > 0 THEN p.close / f.eps END AS pe_ratio
+    FROM companies c
+    LEFT JOIN LATERAL (
+        SELECT date, open, high, low, close, volume FROM prices_daily
+        WHERE ticker = c.ticker
+        ORDER BY date DESC LIMIT 1
+    ) p ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT * FROM financials
+        WHERE ticker = c.ticker
+        ORDER BY rok DESC, kwartal DESC LIMIT 1
+    ) f ON TRUE
+    WITH DATA;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_latest_snapshot_ticker ON latest_snapshot(ticker);
+"""
+
+
+def migrate_schema(db: DatabaseConnection) -> bool:
+    """
+    Apply SCHEMA_SQL in one transaction; objects that already exist are left as they are.
+    Returns True on success, False on error.
+    """
+    try:
+        with db.get_raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LOCK_SQL)
+                cur.execute(SCHEMA_SQL)
+        logger.info("✅ Database schema is up to date")
+        return True
+    except Exception as e:
+        logger.error(f"Error migrating database schema: {e}")
+        return False
+
+
+def main():
+    if not migrate_schema(get_database()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+This script refreshes daily stock prices from Yahoo! Finance for many tickers concurrently.
+"""
+
+import os
+import sys
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import yfinance as yf
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from utils.db import get_database
+from utils.instrumentation import inc, observe
+
+# Setup logowania
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Konfiguracja silnika odświeżania
+MAX_WORKERS = int(os.getenv('PRICE_REFRESH_WORKERS', 8))
+MAX_RETRIES = int(os.getenv('PRICE_REFRESH_RETRIES', 3))
+BACKOFF_SECONDS = float(os.getenv('PRICE_REFRESH_BACKOFF_SECONDS', 1.0))
+LOOKBACK_DAYS = 5
+# Ile historii pobrać dla tickera, który nie ma jeszcze żadnych notowań (tryb przyrostowy)
+INITIAL_HISTORY_DAYS = int(os.getenv('PRICE_SYNC_INITIAL_DAYS', 365))
+# Godzina (czasu lokalnego kontenera), po której dzisiejsza sesja GPW jest zamknięta (notowania do 17:05)
+SESSION_CLOSE_HOUR = int(os.getenv('PRICE_SESSION_CLOSE_HOUR', 18))
+
+
+def fetch_ticker(ticker: str, start, end) -> pd.DataFrame:
+    """
+    Downloads daily bars for one ticker (empty frame if there are none in the range).
+    yf.download keeps its results in process-global state and is not safe to call
+    from several threads at once, so workers use the per-ticker history API.
+    """
+    data = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
+    if data is None or data.empty:
+        return pd.DataFrame()
+    data = data.dropna(subset=['Close'])
+    # Yahoo potrafi zwrócić wcześniejsze sesje niż żądany początek zakresu
+    return data[data.index.date >= pd.Timestamp(start).date()]
+
+
+def to_rows(ticker: str, data: pd.DataFrame) -> list:
+    """
+    Converts a yfinance frame to (ticker, date, open, high, low, close, volume) tuples.
+    Missing values become None (NULL), not NaN.
+    """
+    dates = data.index.strftime('%Y-%m-%d')
+    prices = data[['Open', 'High', 'Low', 'Close']].astype('float64')
+    prices = prices.astype(object).where(prices.notna(), None)
+    volume = data['Volume'].round().astype('Int64').astype(object).where(data['Volume'].notna(), None)
+    return [
+        (ticker, date, o, h, l, c, v)
+        for date, (o, h, l, c), v in zip(dates, prices.itertuples(index=False), volume)
+    ]
+
+
+def fetch_with_retry(ticker: str, start, end):
+    """
+    Fetches one ticker with exponential backoff.
+    Returns: (DataFrame or None, latency in seconds, error message or None)
+    """
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            data = fetch_ticker(ticker, start, end)
+            return data, time.perf_counter() - started, None
+        except Exception as e:
+            error = str(e)
+            if attempt < MAX_RETRIES:
+                delay = BACKOFF_SECONDS * 2 ** (attempt - 1)
+                logger.warning(f"{ticker}: attempt {attempt}/{MAX_RETRIES} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    return None, time.perf_counter() - started, error
+
+
+def run_price_refresh(tickers: list, start=None, end=None, latest_only: bool = True, progress=None):
+    """
+    Refreshes prices for many tickers over the same date range.
+    By default only the last bar of the range is written (5-day lookback).
+    """
+    end = end or datetime.now()
+    start = start or end - timedelta(days=LOOKBACK_DAYS)
+    return refresh_plan({ticker: start for ticker in tickers}, end, latest_only=latest_only, progress=progress)
+
+
+def last_trading_day(now=None):
+    """
+    Latest weekday whose session has closed: today only after SESSION_CLOSE_HOUR,
+    so an hourly run during the session never stores a partial intraday bar.
+    """
+    now = pd.Timestamp(now or datetime.now())
+    day = now.normalize()
+    if day.weekday() >= 5 or now.hour < SESSION_CLOSE_HOUR:
+        day -= pd.offsets.BDay(1)
+    return day.date()
+
+
+def plan_incremental_sync(marks: dict, today=None) -> dict:
+    """
+    Builds {ticker: first date to fetch} from per-ticker high-water marks.
+    The last stored bar is fetched again and overwritten by the upsert, which
+    heals a bar stored before its session closed (e.g. by the 'latest' mode).
+    Tickers whose last stored bar is already the last closed session are left out.
+    last_trading_day knows no holidays: a ticker without a newer bar (holiday,
+    suspension, delisting) stays in the plan and is dropped by refresh_plan.
+    """
+    target = last_trading_day(today)
+    plan = {}
+    for ticker, last_date in marks.items():
+        if last_date is None:
+            plan[ticker] = target - timedelta(days=INITIAL_HISTORY_DAYS)
+        elif last_date < target:
+            plan[ticker] = last_date
+    return plan
+
+
+def run_incremental_sync(today=None, progress=None):
+    """
+    Downloads only the missing date range per ticker and writes every missing bar.
+    High-water marks come from one grouped MAX(date) query; current tickers make
+    no network call. Returns the refresh summary (with a 'skipped' counter).
+    """
+    marks = get_database().get_price_high_water_marks()
+    if not marks:
+        logger.error("No tickers found! Make sure to import companies first.")
+        return None
+
+    plan = plan_incremental_sync(marks, today)
+    skipped = len(marks) - len(plan)
+    logger.info(f"Incremental sync: {len(plan)} tickers behind, {skipped} already current")
+
+    end = pd.Timestamp(last_trading_day(today)) + timedelta(days=1)
+    summary = refresh_plan(plan, end, latest_only=False, require_data=False, progress=progress, marks=marks)
+    summary['skipped'] = skipped + summary['no_new_bars']
+    return summary
+
+
+def refresh_plan(plan: dict, end, latest_only: bool = True, require_data: bool = True, progress=None, marks=None):
+    """
+    Refreshes prices for {ticker: start date}.
+
+    Every ticker is a separate task on a bounded worker pool, fetched with
+    retry and backoff. All bars are written with one bulk upsert over
+    a pooled connection. An empty download counts as a failure only when
+    require_data is set. With marks ({ticker: last stored date}) a ticker whose
+    download has no bar after its last stored date is dropped without a write.
+    progress(done, total, ticker) is called as each ticker completes.
+    Returns a summary dict with success/failure counts, per-ticker latency,
+    failure reasons and the tickers whose rows were inserted or changed.
+    """
+    items = list(plan.items())
+    logger.info(f"Refreshing {len(items)} tickers ({MAX_WORKERS} workers)")
+
+    started = time.perf_counter()
+    rows, latency, failures, no_new_bars = [], {}, {}, []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(fetch_with_retry, ticker, start, end): ticker for ticker, start in items}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            data, elapsed, error = future.result()
+            latency[ticker] = elapsed
+            if progress:
+                progress(len(latency), len(items), ticker)
+            if data is None:
+                failures[ticker] = error
+                continue
+            if data.empty:
+                if require_data:
+                    failures[ticker] = "no data returned"
+                continue
+            # Brak sesji po ostatnim zapisanym dniu (święto, zawieszenie) - nic do zapisania
+            if marks and marks.get(ticker) is not None and data.index.max().date() <= marks[ticker]:
+                no_new_bars.append(ticker)
+                continue
+            # W trybie latest_only zapisywany jest tylko ostatni notowany dzień
+            rows.extend(to_rows(ticker, data.tail(1) if latest_only else data))
+
+    changed = []
+    try:
+        db = get_database()
+        db.ensure_price_partitions()
+        changed = db.insert_prices(rows)
+        if changed:
+            db.refresh_latest_snapshot()
+    except Exception as e:
+        logger.error(f"Error writing prices: {e}")
+        failures.update({ticker: f"write failed: {e}" for ticker in latency if ticker not in failures})
+
+    summary = {
+        'tickers': len(items),
+        'success': len(items) - len(failures),
+        'failed': len(failures),
+        'rows_written': len(changed),
+        'no_new_bars': len(no_new_bars),
+        'duration_s': round(time.perf_counter() - started, 2),
+        'latency_s': {t: round(v, 3) for t, v in latency.items()},
+        'failures': failures,
+        'changed_tickers': sorted(set(changed)),
+    }
+    inc('price_refresh_tickers_total', summary['success'], result='success')
+    inc('price_refresh_tickers_total', summary['failed'], result='failed')
+    inc('price_refresh_rows_total', len(changed))
+    for elapsed in latency.values():
+        observe('price_fetch_duration_ms', elapsed * 1000)
+    log_summary(summary)
+    return summary
+
+
+def log_summary(summary: dict):
+    """Logs latency percentiles, the slowest tickers and all failures."""
+    latencies = pd.Series(summary['latency_s'], dtype='float64')
+    logger.info(
+        f"Price refresh completed in {summary['duration_s']}s: {summary['success']} success, "
+        f"{summary['failed']} errors, {summary['rows_written']} rows written"
+    )
+    if not latencies.empty:
+        logger.info(
+            f"Latency per ticker: p50={latencies.quantile(0.5):.2f}s p95={latencies.quantile(0.95):.2f}s "
+            f"max={latencies.max():.2f}s"
+        )
+        slowest = latencies.nlargest(5)
+        logger.info("Slowest tickers: " + ", ".join(f"{t} ({v:.2f}s)" for t, v in slowest.items()))
+    for ticker, error in summary['failures'].items():
+        logger.error(f"❌ {ticker}: {error}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        run_price_refresh(sys.argv[1:])
+    else:
+        run_incremental_sync()
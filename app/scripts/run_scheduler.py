@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+This script runs the data ingestion jobs (quarterly import, CSV price import,
+price refresh, technical indicators and valuation history) in the background on
+fixed intervals, so the app does not wait for them.
+It also runs jobs queued from the app ("Force Update"). At startup it brings
+the database schema up to date (scripts/migrate_schema.py).
+
+Usage:
+    python scripts/run_scheduler.py [--once]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from utils.db import DatabaseConnection, get_database
+from utils.indicators import refresh_indicators
+from utils.valuation import refresh_valuation
+from utils.jobs import run_job, get_queued_runs, fail_queued_run, scheduler_presence, result_rows
+from utils.snapshot import export_snapshot
+from utils.instrumentation import start_metrics_server
+from migrate_schema import migrate_schema
+from update_all_data import run_quarterly_import, update_all_prices
+from import_prices_from_csv import run_price_import
+
+# Setup logowania
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Interwały w minutach, 0 wyłącza job
+QUARTERLY_IMPORT_INTERVAL = int(os.getenv('QUARTERLY_IMPORT_INTERVAL_MINUTES', 24 * 60))
+PRICE_IMPORT_INTERVAL = int(os.getenv('PRICE_IMPORT_INTERVAL_MINUTES', 24 * 60))
+PRICE_REFRESH_INTERVAL = int(os.getenv('PRICE_REFRESH_INTERVAL_MINUTES', 60))
+INDICATORS_INTERVAL = int(os.getenv('INDICATORS_INTERVAL_MINUTES', 60))
+VALUATION_INTERVAL = int(os.getenv('VALUATION_INTERVAL_MINUTES', 60))
+# Co ile sekund sprawdzać harmonogram i kolejkę jobów z aplikacji
+POLL_SECONDS = 5
+# Endpoint /metrics procesu schedulera (0 = wyłączony)
+SCHEDULER_METRICS_PORT = int(os.getenv('SCHEDULER_METRICS_PORT', 0))
+
+# Kolejność ma znaczenie przy starcie: raporty, historia z CSV, dociąganie notowań,
+# potem wskaźniki i historia wycen (przyrostowo, tylko dla zmienionych notowań i raportów)
+JOBS = {
+    'quarterly_import': (lambda progress: run_quarterly_import(progress=progress), QUARTERLY_IMPORT_INTERVAL),
+    'price_import': (lambda progress: run_price_import(progress=progress), PRICE_IMPORT_INTERVAL),
+    'price_refresh': (lambda progress: update_all_prices(progress=progress), PRICE_REFRESH_INTERVAL),
+    'indicators': (lambda progress: refresh_indicators(get_database(), progress=progress), INDICATORS_INTERVAL),
+    'valuation': (lambda progress: refresh_valuation(get_database(), progress=progress), VALUATION_INTERVAL),
+}
+
+
+def full_update(progress):
+    """
+    All ingestion jobs one after another, as one job with a stage per job.
+    A failed stage doesn't stop the next ones; rows and changed tickers are
+    summed over the stages that succeeded and the failed ones are listed in
+    'failed_stages', which makes run_job mark the run failed.
+    """
+    results = {}
+    for name, (func, _) in JOBS.items():
+        progress.stage(name)
+        try:
+            results[name] = func(progress)
+        except Exception as e:
+            logger.error(f"Error in stage {name}: {e}")
+            results[name] = None
+    stages = [result for result in results.values() if result is not None]
+    results['failed_stages'] = [name for name, result in results.items() if result is None]
+    results['rows_written'] = sum(result_rows(r) for r in stages)
+    results['changed_tickers'] = sorted({t for r in stages for t in r.get('changed_tickers', [])})
+    return results
+
+
+# Joby, które aplikacja może zakolejkować -> (funkcja, dodatkowe blokady)
+# full_update trzyma też blokady jobów, które wykonuje, żeby harmonogram ich nie zdublował
+QUEUEABLE_JOBS = {
+    'full_update': (full_update, list(JOBS)),
+    **{name: (func, None) for name, (func, _) in JOBS.items()},
+}
+
+
+def wrote_rows(outcome) -> bool:
+    # Także run 'failed' z udanymi etapami (full_update) - zapisane dane trzeba wyeksportować
+    if not outcome or not outcome[1]:
+        return False
+    return bool(outcome[1].get('changed_tickers'))
+
+
+def run_due_jobs(db: DatabaseConnection, next_run: dict, now: float) -> bool:
+    """Run every job whose time has come. Returns True if any of them wrote rows"""
+    changed = False
+    for name, (func, interval) in JOBS.items():
+        if not interval or next_run[name] > now:
+            continue
+        next_run[name] = now + interval * 60
+        try:
+            changed |= wrote_rows(run_job(db, name, func))
+        except Exception as e:
+            logger.error(f"Error running job {name}: {e}")
+    return changed
+
+
+def run_queued_jobs(db: DatabaseConnection) -> bool:
+    """Run the jobs queued from the app. Returns True if any of them wrote rows"""
+    changed = False
+    for run_id, name in get_queued_runs(db):
+        if name not in QUEUEABLE_JOBS:
+            logger.error(f"Unknown job {name} queued (run {run_id}), marking it failed")
+            fail_queued_run(db, run_id, f"unknown job {name}")
+            continue
+        func, locks = QUEUEABLE_JOBS[name]
+        try:
+            # Zajęte blokady: run zostaje w kolejce do następnego sprawdzenia
+            changed |= wrote_rows(run_job(db, name, func, trigger='manual', run_id=run_id, locks=locks))
+        except Exception as e:
+            logger.error(f"Error running job {name}: {e}")
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--once', action='store_true', help="run every enabled job once and exit")
+    args = parser.parse_args()
+
+    db = get_database()
+    # init.sql działa tylko na nowym wolumenie - istniejąca baza dostaje brakujące tabele tutaj
+    if not migrate_schema(db):
+        sys.exit(1)
+    start_metrics_server(SCHEDULER_METRICS_PORT)
+    # Wszystkie joby startują od razu po uruchomieniu kontenera
+    next_run = {name: 0.0 for name in JOBS}
+    enabled = [f"{name} every {interval} min" for name, (_, interval) in JOBS.items() if interval]
+    logger.info(f"Scheduler started: {', '.join(enabled) or 'no jobs enabled'}")
+
+    with scheduler_presence(db):
+        while True:
+            changed = run_queued_jobs(db)
+            changed |= run_due_jobs(db, next_run, time.time())
+            if changed:
+                export_snapshot(db)
+            if args.once:
+                break
+            time.sleep(POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,10 @@ This script updates all financial data, including quarterly reports and daily st
 
 import os
 import sys
+import hashlib
+import argparse
 import logging
 import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import yfinance as yf
 
 # ==========================================
 # KONFIGURACJA ŚCIEŻEK
@@ -20,9 +17,15 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from utils.db import DatabaseConnection
+from utils.db import DatabaseConnection, get_database
 from utils.excel_import import ExcelImporter
+from utils.ttm import refresh_ttm
+from utils.indicators import refresh_indicators
+from utils.valuation import refresh_valuation
+from utils.snapshot import export_snapshot
+from utils.instrumentation import inc
 from import_prices_from_csv import run_price_import
+from refresh_prices import run_price_refresh, run_incremental_sync
 
 # Setup logowania
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,194 +33,250 @@ logger = logging.getLogger(__name__)
 
 # Ścieżka do pliku w kontenerze
 EXCEL_PATH = '/app/data/dane_finansowe.xlsx'
-DATABASE_URL = os.getenv('DATABASE_URL')
+# Arkusze do importu (po przecinku); domyślnie wszystkie arkusze z wymaganymi kolumnami
+EXCEL_SHEETS = [s.strip() for s in os.getenv('EXCEL_SHEETS', '').split(',') if s.strip()] or None
+EXCEL_CHUNK_SIZE = int(os.getenv('EXCEL_CHUNK_SIZE', ExcelImporter.CHUNK_SIZE))
+# 'incremental' dociąga brakujące notowania od ostatniej zapisanej daty, 'latest' pobiera ostatnie 5 dni
+PRICE_SYNC_MODE = os.getenv('PRICE_SYNC_MODE', 'incremental')
 
-def clean_val(val):
+# Kolumny tabeli financials zasilane z Excela (nazwy z Excela to te same nazwy, inna wielkość liter)
+FINANCIAL_COLUMNS = [
+    'ticker', 'waluta', 'data_publikacji', 'rok', 'kwartal', 'przychody', 'koszty_sprzedanych_produktow', 'zysk_brutto_ze_sprzedazy',
+    'koszty_operacyjne', 'ebitda', 'amortyzacja', 'ebit', 'przychody_finansowe', 'koszty_finansowe', 'zysk_brutto',
+    'podatek_dochodowy', 'zysk_netto', 'zysk_netto_jednostki_dominujacej', 'aktywa_obrotowe', 'srodki_pieniezne', 'naleznosci_krotkoterminowe',
+    'zapasy', 'pozostale_aktywa_obrotowe', 'aktywa_trwale', 'rzeczowe_aktywa_trwale', 'wartosci_niematerialne', 'inwestycje_dlugoterminowe',
+    'pozostale_aktywa_trwale', 'aktywa_razem', 'zobowiazania_krotkoterminowe', 'dlug_krotkoterminowy', 'zobowiazania_handlowe', 'pozostale_zobowiazania_krotkoterminowe',
+    'zobowiazania_dlugoterminowe', 'dlug_dlugoterminowy', 'pozostale_zobowiazania_dlugoterminowe', 'kapital_wlasny', 'kapital_zakladowy', 'kapital_zapasowy',
+    'zyski_zatrzymane', 'pasywa_razem', 'przeplywy_operacyjne', 'przeplywy_inwestycyjne', 'przeplywy_finansowe', 'zmiana_stanu_srodkow',
+    'capex', 'free_cash_flow', 'liczba_akcji'
+]
+TEXT_COLUMNS = ['ticker', 'waluta', 'kwartal']
+KEY_COLUMNS = ['ticker', 'rok', 'kwartal']
+NULL_TOKENS = ['nat', 'nan', '', 'none']
+
+# Te same wzory co w calculate_metrics_trigger_func - liczone raz dla całego zbioru,
+# trigger jest wyłączany na czas transakcji importu
+METRICS_SQL = {
+    'roe': "CASE WHEN kapital_wlasny != 0 THEN zysk_netto / kapital_wlasny * 100 ELSE NULL END",
+    'roa': "CASE WHEN aktywa_razem != 0 THEN zysk_netto / aktywa_razem * 100 ELSE NULL END",
+    'net_margin': "CASE WHEN przychody != 0 THEN zysk_netto / przychody * 100 ELSE NULL END",
+    'debt_to_equity': "CASE WHEN kapital_wlasny != 0 THEN (COALESCE(dlug_krotkoterminowy, 0) + COALESCE(dlug_dlugoterminowy, 0)) / kapital_wlasny ELSE NULL END",
+    'current_ratio': "CASE WHEN zobowiazania_krotkoterminowe != 0 THEN aktywa_obrotowe / zobowiazania_krotkoterminowe ELSE NULL END",
+    'eps': "CASE WHEN liczba_akcji != 0 THEN zysk_netto / liczba_akcji ELSE NULL END",
+    'ebitda_margin': "CASE WHEN przychody != 0 THEN ebitda / przychody * 100 ELSE NULL END",
+}
+
+STAGING_FINANCIALS_SQL = f"""
+    CREATE TEMP TABLE staging_financials ON COMMIT DROP AS
+    SELECT {', '.join(FINANCIAL_COLUMNS)} FROM financials WITH NO DATA;
+    ALTER TABLE staging_financials ADD COLUMN seq BIGSERIAL;
+"""
+
+_update_columns = [c for c in FINANCIAL_COLUMNS + list(METRICS_SQL) if c not in KEY_COLUMNS]
+# Wiersz jest zapisywany tylko gdy jest nowy albo zmienił się jego row_hash (korekta raportu);
+# RETURNING pomija wiersze, których WHERE w DO UPDATE nie przepuścił
+MERGE_FINANCIALS_SQL = f"""
+    WITH latest AS (
+        SELECT DISTINCT ON (ticker, rok, kwartal)
+            {', '.join(FINANCIAL_COLUMNS)},
+            {', '.join(f'{expr} AS {name}' for name, expr in METRICS_SQL.items())},
+            md5(ROW({', '.join(FINANCIAL_COLUMNS)})::text) AS row_hash
+        FROM staging_financials
+        ORDER BY ticker, rok, kwartal, seq DESC
+    ),
+    upserted AS (
+        INSERT INTO financials ({', '.join(FINANCIAL_COLUMNS + list(METRICS_SQL))}, row_hash)
+        SELECT * FROM latest
+        ON CONFLICT (ticker, rok, kwartal) DO UPDATE SET
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in _update_columns)},
+            row_hash = EXCLUDED.row_hash,
+            updated_at = NOW()
+        WHERE financials.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+        RETURNING ticker, (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+        ARRAY(SELECT DISTINCT ticker FROM upserted ORDER BY ticker) AS tickers,
+        (SELECT COUNT(*) FROM latest) AS staged
+    FROM upserted;
+"""
+
+FINGERPRINT_SQL = "SELECT file_hash FROM import_fingerprints WHERE source = %s"
+SAVE_FINGERPRINT_SQL = """
+    INSERT INTO import_fingerprints (source, file_hash) VALUES (%s, %s)
+    ON CONFLICT (source) DO UPDATE SET file_hash = EXCLUDED.file_hash, imported_at = NOW()
+"""
+
+
+def file_fingerprint(path: str, *extra) -> str:
+    """sha256 of the file content (read in 1 MB blocks) and of any extra import options"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    for value in extra:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def clean_frame(df: pd.DataFrame):
     """
-    Konwertuje specyficzne wartości Pandas/Numpy (NaN, NaT) oraz puste stringi na Pythonowe None,
-    które jest poprawnie rozumiane przez SQL jako NULL.
+    Konwertuje cały DataFrame z Excela do kolumn tabeli financials, kolumna po kolumnie:
+    puste stringi / 'nan' / 'NaT' stają się NULL, daty i liczby są rzutowane wektorowo,
+    brakujące pozycje liczbowe (poza kluczem) stają się 0 - niezależnie od podziału na partie.
+    Kolumny, których nie ma w arkuszu, zostają NULL.
+    Returns: (DataFrame z FINANCIAL_COLUMNS, liczba odrzuconych wierszy bez klucza)
     """
-    if val is None:
-        return None
-    if pd.isna(val):
-        return None
-    s_val = str(val).strip()
-    if s_val.lower() in ['nat', 'nan', '', 'none']:
-        return None
-    return val
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    present = set(df.columns)
+    df = df.reindex(columns=FINANCIAL_COLUMNS)
 
-def run_quarterly_import():
-    """Imports quarterly financial data from the Excel file."""
-    logger.info(f"Starting quarterly data import from: {EXCEL_PATH}")
-    
-    if not os.path.exists(EXCEL_PATH):
-        logger.error(f"❌ File not found: {EXCEL_PATH}. Check if 'data' folder is correctly mounted.")
-        return
+    for col in TEXT_COLUMNS:
+        values = df[col].astype('string').str.strip()
+        df[col] = values.mask(values.str.lower().isin(NULL_TOKENS))
 
-    df = None
-    try:
-        df, errors = ExcelImporter.load_excel(EXCEL_PATH)
-        if errors:
-            for error in errors:
-                logger.error(error)
-            return
-    except Exception as e:
-        logger.error(f"Critical error during file read: {e}")
-        return
+    df['data_publikacji'] = pd.to_datetime(df['data_publikacji'], errors='coerce').dt.strftime('%Y-%m-%d')
 
-    if df is None or df.empty:
-        logger.error("❌ DataFrame is empty. Aborting.")
-        return
+    numeric_cols = [c for c in FINANCIAL_COLUMNS if c not in TEXT_COLUMNS + ['data_publikacji']]
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+    value_cols = [c for c in numeric_cols if c not in KEY_COLUMNS and c in present]
+    df[value_cols] = df[value_cols].fillna(0)
+    # Kolumny całkowitoliczbowe muszą trafić do COPY bez części ułamkowej
+    for col in ['rok', 'liczba_akcji']:
+        df[col] = df[col].round().astype('Int64')
 
-    logger.info("Processing and saving to DB...")
-    try:
-        df_clean = ExcelImporter.prepare_for_db(df)
-    except Exception as e:
-        logger.error(f"Error preparing data (prepare_for_db): {e}")
-        return
+    valid = df[KEY_COLUMNS].notna().all(axis=1) & (df['ticker'].str.len() <= 10)
+    valid = valid.fillna(False).astype(bool)
+    return df[valid], int((~valid).sum())
+
+
+def run_quarterly_import(excel_path: str = EXCEL_PATH, sheets=EXCEL_SHEETS, chunk_size: int = EXCEL_CHUNK_SIZE,
+                         force: bool = False, progress=None):
+    """
+    Imports quarterly financial data from every data sheet of the Excel file.
+
+    A workbook whose sha256 matches the last successful import is skipped
+    entirely, unless force is set. Otherwise the workbook is streamed in
+    chunk_size batches; each batch is cleaned and COPYed into a temporary
+    staging table, so memory stays bounded regardless of the workbook size.
+    Everything is merged into financials with a single INSERT ... SELECT ...
+    ON CONFLICT, metrics computed in the same statement; rows whose row_hash
+    did not change are not rewritten. The TTM aggregates and latest_snapshot
+    are refreshed next, and only when both succeed is the fingerprint saved,
+    so a failed refresh is retried by the next run instead of being skipped
+    with the unchanged file. progress(rows staged, None, sheet) is called
+    after every batch.
+    Returns a dict with inserted/updated/skipped/rejected counters, the changed
+    tickers (and unchanged=True when the file was skipped), or None if the
+    import failed.
+    """
+    logger.info(f"Starting quarterly data import from: {excel_path}")
     
+    if not os.path.exists(excel_path):
+        logger.error(f"❌ File not found: {excel_path}. Check if 'data' folder is correctly mounted.")
+        return None
+
+    source = f"financials:{os.path.basename(excel_path)}"
+    staged = rejected = 0
     try:
-        db = DatabaseConnection()
-        success_count = 0
-        with db.get_connection() as conn:
+        file_hash = file_fingerprint(excel_path, sheets)
+        db = get_database()
+        with db.get_raw_connection() as conn:
             with conn.cursor() as cur:
-                for index, row in df_clean.iterrows():
-                    try:
-                        query = """
-                            INSERT INTO financials (
-                                ticker, waluta, data_publikacji, rok, kwartal, przychody, koszty_sprzedanych_produktow, zysk_brutto_ze_sprzedazy, 
-                                koszty_operacyjne, ebitda, amortyzacja, ebit, przychody_finansowe, koszty_finansowe, zysk_brutto, 
-                                podatek_dochodowy, zysk_netto, zysk_netto_jednostki_dominujacej, aktywa_obrotowe, srodki_pieniezne, naleznosci_krotkoterminowe, 
-                                zapasy, pozostale_aktywa_obrotowe, aktywa_trwale, rzeczowe_aktywa_trwale, wartosci_niematerialne, inwestycje_dlugoterminowe, 
-                                pozostale_aktywa_trwale, aktywa_razem, zobowiazania_krotkoterminowe, dlug_krotkoterminowy, zobowiazania_handlowe, pozostale_zobowiazania_krotkoterminowe, 
-                                zobowiazania_dlugoterminowe, dlug_dlugoterminowy, pozostale_zobowiazania_dlugoterminowe, kapital_wlasny, kapital_zakladowy, kapital_zapasowy, 
-                                zyski_zatrzymane, pasywa_razem, przeplywy_operacyjne, przeplywy_inwestycyjne, przeplywy_finansowe, zmiana_stanu_srodkow, 
-                                capex, free_cash_flow, liczba_akcji
-                            ) VALUES (
-                                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                            )
-                            ON CONFLICT (ticker, rok, kwartal) DO UPDATE SET 
-                                waluta = EXCLUDED.waluta, data_publikacji = EXCLUDED.data_publikacji, przychody = EXCLUDED.przychody, koszty_sprzedanych_produktow = EXCLUDED.koszty_sprzedanych_produktow,
-                                zysk_brutto_ze_sprzedazy = EXCLUDED.zysk_brutto_ze_sprzedazy, koszty_operacyjne = EXCLUDED.koszty_operacyjne, ebitda = EXCLUDED.ebitda, amortyzacja = EXCLUDED.amortyzacja,
-                                ebit = EXCLUDED.ebit, przychody_finansowe = EXCLUDED.przychody_finansowe, koszty_finansowe = EXCLUDED.koszty_finansowe, zysk_brutto = EXCLUDED.zysk_brutto,
-                                podatek_dochodowy = EXCLUDED.podatek_dochodowy, zysk_netto = EXCLUDED.zysk_netto, zysk_netto_jednostki_dominujacej = EXCLUDED.zysk_netto_jednostki_dominujacej,
-                                aktywa_obrotowe = EXCLUDED.aktywa_obrotowe, srodki_pieniezne = EXCLUDED.srodki_pieniezne, naleznosci_krotkoterminowe = EXCLUDED.naleznosci_krotkoterminowe,
-                                zapasy = EXCLUDED.zapasy, pozostale_aktywa_obrotowe = EXCLUDED.pozostale_aktywa_obrotowe, aktywa_trwale = EXCLUDED.aktywa_trwale,
-                                rzeczowe_aktywa_trwale = EXCLUDED.rzeczowe_aktywa_trwale, wartosci_niematerialne = EXCLUDED.wartosci_niematerialne, inwestycje_dlugoterminowe = EXCLUDED.inwestycje_dlugoterminowe,
-                                pozostale_aktywa_trwale = EXCLUDED.pozostale_aktywa_trwale, aktywa_razem = EXCLUDED.aktywa_razem, zobowiazania_krotkoterminowe = EXCLUDED.zobowiazania_krotkoterminowe,
-                                dlug_krotkoterminowy = EXCLUDED.dlug_krotkoterminowy, zobowiazania_handlowe = EXCLUDED.zobowiazania_handlowe, pozostale_zobowiazania_krotkoterminowe = EXCLUDED.pozostale_zobowiazania_krotkoterminowe,
-                                zobowiazania_dlugoterminowe = EXCLUDED.zobowiazania_dlugoterminowe, dlug_dlugoterminowy = EXCLUDED.dlug_dlugoterminowy, pozostale_zobowiazania_dlugoterminowe = EXCLUDED.pozostale_zobowiazania_dlugoterminowe,
-                                kapital_wlasny = EXCLUDED.kapital_wlasny, kapital_zakladowy = EXCLUDED.kapital_zakladowy, kapital_zapasowy = EXCLUDED.kapital_zapasowy,
-                                zyski_zatrzymane = EXCLUDED.zyski_zatrzymane, pasywa_razem = EXCLUDED.pasywa_razem, przeplywy_operacyjne = EXCLUDED.przeplywy_operacyjne,
-                                przeplywy_inwestycyjne = EXCLUDED.przeplywy_inwestycyjne, przeplywy_finansowe = EXCLUDED.przeplywy_finansowe, zmiana_stanu_srodkow = EXCLUDED.zmiana_stanu_srodkow,
-                                capex = EXCLUDED.capex, free_cash_flow = EXCLUDED.free_cash_flow, liczba_akcji = EXCLUDED.liczba_akcji,
-                                updated_at = NOW();
-                        """
-                        values = (
-                            clean_val(row.get('Ticker')), clean_val(row.get('Waluta')), clean_val(row.get('Data_publikacji')), clean_val(row.get('Rok')), clean_val(row.get('Kwartal')),
-                            clean_val(row.get('Przychody')), clean_val(row.get('Koszty_Sprzedanych_Produktow')), clean_val(row.get('Zysk_Brutto_Ze_Sprzedazy')),
-                            clean_val(row.get('Koszty_Operacyjne')), clean_val(row.get('EBITDA')), clean_val(row.get('Amortyzacja')), clean_val(row.get('EBIT')),
-                            clean_val(row.get('Przychody_Finansowe')), clean_val(row.get('Koszty_Finansowe')), clean_val(row.get('Zysk_Brutto')),
-                            clean_val(row.get('Podatek_Dochodowy')), clean_val(row.get('Zysk_Netto')), clean_val(row.get('Zysk_Netto_Jednostki_Dominujacej')),
-                            clean_val(row.get('Aktywa_Obrotowe')), clean_val(row.get('Srodki_Pieniezne')), clean_val(row.get('Naleznosci_Krotkoterminowe')),
-                            clean_val(row.get('Zapasy')), clean_val(row.get('Pozostale_Aktywa_Obrotowe')), clean_val(row.get('Aktywa_Trwale')),
-                            clean_val(row.get('Rzeczowe_Aktywa_Trwale')), clean_val(row.get('Wartosci_Niematerialne')), clean_val(row.get('Inwestycje_Dlugoterminowe')),
-                            clean_val(row.get('Pozostale_Aktywa_Trwale')), clean_val(row.get('Aktywa_Razem')), clean_val(row.get('Zobowiazania_Krotkoterminowe')),
-                            clean_val(row.get('Dlug_Krotkoterminowy')), clean_val(row.get('Zobowiazania_Handlowe')), clean_val(row.get('Pozostale_Zobowiazania_Krotkoterminowe')),
-                            clean_val(row.get('Zobowiazania_Dlugoterminowe')), clean__val(row.get('Dlug_Dlugoterminowy')), clean_val(row.get('Pozostale_Zobowiazania_Dlugoterminowe')),
-                            clean_val(row.get('Kapital_Wlasny')), clean_val(row.get('Kapital_Zakladowy')), clean_val(row.get('Kapital_Zapasowy')),
-                            clean_val(row.get('Zyski_Zatrzymane')), clean_val(row.get('Pasywa_Razem')), clean_val(row.get('Przeplywy_Operacyjne')),
-                            clean_val(row.get('Przeplywy_Inwestycyjne')), clean_val(row.get('Przeplywy_Finansowe')), clean_val(row.get('Zmiana_Stanu_Srodkow')),
-                            clean_val(row.get('Capex')), clean_val(row.get('Free_Cash_Flow')), clean_val(row.get('Liczba_Akcji'))
-                        )
-                        cur.execute(query, values)
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"Error importing row for {row.get('Ticker', 'UNKNOWN')} ({row.get('Rok')} {row.get('Kwartal')}): {e}")
-                        conn.rollback()
-                        continue
-                conn.commit()
-        logger.info(f"✅ Success! Updated/Added {success_count} financial reports.")
-    except Exception as e:
-        logger.error(f"General error with database connection or import: {e}")
+                cur.execute(FINGERPRINT_SQL, (source,))
+                previous = cur.fetchone()
+                if previous and previous[0] == file_hash and not force:
+                    logger.info(f"✅ {excel_path} unchanged since the last import, skipping")
+                    return {
+                        'inserted': 0, 'updated': 0, 'skipped': 0, 'rejected': 0,
+                        'changed_tickers': [], 'unchanged': True,
+                    }
 
+                cur.execute("SET LOCAL fintech.skip_metrics_trigger = 'on'")
+                cur.execute(STAGING_FINANCIALS_SQL)
 
-def get_db_connection():
-    """Establishes a database connection."""
-    if not DATABASE_URL:
-        logger.error("DATABASE_URL environment variable not set")
-        sys.exit(1)
-    try:
-        return psycopg2.connect(DATABASE_URL)
+                for sheet, batch in ExcelImporter.iter_excel_batches(excel_path, chunk_size, sheets):
+                    df_clean, batch_rejected = clean_frame(batch)
+                    DatabaseConnection.copy_dataframe(cur, df_clean, 'staging_financials', FINANCIAL_COLUMNS)
+                    staged += len(df_clean)
+                    rejected += batch_rejected
+                    logger.info(f"Staged {staged} rows (sheet {sheet})")
+                    if progress:
+                        progress(staged, None, sheet)
+
+                if not staged:
+                    logger.error("❌ No rows with Ticker/Rok/Kwartal found in the workbook. Aborting.")
+                    return None
+
+                cur.execute(MERGE_FINANCIALS_SQL)
+                inserted, updated, tickers, distinct = cur.fetchone()
+
+        if rejected:
+            logger.warning(f"Skipped {rejected} rows without Ticker/Rok/Kwartal")
+        stats = {
+            'inserted': inserted,
+            'updated': updated,
+            'skipped': distinct - inserted - updated,
+            'rejected': rejected,
+            'changed_tickers': tickers,
+            'unchanged': False,
+        }
+        for result in ('inserted', 'updated', 'skipped', 'rejected'):
+            inc('import_rows_total', stats[result], source='financials', result=result)
+
+        # Wywoływane także bez zmienionych wierszy: ponowienie po nieudanym odświeżeniu
+        # (oba są przyrostowe / tanie, a niezmieniony plik i tak jest pomijany wyżej)
+        if refresh_ttm(db) is None or not db.refresh_latest_snapshot():
+            logger.error("❌ Reports imported, but refreshing TTM or latest_snapshot failed; the workbook will be re-processed")
+            return None
+        with db.get_raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SAVE_FINGERPRINT_SQL, (source, file_hash))
+        logger.info(
+            f"✅ Success! {inserted} new and {updated} restated financial reports, "
+            f"{stats['skipped']} unchanged skipped ({rejected} rejected)."
+        )
+        return stats
     except Exception as e:
-        logger.error(f"Database connection failed: {e}")
-        raise
+        logger.error(f"General error with database connection or import: {e}")
+        return None
+
 
 def get_tickers():
     """Fetches all tickers from the database."""
-    try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT ticker FROM companies ORDER BY ticker")
-            tickers = [row['ticker'] for row in cur.fetchall()]
-        conn.close()
-        return tickers
-    except Exception as e:
-        logger.error(f"Error fetching tickers: {e}")
-        return []
+    companies = get_database().get_all_companies()
+    return [row['ticker'] for row in companies] if companies else []
 
 def update_price(ticker: str):
     """Updates the price for a single ticker."""
-    try:
-        logger.info(f"Updating price for {ticker}...")
-        data = yf.download(ticker, start=datetime.now() - timedelta(days=5), end=datetime.now(), progress=False, auto_adjust=True)
-        if data.empty:
-            logger.warning(f"No data found for {ticker}")
-            return False
-        
-        latest = data.iloc[-1]
-        date = data.index[-1].strftime('%Y-%m-%d')
-        
-        close_val = float(latest['Close'])
-        open_val = float(latest['Open'])
-        high_val = float(latest['High'])
-        low_val = float(latest['Low'])
-        vol_val = int(latest['Volume'])
-        
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO prices_daily (ticker, date, open, high, low, close, volume)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (ticker, date) DO UPDATE
-                SET open=EXCLUDED.open, high=EXCLUDED.high, low=EXCLUDED.low, close=EXCLUDED.close, volume=EXCLUDED.volume
-            """, (ticker, date, open_val, high_val, low_val, close_val, vol_val))
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"✅ Updated {ticker}: {close_val:.2f}")
-        return True
-    except Exception as e:
-        logger.error(f"Error updating {ticker}: {e}")
-        return False
+    summary = run_price_refresh([ticker])
+    return summary['success'] == 1 and summary['rows_written'] > 0
 
-def update_all_prices():
+def update_all_prices(progress=None):
     """Main job for updating all stock prices."""
-    logger.info("Starting price update job...")
+    logger.info(f"Starting price update job ({PRICE_SYNC_MODE} mode)...")
+    if PRICE_SYNC_MODE == 'incremental':
+        return run_incremental_sync(progress=progress)
+
     tickers = get_tickers()
     if not tickers:
         logger.error("No tickers found! Make sure to import companies first.")
-        return
+        return None
     
     logger.info(f"Found {len(tickers)} tickers to update")
-    success_count = sum(1 for ticker in tickers if update_price(ticker))
-    error_count = len(tickers) - success_count
-    
-    logger.info(f"Price update job completed: {success_count} success, {error_count} errors")
+    return run_price_refresh(tickers, progress=progress)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import quarterly reports and prices")
+    parser.add_argument('--force', action='store_true', help="re-import the workbook even if it is unchanged")
+    args = parser.parse_args()
+
     logger.info("--- Starting Full Data Update ---")
-    run_quarterly_import()
+    run_quarterly_import(force=args.force)
     run_price_import()
     update_all_prices()
+    refresh_indicators(get_database())
+    refresh_valuation(get_database())
+    export_snapshot(get_database())
     logger.info("--- Full Data Update Finished ---")
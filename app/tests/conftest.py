@@ -0,0 +1,27 @@
+"""
+Shared pytest setup: app/ on sys.path (like the scripts), optional Postgres DSN
+"""
+
+import os
+import sys
+
+import pytest
+
+# ==========================================
+# KONFIGURACJA ŚCIEŻEK
+# ==========================================
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+# Testy na bazie uruchamiane tylko z osobną bazą testową
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def database_url(monkeypatch):
+    """TEST_DATABASE_URL as DATABASE_URL; the test is skipped without it"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    monkeypatch.setenv('DATABASE_URL', TEST_DATABASE_URL)
+    return TEST_DATABASE_URL
@@ -0,0 +1,101 @@
+"""
+AsyncDatabaseConnection against a local Postgres: every async read returns what the sync one does.
+Needs TEST_DATABASE_URL pointing at a database initialized with database/init.sql.
+"""
+
+import asyncio
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+pytest.importorskip('asyncpg')
+
+from utils.db import DatabaseConnection
+from utils.async_db import AsyncDatabaseConnection
+from utils.cache import clear_all
+
+TICKER = 'TSTA.WA'
+
+SEED_SQL = [
+    text("INSERT INTO companies (ticker, name, currency) VALUES (:t, 'Test Async SA', 'PLN') ON CONFLICT DO NOTHING"),
+    text("""
+        INSERT INTO prices_daily (ticker, date, open, high, low, close, volume)
+        SELECT :t, d::date, 10 + i, 11 + i, 9 + i, 10.5 + i, 1000 * i
+        FROM generate_series(1, 5) AS i, LATERAL (SELECT DATE '2024-01-01' + i) AS g(d)
+        ON CONFLICT DO NOTHING
+    """),
+    text("""
+        INSERT INTO financials (ticker, waluta, data_publikacji, rok, kwartal, przychody, zysk_netto, ebitda,
+                                kapital_wlasny, aktywa_razem, liczba_akcji)
+        SELECT :t, 'PLN', DATE '2023-01-15' + 90 * q, 2023, 'Q' || q, 1000 * q, 100 * q, 150 * q, 5000, 9000, 1000
+        FROM generate_series(1, 4) AS q
+        ON CONFLICT DO NOTHING
+    """),
+]
+CLEANUP_SQL = [
+    text("DELETE FROM financials WHERE ticker = :t"),
+    text("DELETE FROM companies WHERE ticker = :t"),
+]
+
+
+@pytest.fixture
+def db(database_url):
+    db = DatabaseConnection()
+    with db.get_connection() as conn:
+        for statement in SEED_SQL:
+            conn.execute(statement, {'t': TICKER})
+    db.refresh_latest_snapshot()
+    clear_all()
+    yield db
+    with db.get_connection() as conn:
+        for statement in CLEANUP_SQL:
+            conn.execute(statement, {'t': TICKER})
+    db.refresh_latest_snapshot()
+    clear_all()
+    db.close()
+
+
+def run_async(calls):
+    """Await calls(adb) on one loop with a fresh AsyncDatabaseConnection"""
+    async def main():
+        adb = AsyncDatabaseConnection()
+        try:
+            return await calls(adb)
+        finally:
+            await adb.close()
+    return asyncio.run(main())
+
+
+def test_point_reads_match_sync(db):
+    async def calls(adb):
+        return (
+            await adb.get_all_companies(),
+            await adb.get_latest_price(TICKER),
+            await adb.get_latest_financials(TICKER),
+        )
+    companies, price, financials = run_async(calls)
+
+    assert [dict(row) for row in companies] == [dict(row) for row in db.get_all_companies()]
+    assert price == db.get_latest_price(TICKER)
+    assert price['close'] == 15.5
+    assert financials == db.get_latest_financials(TICKER)
+
+
+def test_frames_match_sync(db):
+    async def calls(adb):
+        return await adb.get_financials_history(TICKER, quarters=4), await adb.get_screener_snapshot()
+    history, snapshot = run_async(calls)
+
+    pd.testing.assert_frame_equal(history, db.get_financials_history(TICKER, quarters=4), check_dtype=False)
+    assert TICKER in set(snapshot['ticker'])
+    pd.testing.assert_frame_equal(snapshot, db.get_screener_snapshot(), check_dtype=False)
+
+
+def test_page_data_fans_out_the_same_reads(db):
+    page = run_async(lambda adb: adb.get_page_data(TICKER, quarters=4, with_screener=True))
+
+    assert set(page) == {'price', 'financials', 'history', 'screener'}
+    assert page['price'] == db.get_latest_price(TICKER)
+    assert page['financials'] == db.get_latest_financials(TICKER)
+    pd.testing.assert_frame_equal(page['history'], db.get_financials_history(TICKER, quarters=4), check_dtype=False)
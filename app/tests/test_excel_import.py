@@ -0,0 +1,47 @@
+"""
+Quarterly import cleaning: the result must not depend on how the workbook is split into batches
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from update_all_data import clean_frame, FINANCIAL_COLUMNS
+
+
+def workbook_rows():
+    rows = []
+    for i, ticker in enumerate(['AAA.WA', 'BBB.WA', 'CCC.WA', 'DDD.WA']):
+        row = dict.fromkeys(FINANCIAL_COLUMNS)
+        row.update({'ticker': ticker, 'waluta': 'PLN', 'rok': 2023, 'kwartal': 'Q1', 'przychody': 100.0 + i})
+        # Pozycja pusta w pierwszej połowie skoroszytu, wypełniona w drugiej
+        row['zapasy'] = None if i < 2 else 5.0
+        rows.append([row[c] for c in FINANCIAL_COLUMNS])
+    # Wiersz bez roku - odrzucany, klucz nie jest uzupełniany zerem
+    rows.append(['EEE.WA', 'PLN', None, None, 'Q1'] + [None] * (len(FINANCIAL_COLUMNS) - 5))
+    return rows
+
+
+def test_clean_frame_is_independent_of_batch_size():
+    rows = workbook_rows()
+    whole, rejected = clean_frame(pd.DataFrame.from_records(rows, columns=FINANCIAL_COLUMNS))
+    batches = [clean_frame(pd.DataFrame.from_records(rows[i:i + 2], columns=FINANCIAL_COLUMNS)) for i in range(0, len(rows), 2)]
+
+    assert rejected == sum(r for _, r in batches) == 1
+    pd.testing.assert_frame_equal(
+        pd.concat([frame for frame, _ in batches], ignore_index=True), whole.reset_index(drop=True)
+    )
+    assert whole['zapasy'].tolist() == [0, 0, 5, 5]
+
+
+def test_columns_missing_from_the_sheet_stay_null():
+    columns = [c for c in FINANCIAL_COLUMNS if c != 'zapasy']
+    sheet = pd.DataFrame.from_records(workbook_rows(), columns=FINANCIAL_COLUMNS)[columns]
+    frame, _ = clean_frame(sheet)
+
+    assert frame['zapasy'].isna().all()
+    assert frame['przychody'].tolist() == [100, 101, 102, 103]
+    assert frame['ebitda'].tolist() == [0, 0, 0, 0]
@@ -0,0 +1,116 @@
+"""
+utils.indicators: incremental runs (state carried forward) must match full recomputes
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.indicators import (
+    compute_indicators, _usable_states, STATE_COLUMNS, WARMUP_BARS, INDICATOR_COLUMNS, RSI_PERIOD,
+)
+
+# ticker -> liczba notowań (ostatni krótszy niż najdłuższe okno i EMA26 - "młoda" spółka)
+TICKERS = {'AAA.WA': 700, 'BBB.WA': 400, 'CCC.WA': 20}
+
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(7)
+    frames = []
+    for ticker, n in TICKERS.items():
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        frames.append(pd.DataFrame({
+            'ticker': ticker,
+            'date': pd.bdate_range('2020-01-01', periods=n),
+            'high': close * 1.01,
+            'low': close * 0.99,
+            'close': close,
+            'updated_at': pd.Timestamp('2024-01-01'),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def changed_frame(rows: list) -> pd.DataFrame:
+    """Rows shaped like CHANGED_SQL's result"""
+    columns = ['ticker', 'from_date', 'prev_date', 'state_date'] + STATE_COLUMNS
+    frame = pd.DataFrame(rows, columns=columns)
+    for col in ('from_date', 'prev_date', 'state_date'):
+        frame[col] = pd.to_datetime(frame[col])
+    frame[STATE_COLUMNS] = frame[STATE_COLUMNS].astype('float64')
+    return frame
+
+
+def full_run(prices: pd.DataFrame) -> pd.DataFrame:
+    changed = changed_frame([[t, None, None, None] + [None] * len(STATE_COLUMNS) for t in TICKERS])
+    return compute_indicators(prices, _usable_states(changed))
+
+
+def incremental_run(prices: pd.DataFrame, stored: pd.DataFrame, new_from: dict) -> pd.DataFrame:
+    """
+    Recompute from new_from[ticker] (bar index) the way refresh_indicators
+    does: state of the bar before it, WARMUP_BARS earlier bars (LOAD_SQL)
+    """
+    stored = stored.set_index(['ticker', 'date'])
+    rows, parts = [], []
+    for ticker, k in new_from.items():
+        bars = prices[prices['ticker'] == ticker].reset_index(drop=True)
+        from_date, prev_date = bars['date'][k], bars['date'][k - 1]
+        state = stored.loc[(ticker, prev_date)]
+        rows.append([ticker, from_date, prev_date, prev_date] + [state[c] for c in STATE_COLUMNS])
+        states = _usable_states(changed_frame(rows[-1:]))
+        # Bez używalnego stanu LOAD_SQL czyta całą historię
+        start = max(k - WARMUP_BARS, 0) if pd.notna(states['from_date'].iloc[0]) else 0
+        parts.append(bars.iloc[start:])
+    return compute_indicators(pd.concat(parts, ignore_index=True), _usable_states(changed_frame(rows)))
+
+
+def test_full_run_covers_every_bar(prices):
+    result = full_run(prices)
+    assert len(result) == len(prices)
+    assert set(result.columns) == set(INDICATOR_COLUMNS)
+
+
+def test_incremental_matches_full(prices):
+    full = full_run(prices)
+    # Historia "do wczoraj" zapisana w bazie, potem dochodzą nowe notowania
+    new_from = {'AAA.WA': 650, 'BBB.WA': 399, 'CCC.WA': 15}
+    stored = pd.concat([
+        full_run(prices[prices['ticker'] == t].reset_index(drop=True).iloc[:k]).reset_index(drop=True)
+        for t, k in new_from.items()
+    ], ignore_index=True)
+    result = incremental_run(prices, stored, new_from)
+
+    for ticker, k in new_from.items():
+        got = result[result['ticker'] == ticker].set_index('date')
+        expected = full[full['ticker'] == ticker].set_index('date')
+        if ticker == 'CCC.WA':
+            # Niepełny stan (EMA26 jeszcze w rozgrzewce) - cała historia liczona od nowa
+            assert len(got) == TICKERS[ticker]
+        else:
+            assert len(got) == TICKERS[ticker] - k
+        pd.testing.assert_frame_equal(got, expected.loc[got.index], check_exact=False, rtol=1e-9)
+
+
+def test_rsi_matches_wilder_reference(prices):
+    result = full_run(prices)
+    close = prices.loc[prices['ticker'] == 'AAA.WA', 'close'].to_numpy()
+    delta = np.diff(close)
+    gains, losses = delta.clip(min=0), (-delta).clip(min=0)
+    avg_gain, avg_loss = gains[:RSI_PERIOD].mean(), losses[:RSI_PERIOD].mean()
+    expected = [100 - 100 / (1 + avg_gain / avg_loss)]
+    for gain, loss in zip(gains[RSI_PERIOD:], losses[RSI_PERIOD:]):
+        avg_gain = (avg_gain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+        avg_loss = (avg_loss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+        expected.append(100 - 100 / (1 + avg_gain / avg_loss))
+
+    rsi = result.loc[result['ticker'] == 'AAA.WA', f'rsi_{RSI_PERIOD}'].to_numpy()
+    assert np.isnan(rsi[:RSI_PERIOD]).all()
+    np.testing.assert_allclose(rsi[RSI_PERIOD:], expected)
+
+
+def test_drawdown_is_measured_from_running_max(prices):
+    full = full_run(prices)
+    aaa = full[full['ticker'] == 'AAA.WA']
+    assert (aaa['drawdown'] <= 0).all()
+    assert aaa['running_max'].is_monotonic_increasing
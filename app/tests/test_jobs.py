@@ -0,0 +1,53 @@
+"""
+utils.jobs queue against a local Postgres: runs are only queued while a scheduler is alive.
+Needs TEST_DATABASE_URL pointing at a database initialized with database/init.sql.
+"""
+
+import pytest
+from sqlalchemy import text
+
+from utils.db import DatabaseConnection
+from utils.jobs import enqueue_job, get_run, run_job, scheduler_presence
+
+JOB = 'test_job'
+
+
+@pytest.fixture
+def db(database_url):
+    db = DatabaseConnection()
+    yield db
+    with db.get_connection() as conn:
+        conn.execute(text("DELETE FROM job_runs WHERE job = :job"), {'job': JOB})
+    db.close()
+
+
+def test_enqueue_attaches_to_the_active_run(db):
+    with scheduler_presence(db):
+        run_id, created = enqueue_job(db, JOB)
+        assert created
+        assert enqueue_job(db, JOB) == (run_id, False)
+    assert get_run(db, run_id)['status'] == 'queued'
+
+
+def test_queued_runs_fail_without_scheduler(db):
+    with scheduler_presence(db):
+        run_id, _ = enqueue_job(db, JOB)
+
+    assert enqueue_job(db, JOB) is None
+    run = get_run(db, run_id)
+    assert run['status'] == 'failed'
+    assert run['error'] == 'scheduler not running'
+
+
+def test_partial_failure_keeps_changed_tickers(db):
+    result = {'failed_stages': ['valuation'], 'rows_written': 3, 'changed_tickers': ['TST.WA']}
+    status, _ = run_job(db, JOB, lambda progress: result)
+    assert status == 'failed'
+
+    with db.get_connection() as conn:
+        run = conn.execute(
+            text("SELECT error, rows, details FROM job_runs WHERE job = :job"), {'job': JOB}
+        ).mappings().one()
+    assert run['error'] == 'stages failed: valuation'
+    assert run['rows'] == 3
+    assert run['details']['changed_tickers'] == ['TST.WA']
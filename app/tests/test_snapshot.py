@@ -0,0 +1,79 @@
+"""
+utils.snapshot against a local Postgres: column types come from the query, not from the first chunk,
+and readers only see complete exports through the manifest.
+Needs TEST_DATABASE_URL pointing at a database initialized with database/init.sql.
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from utils import snapshot
+from utils.db import DatabaseConnection
+
+# Kolumny puste w całej pierwszej porcji (EXPORT_CHUNK_SIZE = 2), wypełnione w kolejnych
+LATE_VALUES_SQL = """
+    SELECT i,
+           CASE WHEN i > 2 THEN i * 1.5 END AS amount,
+           CASE WHEN i > 2 THEN 'Q' || i END AS label,
+           CASE WHEN i > 2 THEN DATE '2024-01-01' + i END AS day
+    FROM generate_series(1, 5) AS i
+    ORDER BY i
+"""
+
+
+# Ta sama tabela bez wierszy
+NO_VALUES_SQL = "SELECT i FROM generate_series(1, 5) AS i WHERE false"
+
+
+@pytest.fixture
+def db(database_url, monkeypatch):
+    monkeypatch.setattr(snapshot, 'EXPORT_CHUNK_SIZE', 2)
+    monkeypatch.setitem(snapshot.SNAPSHOT_TABLES, 'late_values', (LATE_VALUES_SQL, None))
+    db = DatabaseConnection()
+    yield db
+    db.close()
+
+
+def test_all_null_first_chunk_keeps_column_types(db, tmp_path):
+    manifest = snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+    assert manifest['tables']['late_values']['rows'] == 5
+
+    table = pq.read_table(tmp_path / manifest['tables']['late_values']['path'])
+    assert table.schema.field('i').type == pa.int32()
+    assert table.schema.field('amount').type == pa.float64()
+    assert table.schema.field('label').type == pa.string()
+    assert table.schema.field('day').type == pa.date32()
+    assert table.column('label').to_pylist() == [None, None, 'Q3', 'Q4', 'Q5']
+
+
+def test_read_is_cached_until_the_next_export(db, tmp_path):
+    snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+    first = snapshot.read_or_fallback('late_values', lambda: None, root=str(tmp_path))
+    assert first is not None
+    assert snapshot.read_or_fallback('late_values', lambda: None, root=str(tmp_path)) is first
+
+    snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+    reread = snapshot.read_or_fallback('late_values', lambda: None, root=str(tmp_path))
+    assert reread is not first
+    assert reread.equals(first)
+
+
+def test_only_the_current_and_previous_exports_are_kept(db, tmp_path):
+    exports = [snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values']) for _ in range(3)]
+    paths = [manifest['tables']['late_values']['path'] for manifest in exports]
+
+    assert len(set(paths)) == 3
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == sorted(paths[1:])
+
+
+def test_table_without_rows_falls_back_and_old_export_is_removed(db, tmp_path, monkeypatch):
+    snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+    monkeypatch.setitem(snapshot.SNAPSHOT_TABLES, 'late_values', (NO_VALUES_SQL, None))
+    snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+    manifest = snapshot.export_snapshot(db, root=str(tmp_path), tables=['late_values'])
+
+    assert manifest['tables']['late_values']['rows'] == 0
+    assert 'path' not in manifest['tables']['late_values']
+    assert not [p for p in tmp_path.iterdir() if p.is_dir()]
+    assert snapshot.read_or_fallback('late_values', lambda: 'database', root=str(tmp_path)) == 'database'
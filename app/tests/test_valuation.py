@@ -0,0 +1,62 @@
+"""
+utils.valuation against a local Postgres: the watermark moves past tickers that yield no rows.
+Needs TEST_DATABASE_URL pointing at a database initialized with database/init.sql.
+"""
+
+import pytest
+from sqlalchemy import text
+
+from utils.db import DatabaseConnection
+from utils.valuation import refresh_valuation
+
+TICKER = 'TSTV.WA'
+
+SEED_SQL = [
+    text("INSERT INTO companies (ticker, name, currency) VALUES (:t, 'Test Valuation SA', 'PLN') ON CONFLICT DO NOTHING"),
+    text("""
+        INSERT INTO financials (ticker, waluta, data_publikacji, rok, kwartal, zysk_netto, kapital_wlasny, liczba_akcji)
+        VALUES (:t, 'PLN', DATE '2024-02-15', 2023, 'Q4', 100, 5000, 1000)
+        ON CONFLICT DO NOTHING
+    """),
+]
+PRICES_SQL = text("""
+    INSERT INTO prices_daily (ticker, date, close)
+    SELECT :t, DATE '2024-03-01' + i, 20 + i FROM generate_series(0, 4) AS i
+""")
+CLEANUP_SQL = [
+    text("DELETE FROM financials WHERE ticker = :t"),
+    # prices_daily, valuation_daily: ON DELETE CASCADE
+    text("DELETE FROM companies WHERE ticker = :t"),
+]
+
+
+@pytest.fixture
+def db(database_url):
+    db = DatabaseConnection()
+    # Stan startowy: wszystko, co już jest w bazie, przeliczone
+    assert refresh_valuation(db) is not None
+    with db.get_connection() as conn:
+        for statement in SEED_SQL:
+            conn.execute(statement, {'t': TICKER})
+    yield db
+    with db.get_connection() as conn:
+        for statement in CLEANUP_SQL:
+            conn.execute(statement, {'t': TICKER})
+    db.close()
+
+
+def test_ticker_without_rows_is_not_reprocessed(db):
+    # Raport bez notowań: brak wierszy, ale znacznik przesuwa się za tę zmianę
+    first = refresh_valuation(db)
+    assert first['rows_written'] == 0
+    assert TICKER not in first['changed_tickers']
+    assert refresh_valuation(db) == {'rows_written': 0, 'changed_tickers': []}
+
+
+def test_changed_tickers_lists_only_written_tickers(db):
+    refresh_valuation(db)
+    with db.get_connection() as conn:
+        conn.execute(PRICES_SQL, {'t': TICKER})
+
+    result = refresh_valuation(db)
+    assert result == {'rows_written': 5, 'changed_tickers': [TICKER]}
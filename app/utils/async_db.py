@@ -0,0 +1,130 @@
+"""
+Asynchronous database operations and queries
+"""
+
+import os
+import asyncio
+import logging
+
+import pandas as pd
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from utils.db import (
+    COMPANIES_SQL, LATEST_PRICE_SQL, LATEST_PRICE_FALLBACK_SQL, LATEST_FINANCIALS_SQL,
+    LATEST_FINANCIALS_FALLBACK_SQL, SCREENER_SQL, DB_POOL_SIZE, DB_MAX_OVERFLOW, financials_history_sql, _as_floats,
+)
+from utils.instrumentation import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def async_database_url(url: str) -> str:
+    """postgresql://... -> postgresql+asyncpg://..."""
+    scheme, _, rest = url.partition('://')
+    return f"postgresql+asyncpg://{rest}" if scheme.split('+')[0] in ('postgresql', 'postgres') else url
+
+
+def _frame(result) -> pd.DataFrame:
+    """Result rows as a DataFrame with NUMERIC (Decimal) columns as float64 (columns kept when empty)"""
+    return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+
+class AsyncDatabaseConnection:
+    """
+    asyncio counterpart of DatabaseConnection's read methods.
+    Each call checks out its own pooled connection, so independent queries
+    awaited together (see get_page_data) run concurrently.
+
+    For asyncio callers (services, the benchmark suite). The Streamlit app
+    stays on DatabaseConnection: the script runs synchronously, and its
+    ticker page already comes back in one round-trip (get_ticker_page_data),
+    so an event loop per rerun would add latency, not remove it.
+    Pool limits follow DB_POOL_SIZE / DB_MAX_OVERFLOW like the sync engine.
+    """
+
+    def __init__(self, database_url: str = None, pool_size: int = None, max_overflow: int = None):
+        database_url = database_url or os.getenv('DATABASE_URL')
+        if not database_url:
+            raise ValueError("DATABASE_URL not set")
+
+        try:
+            self.engine = create_async_engine(
+                async_database_url(database_url),
+                pool_size=DB_POOL_SIZE if pool_size is None else pool_size,
+                max_overflow=DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+            )
+            instrument_engine(self.engine.sync_engine)
+        except Exception as e:
+            logger.error(f"Failed to create async SQLAlchemy engine: {e}")
+            raise e
+
+    async def _fetch_one(self, query, params, fallback=None):
+        async with self.engine.connect() as conn:
+            result = (await conn.execute(query, params)).mappings().fetchone()
+            if result is None and fallback is not None:
+                result = (await conn.execute(fallback, params)).mappings().fetchone()
+            return _as_floats(result) if result else None
+
+    async def get_all_companies(self):
+        """Get all companies from database"""
+        try:
+            async with self.engine.connect() as conn:
+                return (await conn.execute(COMPANIES_SQL)).mappings().all()
+        except Exception as e:
+            logger.error(f"Error fetching companies: {e}")
+            return None
+
+    async def get_latest_price(self, ticker):
+        """Get latest price for ticker"""
+        try:
+            return await self._fetch_one(LATEST_PRICE_SQL, {'ticker': ticker}, LATEST_PRICE_FALLBACK_SQL)
+        except Exception as e:
+            logger.error(f"Error fetching price for {ticker}: {e}")
+            return None
+
+    async def get_latest_financials(self, ticker):
+        """Get latest financial report for ticker"""
+        try:
+            return await self._fetch_one(LATEST_FINANCIALS_SQL, {'ticker': ticker}, LATEST_FINANCIALS_FALLBACK_SQL)
+        except Exception as e:
+            logger.error(f"Error fetching financials for {ticker}: {e}")
+            return None
+
+    async def get_financials_history(self, ticker, quarters=16, columns=None):
+        """Get the last N quarters of financial history for ticker as DataFrame"""
+        try:
+            query = financials_history_sql(columns)
+            async with self.engine.connect() as conn:
+                df = _frame(await conn.execute(query, {'ticker': ticker, 'quarters': quarters}))
+            return df if not df.empty else None
+        except Exception as e:
+            logger.error(f"Error fetching financials history: {e}")
+            return None
+
+    async def get_screener_snapshot(self):
+        """Latest price, latest report and its metrics for every company as one DataFrame"""
+        try:
+            async with self.engine.connect() as conn:
+                return _frame(await conn.execute(SCREENER_SQL))
+        except Exception as e:
+            logger.error(f"Error fetching screener snapshot: {e}")
+            return None
+
+    async def get_page_data(self, ticker, quarters=20, with_screener: bool = False) -> dict:
+        """
+        Run the ticker page queries concurrently; latency is that of the
+        slowest one instead of the sum.
+        """
+        queries = {
+            'price': self.get_latest_price(ticker),
+            'financials': self.get_latest_financials(ticker),
+            'history': self.get_financials_history(ticker, quarters),
+        }
+        if with_screener:
+            queries['screener'] = self.get_screener_snapshot()
+        results = await asyncio.gather(*queries.values())
+        return dict(zip(queries, results))
+
+    async def close(self):
+        """Dispose the engine."""
+        await self.engine.dispose()
@@ -2,18 +2,182 @@
 Caching utilities
 """
 
-from functools import lru_cache
+from collections import OrderedDict
+from functools import wraps
+import threading
+import time
+import weakref
 import logging
 
 logger = logging.getLogger(__name__)
 
-def cached_query(maxsize: int = 128, ttl_seconds: int = 3600):
+_MISSING = object()
+
+# Wszystkie cache utworzone przez cached_query - dla globalnej inwalidacji po tagu
+_registry = weakref.WeakSet()
+
+
+def ticker_tag(ticker: str) -> str:
+    """Tag used for entries that hold data of a single ticker"""
+    return f"ticker:{ticker}"
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and tag-based invalidation.
+    Streamlit runs scripts in several threads, so every operation takes the lock.
     """
-    Decorator for caching query results. 
-    Note: TTL is not natively supported by lru_cache, 
+
+    def __init__(self, maxsize: int = 128, ttl_seconds: float = 3600, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Return a live entry and mark it as recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags=()):
+        """Store an entry, evicting the least recently used ones above maxsize"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            tags = frozenset(tags)
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *tags) -> int:
+        """Drop every entry carrying any of the tags. Returns the number of removed entries"""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self) -> dict:
+        """Counters and current size"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def _freeze(value):
+    """Hashable form of list/set/dict arguments (e.g. a column list)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _make_key(args, kwargs):
+    key = tuple(_freeze(arg) for arg in args)
+    return key + tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())) if kwargs else key
+
+
+def cached_query(maxsize: int = 128, ttl_seconds: int = 3600, tags=None, method: bool = False):
+    """
+    Decorator for caching query results with a TTL, a bounded LRU size and tags.
     Streamlit has its own st.cache_data for UI, this is for pure python logic.
+
+    Args:
+        tags: callable receiving the call arguments and returning the entry's tags
+              (e.g. ticker_tag(ticker)), used by invalidate()
+        method: leave the first argument (self) out of the key, so all instances
+                share one cache
+    None results are not cached.
     """
     def decorator(func):
-        cached_func = lru_cache(maxsize=maxsize)(func)
-        return cached_func
-    return decorator
\ No newline at end of file
+        cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds, name=func.__qualname__)
+        _registry.add(cache)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _make_key(args[1:] if method else args, kwargs)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            value = func(*args, **kwargs)
+            if value is not None:
+                cache.set(key, value, tags(*args, **kwargs) if tags else ())
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_info = cache.stats
+        wrapper.invalidate = cache.invalidate
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags) -> int:
+    """Drop entries with any of the tags from every cached_query cache"""
+    removed = sum(cache.invalidate(*tags) for cache in list(_registry))
+    if removed:
+        logger.debug(f"Invalidated {removed} cache entries for {tags}")
+    return removed
+
+
+def clear_all():
+    """Drop all entries from every cached_query cache"""
+    for cache in list(_registry):
+        cache.clear()
+
+
+def cache_stats() -> list:
+    """Stats of every cached_query cache"""
+    return [cache.stats() for cache in list(_registry)]
@@ -3,124 +3,646 @@ Database operations and queries
 """
 
 import os
+import io
+import time
+import threading
 import pandas as pd
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import logging
 from datetime import datetime
+from decimal import Decimal
 from contextlib import contextmanager
+from functools import lru_cache
+
+from utils.cache import cached_query, invalidate, ticker_tag
+from utils.downsample import downsample_frame
+from utils.instrumentation import TimedCursor, instrument_engine, inc, observe, register_gauges
 
 logger = logging.getLogger(__name__)
 
+# Czas życia wyników zapytań odczytowych (współdzielone między sesjami Streamlit)
+CACHE_TTL_SECONDS = int(os.getenv('DB_CACHE_TTL_SECONDS', 300))
+
+# Limity puli połączeń - jedna pula na proces (get_database), więc to jest limit procesu
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+# Ile sekund czekać na wolne połączenie z puli
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+# Ile sekund żądanie może czekać w kolejce do bazy, zanim zostanie odrzucone (DatabaseBusyError)
+DB_QUEUE_TIMEOUT = float(os.getenv('DB_QUEUE_TIMEOUT', 5))
+
+# ============================================================
+# SQL - współdzielone przez DatabaseConnection i AsyncDatabaseConnection
+# ============================================================
+
+COMPANIES_SQL = text("SELECT ticker, name, currency FROM companies ORDER BY ticker")
+
+LATEST_PRICE_SQL = text("""
+    SELECT price_date AS date, open, high, low, close, volume
+    FROM latest_snapshot
+    WHERE ticker = :ticker AND price_date IS NOT NULL
+""")
+LATEST_PRICE_FALLBACK_SQL = text("SELECT date, open, high, low, close, volume FROM prices_daily WHERE ticker = :ticker ORDER BY date DESC LIMIT 1")
+
+LATEST_FINANCIALS_SQL = text("SELECT * FROM latest_snapshot WHERE ticker = :ticker AND rok IS NOT NULL")
+LATEST_FINANCIALS_FALLBACK_SQL = text("SELECT * FROM financials WHERE ticker = :ticker ORDER BY rok DESC, kwartal DESC LIMIT 1")
+
+# Liczbowe kolumny financials dostępne w historii (whitelist - nazwy trafiają do SQL)
+HISTORY_COLUMNS = [
+    'przychody', 'koszty_sprzedanych_produktow', 'zysk_brutto_ze_sprzedazy', 'koszty_operacyjne', 'ebitda',
+    'amortyzacja', 'ebit', 'przychody_finansowe', 'koszty_finansowe', 'zysk_brutto', 'podatek_dochodowy',
+    'zysk_netto', 'zysk_netto_jednostki_dominujacej', 'aktywa_obrotowe', 'srodki_pieniezne',
+    'naleznosci_krotkoterminowe', 'zapasy', 'pozostale_aktywa_obrotowe', 'aktywa_trwale', 'rzeczowe_aktywa_trwale',
+    'wartosci_niematerialne', 'inwestycje_dlugoterminowe', 'pozostale_aktywa_trwale', 'aktywa_razem',
+    'zobowiazania_krotkoterminowe', 'dlug_krotkoterminowy', 'zobowiazania_handlowe',
+    'pozostale_zobowiazania_krotkoterminowe', 'zobowiazania_dlugoterminowe', 'dlug_dlugoterminowy',
+    'pozostale_zobowiazania_dlugoterminowe', 'kapital_wlasny', 'kapital_zakladowy', 'kapital_zapasowy',
+    'zyski_zatrzymane', 'pasywa_razem', 'przeplywy_operacyjne', 'przeplywy_inwestycyjne', 'przeplywy_finansowe',
+    'zmiana_stanu_srodkow', 'capex', 'free_cash_flow', 'liczba_akcji',
+    'roe', 'roa', 'net_margin', 'debt_to_equity', 'current_ratio', 'eps', 'ebitda_margin',
+]
+
+# Kolumny, które pokazuje strona spółki w app.py (tabela, wykresy, historyczne wskaźniki)
+PAGE_HISTORY_COLUMNS = [
+    'przychody', 'ebitda', 'zysk_netto', 'aktywa_razem', 'kapital_wlasny', 'przeplywy_operacyjne',
+    'roe', 'roa', 'net_margin', 'debt_to_equity', 'current_ratio', 'eps', 'ebitda_margin',
+]
+
+
+@lru_cache(maxsize=64)
+def _history_select(columns: tuple) -> str:
+    """
+    Last :quarters reports of :ticker with only the requested columns, oldest first.
+    ORDER BY ... DESC LIMIT runs on the (ticker, rok DESC, kwartal DESC) index.
+    """
+    unknown = set(columns) - set(HISTORY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown financials columns: {sorted(unknown)}")
+    projection = ''.join(f", {col}::float8 AS {col}" for col in columns)
+    return f"""
+        SELECT * FROM (
+            SELECT rok, kwartal, CAST(rok AS VARCHAR) || '-' || kwartal AS period{projection}
+            FROM financials
+            WHERE ticker = :ticker
+            ORDER BY rok DESC, kwartal DESC
+            LIMIT :quarters
+        ) h
+        ORDER BY rok ASC, kwartal ASC
+    """
+
+
+def financials_history_sql(columns=None):
+    """Compiled history query for a column list (None = all HISTORY_COLUMNS)"""
+    return text(_history_select(tuple(columns or HISTORY_COLUMNS)))
+
+
+PAGE_DATA_SQL = text(f"""
+    SELECT
+        (SELECT row_to_json(s) FROM latest_snapshot s WHERE s.ticker = :ticker) AS latest,
+        (SELECT json_agg(h ORDER BY h.rok, h.kwartal) FROM ({_history_select(tuple(PAGE_HISTORY_COLUMNS))}) h) AS history
+""")
+
+SCREENER_SQL = text("""
+    SELECT ticker, name, sector, price_date, close, rok, kwartal, data_publikacji,
+           przychody, zysk_netto, eps, pe_ratio, roe, roa, net_margin,
+           ebitda_margin, debt_to_equity, current_ratio
+    FROM latest_snapshot
+    ORDER BY ticker
+""")
+
+VALUATION_HISTORY_SQL = text("""
+    SELECT date, close::float8 AS close, rok, kwartal, market_cap, pe_ttm, pb, ev_ebitda, earnings_yield
+    FROM valuation_daily
+    WHERE ticker = :ticker AND (CAST(:start AS DATE) IS NULL OR date >= :start)
+    ORDER BY date
+""")
+
+LAST_PRICE_UPDATE_SQL = text("SELECT MAX(date) as last_update FROM prices_daily")
+
+_PRICE_UPSERT = """
+    INSERT INTO prices_daily (ticker, date, open, high, low, close, volume)
+    {source}
+    ON CONFLICT (ticker, date) DO UPDATE
+    SET open=EXCLUDED.open, high=EXCLUDED.high, low=EXCLUDED.low,
+        close=EXCLUDED.close, volume=EXCLUDED.volume, updated_at=NOW()
+    WHERE (prices_daily.open, prices_daily.high, prices_daily.low, prices_daily.close, prices_daily.volume)
+        IS DISTINCT FROM (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+    RETURNING ticker
+"""
+_PRICE_TYPES = ['varchar', 'date', 'numeric', 'numeric', 'numeric', 'numeric', 'bigint']
+
+# Upserty wykonywane w pętlach importu: nazwa -> (typy parametrów, treść).
+# Przygotowywane (PREPARE) raz na połączenie z puli, potem tylko EXECUTE.
+PREPARED_STATEMENTS = {
+    'upsert_price': (_PRICE_TYPES, _PRICE_UPSERT.format(source="VALUES ($1, $2, $3, $4, $5, $6, $7)")),
+    # Cała paczka wierszy jako tablice kolumn - jeden EXECUTE na paczkę
+    'upsert_prices': (
+        [f"{t}[]" for t in _PRICE_TYPES],
+        _PRICE_UPSERT.format(source="SELECT * FROM unnest($1, $2, $3, $4, $5, $6, $7)"),
+    ),
+}
+
+# Interwał wykresu -> jednostka date_trunc (None = notowania dzienne)
+PRICE_INTERVALS = {'daily': None, 'weekly': 'week', 'monthly': 'month'}
+
+
+def price_history_sql(interval: str = 'daily', start=None, end=None):
+    """
+    OHLCV of :tickers, resampled in SQL for weekly/monthly intervals.
+    Date predicates are only added when bounds are given.
+    """
+    if interval not in PRICE_INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+    unit = PRICE_INTERVALS[interval]
+
+    where = "ticker = ANY(:tickers)"
+    if start is not None:
+        where += " AND date >= :start"
+    if end is not None:
+        where += " AND date <= :end"
+
+    if unit is None:
+        return text(f"""
+            SELECT ticker, date, open::float8 AS open, high::float8 AS high, low::float8 AS low,
+                   close::float8 AS close, volume
+            FROM prices_daily
+            WHERE {where}
+            ORDER BY ticker, date
+        """)
+    return text(f"""
+        SELECT ticker,
+               date_trunc('{unit}', date)::date AS date,
+               ((array_agg(open ORDER BY date))[1])::float8 AS open,
+               MAX(high)::float8 AS high,
+               MIN(low)::float8 AS low,
+               ((array_agg(close ORDER BY date DESC))[1])::float8 AS close,
+               SUM(volume) AS volume
+        FROM prices_daily
+        WHERE {where}
+        GROUP BY ticker, date_trunc('{unit}', date)
+        ORDER BY ticker, date
+    """)
+
+
+def _ticker_tags(self, ticker, *args, **kwargs):
+    return [ticker_tag(ticker)]
+
+
+def _tickers_tags(self, tickers, *args, **kwargs):
+    tickers = [tickers] if isinstance(tickers, str) else tickers
+    return [ticker_tag(ticker) for ticker in tickers]
+
+
+def _snapshot_tags(self, ticker, *args, **kwargs):
+    return [ticker_tag(ticker), 'snapshot']
+
+
+def _as_floats(row) -> dict:
+    """Row mapping as a dict with NUMERIC (Decimal) values converted to float"""
+    return {key: float(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+
+
+def _split_page_data(latest, history):
+    """Turn the PAGE_DATA_SQL row into (price dict, financials dict, history DataFrame)"""
+    latest = latest or {}
+    price = None
+    if latest.get('price_date') is not None:
+        price = {'date': latest['price_date'], 'open': latest['open'], 'high': latest['high'],
+                 'low': latest['low'], 'close': latest['close'], 'volume': latest['volume']}
+    financials = latest if latest.get('rok') is not None else None
+    return price, financials, pd.DataFrame(history) if history else None
+
+class DatabaseBusyError(Exception):
+    """All database connections stayed busy for longer than DB_QUEUE_TIMEOUT"""
+
+
 class DatabaseConnection:
     """PostgreSQL connection pool and operations"""
     
-    def __init__(self):
+    def __init__(self, pool_size: int = None, max_overflow: int = None, pool_timeout: float = None):
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise ValueError("DATABASE_URL not set")
+        self.pool_size = DB_POOL_SIZE if pool_size is None else pool_size
+        self.max_overflow = DB_MAX_OVERFLOW if max_overflow is None else max_overflow
+        self.capacity = self.pool_size + self.max_overflow
         
         # Initialize SQLAlchemy engine
         try:
-            self.engine = create_engine(self.database_url, pool_size=10, max_overflow=20)
+            self.engine = instrument_engine(create_engine(
+                self.database_url,
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_timeout=DB_POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+                pool_pre_ping=True,
+            ))
         except Exception as e:
             logger.error(f"Failed to create SQLAlchemy engine: {e}")
             raise e
+        
+        # Kolejka przed pulą: najwyżej capacity żądań naraz, reszta czeka do DB_QUEUE_TIMEOUT
+        self._gate = threading.BoundedSemaphore(self.capacity)
+        self._gate_lock = threading.Lock()
+        self._waiting = 0
+        self._in_use = 0
+        register_gauges(self._pool_gauges)
+    
+    @contextmanager
+    def _admission(self):
+        """Hold one of capacity slots for the block; raises DatabaseBusyError after DB_QUEUE_TIMEOUT"""
+        started = time.perf_counter()
+        with self._gate_lock:
+            self._waiting += 1
+        try:
+            admitted = self._gate.acquire(timeout=DB_QUEUE_TIMEOUT)
+        finally:
+            with self._gate_lock:
+                self._waiting -= 1
+                self._in_use += admitted
+        observe('db_queue_wait_ms', (time.perf_counter() - started) * 1000)
+        if not admitted:
+            inc('db_requests_shed_total')
+            logger.warning(f"⚠️ Database busy: no connection within {DB_QUEUE_TIMEOUT:.0f}s, request rejected")
+            raise DatabaseBusyError("The database is busy, please retry in a moment")
+        try:
+            yield
+        finally:
+            with self._gate_lock:
+                self._in_use -= 1
+            self._gate.release()
+    
+    def _checkout(self, connect):
+        started = time.perf_counter()
+        try:
+            conn = connect()
+        except PoolTimeoutError as e:
+            inc('db_requests_shed_total')
+            raise DatabaseBusyError("The database is busy, please retry in a moment") from e
+        observe('db_pool_checkout_wait_ms', (time.perf_counter() - started) * 1000)
+        return conn
+    
+    def pool_stats(self) -> dict:
+        """Current pool and queue occupancy"""
+        pool = self.engine.pool
+        checked_out = pool.checkedout()
+        return {
+            'pool_size': pool.size(),
+            'capacity': self.capacity,
+            'checked_out': checked_out,
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'utilization': round(checked_out / self.capacity, 3) if self.capacity else 0.0,
+            'requests_active': self._in_use,
+            'requests_waiting': self._waiting,
+        }
+    
+    def _pool_gauges(self):
+        return [(f"db_pool_{name}", {}, value) for name, value in self.pool_stats().items()]
     
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
-        with self.engine.begin() as conn:
-            yield conn
+        """Context manager for database connections (one transaction)"""
+        with self._admission():
+            conn = self._checkout(self.engine.connect)
+            with conn, conn.begin():
+                yield conn
     
+    @contextmanager
+    def get_raw_connection(self):
+        """
+        Context manager for a pooled DBAPI (psycopg2) connection.
+        Needed for COPY and other driver-level features. Cursors are TimedCursor,
+        so these statements reach the query metrics and the slow-query log.
+        Commits on success, rolls back on error and always returns the connection to the pool.
+        """
+        with self._admission():
+            conn = self._checkout(self.engine.raw_connection)
+            # Tylko na czas tego bloku - kursory SQLAlchemy mierzą zdarzenia silnika
+            conn.driver_connection.cursor_factory = TimedCursor
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                if conn.driver_connection is not None:
+                    conn.driver_connection.cursor_factory = None
+                conn.close()
+    
+    @cached_query(maxsize=1, ttl_seconds=CACHE_TTL_SECONDS, tags=lambda *a, **k: ['companies'], method=True)
     def get_all_companies(self):
         """Get all companies from database"""
         try:
             with self.get_connection() as conn:
-                result = conn.execute(text("SELECT ticker, name, currency FROM companies ORDER BY ticker")).mappings().all()
+                result = conn.execute(COMPANIES_SQL).mappings().all()
                 return result
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching companies: {e}")
-            return []
+            return None
     
+    @cached_query(maxsize=1024, ttl_seconds=CACHE_TTL_SECONDS, tags=_snapshot_tags, method=True)
     def get_latest_price(self, ticker):
-        """Get latest price for ticker"""
+        """Get latest price for ticker (primary-key lookup in latest_snapshot)"""
         try:
             with self.get_connection() as conn:
-                query = text("SELECT date, open, high, low, close, volume FROM prices_daily WHERE ticker = :ticker ORDER BY date DESC LIMIT 1")
-                result = conn.execute(query, {'ticker': ticker}).mappings().fetchone()
+                result = conn.execute(LATEST_PRICE_SQL, {'ticker': ticker}).mappings().fetchone()
+                if result is None:
+                    # Spółka dodana po ostatnim odświeżeniu widoku
+                    result = conn.execute(LATEST_PRICE_FALLBACK_SQL, {'ticker': ticker}).mappings().fetchone()
                 if result:
-                    return result
+                    return _as_floats(result)
                 return None
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching price for {ticker}: {e}")
             return None
     
+    @cached_query(maxsize=1024, ttl_seconds=CACHE_TTL_SECONDS, tags=_snapshot_tags, method=True)
     def get_latest_financials(self, ticker):
-        """Get latest financial report for ticker"""
+        """Get latest financial report for ticker (primary-key lookup in latest_snapshot)"""
         try:
             with self.get_connection() as conn:
-                query = text("SELECT * FROM financials WHERE ticker = :ticker ORDER BY rok DESC, kwartal DESC LIMIT 1")
-                result = conn.execute(query, {'ticker': ticker}).mappings().fetchone()
+                result = conn.execute(LATEST_FINANCIALS_SQL, {'ticker': ticker}).mappings().fetchone()
+                if result is None:
+                    result = conn.execute(LATEST_FINANCIALS_FALLBACK_SQL, {'ticker': ticker}).mappings().fetchone()
                 if result:
-                    return result
+                    return _as_floats(result)
                 return None
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching financials for {ticker}: {e}")
             return None
     
-    def get_financials_history(self, ticker, quarters=16):
-        """Get financial history for ticker as DataFrame"""
-        try:
-            query = text("""
-                SELECT *,
-                       CAST(rok AS VARCHAR) || '-' || kwartal AS period
-                FROM financials
-                WHERE ticker = :ticker
-                ORDER BY rok ASC, kwartal ASC
-            """)
-            
+    @cached_query(maxsize=512, ttl_seconds=CACHE_TTL_SECONDS, tags=_ticker_tags, method=True)
+    def get_financials_history(self, ticker, quarters=16, columns=None, dtype='float64'):
+        """
+        Get the last N quarters of financial history for ticker as DataFrame.
+        Args:
+            columns: numeric financials columns to fetch (default: all of HISTORY_COLUMNS);
+                     rok, kwartal and period are always included
+            dtype: 'float64' or 'float32' for the value columns
+        """
+        try:
+            query = financials_history_sql(columns)
             with self.get_connection() as conn:
-                df = pd.read_sql(query, conn, params={'ticker': ticker})
+                df = pd.read_sql(query, conn, params={'ticker': ticker, 'quarters': quarters})
                 
             if df.empty:
                 return None
             
-            # Sort by year/quarter ensuring correct order
-            df = df.sort_values(['rok', 'kwartal'])
-            
-            # Return last N quarters
-            return df.tail(quarters)
+            if dtype != 'float64':
+                value_cols = df.columns.difference(['rok', 'kwartal', 'period'])
+                df[value_cols] = df[value_cols].astype(dtype)
+            return df
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching financials history: {e}")
             return None
     
+    @cached_query(maxsize=256, ttl_seconds=CACHE_TTL_SECONDS, tags=_snapshot_tags, method=True)
+    def get_ticker_page_data(self, ticker, quarters=20):
+        """
+        Everything a ticker page needs in one round-trip:
+        {'price': dict, 'financials': dict, 'history': DataFrame of the last N quarters}
+        (any of them None if missing). Cached per ticker until the snapshot or
+        the ticker's data changes.
+        """
+        try:
+            with self.get_connection() as conn:
+                latest, history = conn.execute(PAGE_DATA_SQL, {'ticker': ticker, 'quarters': quarters}).fetchone()
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching page data for {ticker}: {e}")
+            return None
+
+        price, financials, history = _split_page_data(latest, history)
+        # Spółka dodana po ostatnim odświeżeniu latest_snapshot
+        if price is None:
+            price = self.get_latest_price(ticker)
+        if financials is None:
+            financials = self.get_latest_financials(ticker)
+
+        return {
+            'price': price,
+            'financials': financials,
+            'history': history,
+        }
+
+    @cached_query(maxsize=1, ttl_seconds=CACHE_TTL_SECONDS, tags=lambda *a, **k: ['snapshot'], method=True)
+    def get_screener_snapshot(self):
+        """Latest price, latest report and its metrics for every company as one DataFrame"""
+        try:
+            with self.get_connection() as conn:
+                return pd.read_sql(SCREENER_SQL, conn, coerce_float=True)
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching screener snapshot: {e}")
+            return None
+
+    @cached_query(maxsize=256, ttl_seconds=CACHE_TTL_SECONDS, tags=_tickers_tags, method=True)
+    def get_price_history(self, tickers, start=None, end=None, interval='daily', max_points=None):
+        """
+        Price history for one or many tickers as a long DataFrame
+        (ticker, date, open, high, low, close, volume).
+        Args:
+            interval: 'daily', 'weekly' or 'monthly' (resampled in SQL with date_trunc)
+            max_points: per-ticker point budget; longer series are thinned with LTTB on close
+        """
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        try:
+            query = price_history_sql(interval, start, end)
+            params = {'tickers': tickers, 'start': start, 'end': end}
+            with self.get_connection() as conn:
+                df = pd.read_sql(query, conn, params=params, parse_dates=['date'])
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching price history for {tickers}: {e}")
+            return None
+
+        if df.empty:
+            return None
+        if max_points:
+            df = pd.concat(
+                [downsample_frame(group, 'date', 'close', max_points) for _, group in df.groupby('ticker', sort=False)],
+                ignore_index=True
+            )
+        return df
+
+    @cached_query(maxsize=256, ttl_seconds=CACHE_TTL_SECONDS, tags=_ticker_tags, method=True)
+    def get_valuation_history(self, ticker, start=None):
+        """Daily P/E (TTM), P/B, EV/EBITDA and earnings yield of ticker from valuation_daily"""
+        try:
+            with self.get_connection() as conn:
+                df = pd.read_sql(VALUATION_HISTORY_SQL, conn, params={'ticker': ticker, 'start': start}, parse_dates=['date'])
+            return df if not df.empty else None
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching valuation history for {ticker}: {e}")
+            return None
+
+    def refresh_latest_snapshot(self) -> bool:
+        """
+        Rebuild latest_snapshot after an import. CONCURRENTLY keeps the view
+        readable by the app while it is being refreshed.
+        """
+        try:
+            with self.get_connection() as conn:
+                conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY latest_snapshot"))
+            invalidate('snapshot')
+            logger.info("Refreshed latest_snapshot")
+            return True
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing latest_snapshot: {e}")
+            return False
+
+    @cached_query(maxsize=1, ttl_seconds=CACHE_TTL_SECONDS, tags=lambda *a, **k: ['prices'], method=True)
     def get_last_price_update(self):
         """Get timestamp of last price update"""
         try:
             with self.get_connection() as conn:
-                result = conn.execute(text("SELECT MAX(date) as last_update FROM prices_daily")).fetchone()
+                result = conn.execute(LAST_PRICE_UPDATE_SQL).fetchone()
                 if result and result[0]:
                     return result[0].strftime("%Y-%m-%d %H:%M")
                 return None
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching last update: {e}")
             return None
     
+    def get_price_high_water_marks(self) -> dict:
+        """Get the latest stored price date per company (None if it has no prices) in one grouped query"""
+        try:
+            with self.get_connection() as conn:
+                result = conn.execute(text("""
+                    SELECT c.ticker, MAX(p.date) AS last_date
+                    FROM companies c
+                    LEFT JOIN prices_daily p ON p.ticker = c.ticker
+                    GROUP BY c.ticker
+                """)).fetchall()
+                return {row[0]: row[1] for row in result}
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching price high-water marks: {e}")
+            return {}
+
+    def ensure_price_partitions(self, years_ahead: int = 1) -> bool:
+        """
+        Create yearly partitions up to years_ahead when prices_daily is partitioned
+        (see scripts/migrate_prices_partitioned.py). No-op for the plain table.
+        """
+        try:
+            with self.get_connection() as conn:
+                relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'prices_daily'")).scalar()
+                if relkind != 'p':
+                    return False
+                conn.execute(text("""
+                    SELECT create_price_partitions(
+                        EXTRACT(YEAR FROM CURRENT_DATE)::INT,
+                        EXTRACT(YEAR FROM CURRENT_DATE)::INT + :years_ahead
+                    )
+                """), {'years_ahead': years_ahead})
+                return True
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error creating price partitions: {e}")
+            return False
+
+    @staticmethod
+    def execute_prepared(conn, cur, name: str, params):
+        """
+        EXECUTE a PREPARED_STATEMENTS entry on a raw pooled connection.
+        The statement is prepared on first use per DBAPI connection; the pool
+        keeps connections open, so later calls skip parsing and planning.
+        """
+        types, statement = PREPARED_STATEMENTS[name]
+        prepared = conn.info.setdefault('prepared_statements', set())
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} ({', '.join(types)}) AS {statement}")
+            prepared.add(name)
+        cur.execute(f"EXECUTE {name} ({', '.join(f'%s::{t}' for t in types)})", params)
+
     def insert_price(self, ticker, date, open_price, high, low, close, volume):
         """Insert daily price"""
         try:
-            with self.get_connection() as conn:
-                query = text("""
-                    INSERT INTO prices_daily (ticker, date, open, high, low, close, volume)
-                    VALUES (:ticker, :date, :open, :high, :low, :close, :volume)
-                    ON CONFLICT (ticker, date) DO UPDATE
-                    SET open=EXCLUDED.open, high=EXCLUDED.high, low=EXCLUDED.low,
-                        close=EXCLUDED.close, volume=EXCLUDED.volume
-                """)
-                conn.execute(query, {'ticker': ticker, 'date': date, 'open': open_price, 'high': high, 'low': low, 'close': close, 'volume': volume})
+            with self.get_raw_connection() as conn:
+                with conn.cursor() as cur:
+                    self.execute_prepared(conn, cur, 'upsert_price', (ticker, date, open_price, high, low, close, volume))
+            invalidate(ticker_tag(ticker), 'prices')
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error inserting price: {e}")
 
+    def insert_prices(self, rows, page_size: int = 5000) -> list:
+        """
+        Bulk upsert of daily prices in one transaction, page_size rows per
+        EXECUTE of the prepared upsert_prices statement.
+        Args:
+            rows: iterable of (ticker, date, open, high, low, close, volume) tuples
+        Returns: ticker of every row inserted or changed (identical rows are not written)
+        """
+        # Duplikat (ticker, date) w jednym INSERT ... ON CONFLICT jest błędem - ostatni wygrywa
+        rows = list({(row[0], row[1]): row for row in rows}.values())
+        if not rows:
+            return []
+        changed = []
+        with self.get_raw_connection() as conn:
+            with conn.cursor() as cur:
+                for i in range(0, len(rows), page_size):
+                    columns = [list(column) for column in zip(*rows[i:i + page_size])]
+                    self.execute_prepared(conn, cur, 'upsert_prices', columns)
+                    changed.extend(ticker for ticker, in cur.fetchall())
+        if changed:
+            invalidate('prices', *{ticker_tag(ticker) for ticker in changed})
+        return changed
+
+    @staticmethod
+    def copy_dataframe(cur, df: pd.DataFrame, table: str, columns: list):
+        """
+        Stream a DataFrame into a table with COPY ... FROM STDIN (CSV format).
+        NaN/None values are sent as NULL. Columns must already be in DB order.
+        """
+        buffer = io.StringIO()
+        df[columns].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
     def close(self):
         """Dispose the engine."""
-        self.engine.dispose()
\ No newline at end of file
+        self.engine.dispose()
+
+
+_shared_db = None
+_shared_lock = threading.Lock()
+
+
+def get_database() -> DatabaseConnection:
+    """
+    Process-wide DatabaseConnection: every script and job in the process shares
+    one engine, so pooled connections (and their prepared statements) are reused.
+    """
+    global _shared_db
+    if _shared_db is None:
+        with _shared_lock:
+            if _shared_db is None:
+                _shared_db = DatabaseConnection()
+    return _shared_db
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Shape-preserving downsampling of time series for charts
+"""
+
+import numpy as np
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual
+    shape of the series (peaks and troughs survive, flat stretches are thinned).
+    First and last points are always kept. x must be increasing.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 kubełków pomiędzy pierwszym i ostatnim punktem
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+
+        # Pole trójkąta (poprzedni wybrany punkt, kandydat, średnia następnego kubełka)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_frame(df, x_col: str, y_col: str, n_out: int):
+    """Rows of df picked by LTTB on (x_col, y_col); df must be sorted by x_col"""
+    if len(df) <= n_out:
+        return df
+    x = df[x_col].to_numpy()
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    return df.iloc[lttb_indices(x, df[y_col].to_numpy(), n_out)]
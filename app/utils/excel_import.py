@@ -4,7 +4,9 @@ Excel data import and validation
 
 import pandas as pd
 import logging
-from typing import Tuple, List
+from typing import Tuple, List, Iterator, Optional
+
+from openpyxl import load_workbook
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +18,9 @@ class ExcelImporter:
         'Zysk_Netto', 'EBITDA', 'Kapital_Wlasny', 'Aktywa_Razem',
         'Liczba_Akcji'
     ]
+
+    # Liczba wierszy na partię przy imporcie strumieniowym
+    CHUNK_SIZE = 5000
     
     @staticmethod
     def load_excel(filepath: str) -> Tuple[pd.DataFrame, List[str]]:
@@ -45,6 +50,43 @@ class ExcelImporter:
             errors.append(f"Error reading file: {str(e)}")
             return None, errors
     
+    @staticmethod
+    def iter_excel_batches(filepath: str, chunk_size: int = CHUNK_SIZE,
+                           sheets: Optional[List[str]] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Stream a workbook as (sheet name, DataFrame) batches of at most chunk_size rows.
+        The workbook is opened read-only, so memory use depends on chunk_size and
+        not on the file size. Every sheet (or only the given ones) with the
+        REQUIRED_COLUMNS in its first row is read; other sheets are skipped.
+        """
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            for name in sheets or workbook.sheetnames:
+                rows = workbook[name].iter_rows(values_only=True)
+                header = next(rows, None)
+                # Puste nagłówki dostają unikalne nazwy, jak 'Unnamed: n' w pd.read_excel
+                columns = [str(c).strip() if c is not None else f"Unnamed: {i}" for i, c in enumerate(header or ())]
+                width = len(columns)
+
+                missing_cols = [col for col in ExcelImporter.REQUIRED_COLUMNS if col not in columns]
+                if missing_cols:
+                    logger.warning(f"Skipping sheet {name}: missing columns {missing_cols}")
+                    continue
+
+                batch = []
+                for row in rows:
+                    # Puste wiersze (formatowanie bez danych) pomijamy
+                    if all(value is None for value in row):
+                        continue
+                    batch.append(row[:width] + (None,) * (width - len(row)))
+                    if len(batch) >= chunk_size:
+                        yield name, pd.DataFrame.from_records(batch, columns=columns)
+                        batch = []
+                if batch:
+                    yield name, pd.DataFrame.from_records(batch, columns=columns)
+        finally:
+            workbook.close()
+
     @staticmethod
     def validate_data(df: pd.DataFrame) -> List[str]:
         """Validate data types and values"""
@@ -0,0 +1,245 @@
+"""
+Technical indicators over prices_daily: SMA, EMA, RSI, volatility, drawdown and 52-week range
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.db import DatabaseConnection
+from utils.instrumentation import inc
+
+logger = logging.getLogger(__name__)
+
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+RSI_PERIOD = 14
+VOLATILITY_WINDOW = 20
+TRADING_DAYS = 252
+# Notowania sprzed pierwszego przeliczanego dnia, potrzebne do wypełnienia okien kroczących
+WARMUP_BARS = max(max(SMA_WINDOWS), VOLATILITY_WINDOW + 1, TRADING_DAYS)
+# Tickery liczone jedną porcją - pamięć rośnie z liczbą notowań w porcji
+BATCH_TICKERS = 100
+
+# Stan przenoszony z ostatniego zapisanego dnia (rekurencyjne średnie i maksimum)
+STATE_COLUMNS = [f'ema_{span}' for span in EMA_SPANS] + [
+    f'avg_gain_{RSI_PERIOD}', f'avg_loss_{RSI_PERIOD}', 'running_max',
+]
+INDICATOR_COLUMNS = (
+    ['ticker', 'date', 'close']
+    + [f'sma_{n}' for n in SMA_WINDOWS]
+    + [f'ema_{span}' for span in EMA_SPANS]
+    + [f'rsi_{RSI_PERIOD}', f'avg_gain_{RSI_PERIOD}', f'avg_loss_{RSI_PERIOD}',
+       f'volatility_{VOLATILITY_WINDOW}', 'running_max', 'drawdown', 'high_52w', 'low_52w',
+       'source_updated_at']
+)
+
+# Najwcześniejsze zmienione notowanie per ticker i stan z dnia poprzedzającego je.
+# Stan jest używalny tylko, gdy pochodzi z ostatniego notowania przed from_date (prev_date).
+CHANGED_SQL = f"""
+    WITH changed AS (
+        SELECT ticker, MIN(date) AS from_date
+        FROM prices_daily
+        WHERE %(full)s OR updated_at > %(since)s
+        GROUP BY ticker
+    )
+    SELECT ch.ticker, ch.from_date, prev.date AS prev_date, s.date AS state_date,
+           {', '.join(f's.{c}' for c in STATE_COLUMNS)}
+    FROM changed ch
+    LEFT JOIN LATERAL (
+        SELECT date FROM prices_daily
+        WHERE ticker = ch.ticker AND date < ch.from_date
+        ORDER BY date DESC LIMIT 1
+    ) prev ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT * FROM price_indicators
+        WHERE ticker = ch.ticker AND date < ch.from_date
+        ORDER BY date DESC LIMIT 1
+    ) s ON TRUE
+    ORDER BY ch.ticker
+"""
+
+# Notowania od from_date (NULL = cała historia) plus WARMUP_BARS wcześniejszych
+LOAD_SQL = """
+    SELECT ch.ticker, p.date, p.high::float8, p.low::float8, p.close::float8, p.updated_at
+    FROM unnest(%(tickers)s::text[], %(from_dates)s::date[]) AS ch(ticker, from_date)
+    CROSS JOIN LATERAL (
+        (SELECT date, high, low, close, updated_at FROM prices_daily
+         WHERE ticker = ch.ticker AND ch.from_date IS NOT NULL AND date < ch.from_date
+         ORDER BY date DESC LIMIT %(warmup)s)
+        UNION ALL
+        (SELECT date, high, low, close, updated_at FROM prices_daily
+         WHERE ticker = ch.ticker AND (ch.from_date IS NULL OR date >= ch.from_date))
+    ) p
+    ORDER BY ch.ticker, p.date
+"""
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE staging_indicators (LIKE price_indicators INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+
+MERGE_SQL = f"""
+    INSERT INTO price_indicators ({', '.join(INDICATOR_COLUMNS)})
+    SELECT {', '.join(INDICATOR_COLUMNS)} FROM staging_indicators
+    ON CONFLICT (ticker, date) DO UPDATE SET
+        {', '.join(f'{c} = EXCLUDED.{c}' for c in INDICATOR_COLUMNS[2:])},
+        updated_at = NOW();
+    TRUNCATE staging_indicators;
+"""
+
+
+def _grouped(series: pd.Series, tickers: pd.Series):
+    return series.groupby(tickers, sort=False)
+
+
+def _rolling(series: pd.Series, tickers: pd.Series, window: int, min_periods: int = None):
+    return _grouped(series, tickers).rolling(window, min_periods=min_periods or window)
+
+
+def _seeded_ewm(values: pd.Series, seed: pd.Series, tickers: pd.Series, alpha: float) -> pd.Series:
+    """
+    Recursive average y[t] = (1 - alpha) * y[t-1] + alpha * x[t] per ticker,
+    started from seed on the first row of each ticker (from x there when seed is NaN).
+    """
+    start = values.where(seed.isna(), seed)
+    return _grouped(start, tickers).ewm(alpha=alpha, adjust=False).mean().droplevel(0)
+
+
+def compute_indicators(prices: pd.DataFrame, states: pd.DataFrame) -> pd.DataFrame:
+    """
+    Indicators for every bar of prices (ticker, date, high, low, close,
+    updated_at; sorted by ticker and date, with a RangeIndex) in grouped,
+    vectorized passes over all tickers at once.
+
+    states is indexed by ticker with from_date and, for tickers continuing
+    from stored values, state_date plus STATE_COLUMNS. For those tickers the
+    prices start with warm-up bars up to state_date, which fill the rolling
+    windows, while the recursive averages and the running maximum continue
+    from the state instead of the full history. Tickers without state start
+    from their first bar. Returns the rows from from_date onwards.
+    """
+    tickers = prices['ticker']
+    close = prices['close']
+    out = prices[['ticker', 'date', 'close']].copy()
+
+    # Okna kroczące - rozgrzewka w danych wejściowych
+    for n in SMA_WINDOWS:
+        out[f'sma_{n}'] = _rolling(close, tickers, n).mean().droplevel(0)
+    returns = np.log(close / _grouped(close, tickers).shift())
+    out[f'volatility_{VOLATILITY_WINDOW}'] = (
+        _rolling(returns, tickers, VOLATILITY_WINDOW).std().droplevel(0) * np.sqrt(TRADING_DAYS) * 100
+    )
+    out['high_52w'] = _rolling(prices['high'].fillna(close), tickers, TRADING_DAYS, 1).max().droplevel(0)
+    out['low_52w'] = _rolling(prices['low'].fillna(close), tickers, TRADING_DAYS, 1).min().droplevel(0)
+
+    # Maksimum od debiutu: maksimum z wczytanych notowań i zapisanego stanu
+    running_max = np.fmax(_grouped(close, tickers).cummax(), tickers.map(states['running_max']))
+    out['running_max'] = running_max
+    out['drawdown'] = (close / running_max - 1) * 100
+
+    # Rekurencje liczone od wiersza stanu (albo od pierwszego notowania)
+    state_date = tickers.map(states['state_date'])
+    has_state = state_date.notna()
+    live = ~has_state | (prices['date'] >= state_date)
+    sub = prices[live]
+    sub_tickers = sub['ticker']
+    is_state_row = has_state[live] & (sub['date'] == state_date[live])
+    position = sub.groupby('ticker', sort=False).cumcount()
+
+    for span in EMA_SPANS:
+        seed = sub_tickers.map(states[f'ema_{span}']).where(is_state_row)
+        ema = _seeded_ewm(sub['close'], seed, sub_tickers, 2 / (span + 1))
+        # Bez stanu pierwsze span - 1 wartości to rozgrzewka
+        out[f'ema_{span}'] = ema.mask(~has_state[live] & (position < span - 1))
+
+    # RSI Wildera: pierwsza średnia to zwykła średnia RSI_PERIOD zmian, potem wygładzanie 1/RSI_PERIOD
+    delta = _grouped(sub['close'], sub_tickers).diff()
+    fresh = ~has_state[live]
+    wilder = ~fresh | (position >= RSI_PERIOD)
+    averages = {}
+    for name, moves in (('gain', delta.clip(lower=0)), ('loss', (-delta).clip(lower=0))):
+        first = _rolling(moves, sub_tickers, RSI_PERIOD).mean().droplevel(0)
+        seed = sub_tickers.map(states[f'avg_{name}_{RSI_PERIOD}']).where(is_state_row)
+        seed = seed.where(~(fresh & (position == RSI_PERIOD)), first)
+        averages[name] = _seeded_ewm(moves[wilder], seed[wilder], sub_tickers[wilder], 1 / RSI_PERIOD)
+        out[f'avg_{name}_{RSI_PERIOD}'] = averages[name]
+    rsi = 100 - 100 / (1 + averages['gain'] / averages['loss'].replace(0, np.nan))
+    out[f'rsi_{RSI_PERIOD}'] = rsi.mask(averages['loss'] == 0, 100.0)
+
+    out['source_updated_at'] = prices['updated_at']
+    from_date = tickers.map(states['from_date'])
+    return out[from_date.isna() | (prices['date'] >= from_date)]
+
+
+def _usable_states(changed: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep the stored state only where it is complete and belongs to the bar
+    right before from_date; other tickers are recomputed from their first bar.
+    """
+    usable = changed['state_date'].notna() & (changed['state_date'] == changed['prev_date'])
+    usable &= changed[STATE_COLUMNS].notna().all(axis=1)
+    states = changed.set_index('ticker')
+    states.loc[~usable.values, ['state_date'] + STATE_COLUMNS] = np.nan
+    states.loc[~usable.values, 'from_date'] = pd.NaT
+    return states
+
+
+def refresh_indicators(db, full: bool = False, progress=None):
+    """
+    Bring price_indicators up to date.
+
+    Only tickers with prices_daily rows changed since the last run are
+    touched, starting from their earliest changed bar and continuing from the
+    values stored for the bar before it, so a daily run reads about
+    WARMUP_BARS + new bars per ticker instead of its full history. full=True
+    rebuilds everything. Everything is written in one transaction, so a
+    failed run leaves the previous state intact.
+    progress(done, total, ticker) is called after every batch of tickers.
+    Returns a dict with the written rows and the changed tickers, or None on error.
+    """
+    try:
+        with db.get_raw_connection() as conn:
+            with conn.cursor() as cur:
+                since = None
+                if not full:
+                    cur.execute("SELECT MAX(source_updated_at) FROM price_indicators")
+                    since = cur.fetchone()[0]
+                full = full or since is None
+                cur.execute(CHANGED_SQL, {'full': full, 'since': since})
+                changed = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+                if changed.empty:
+                    logger.info("Indicators up to date, no changed prices")
+                    return {'rows_written': 0, 'changed_tickers': []}
+
+                for col in ('from_date', 'prev_date', 'state_date'):
+                    changed[col] = pd.to_datetime(changed[col])
+                changed[STATE_COLUMNS] = changed[STATE_COLUMNS].astype('float64')
+                states = _usable_states(changed)
+                cur.execute(STAGING_TABLE_SQL)
+
+                written, tickers = 0, list(states.index)
+                for i in range(0, len(tickers), BATCH_TICKERS):
+                    batch = states.iloc[i:i + BATCH_TICKERS]
+                    from_dates = [None if pd.isna(d) else d.date() for d in batch['from_date']]
+                    cur.execute(LOAD_SQL, {'tickers': list(batch.index), 'from_dates': from_dates, 'warmup': WARMUP_BARS})
+                    prices = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+                    prices['date'] = pd.to_datetime(prices['date'])
+                    frame = compute_indicators(prices, batch) if not prices.empty else prices
+                    if not frame.empty:
+                        DatabaseConnection.copy_dataframe(cur, frame, 'staging_indicators', INDICATOR_COLUMNS)
+                        cur.execute(MERGE_SQL)
+                        written += len(frame)
+                    if progress:
+                        progress(min(i + BATCH_TICKERS, len(tickers)), len(tickers), batch.index[-1])
+
+        inc('indicator_rows_total', written)
+        carried = int(states['state_date'].notna().sum())
+        logger.info(
+            f"✅ Indicators refreshed ({'full' if full else 'incremental'}): {written} rows for "
+            f"{len(tickers)} tickers ({carried} continued from stored state)"
+        )
+        return {'rows_written': written, 'changed_tickers': tickers}
+    except Exception as e:
+        logger.error(f"Error refreshing indicators: {e}")
+        return None
@@ -0,0 +1,349 @@
+"""
+Instrumentation: counters, latency histograms, query timing and a metrics endpoint
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import logging
+import weakref
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from psycopg2.extensions import cursor as PsycopgCursor
+from sqlalchemy import event
+
+from utils.cache import cache_stats
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'fintech_'
+# Zapytania wolniejsze niż próg trafiają do logu (WARNING)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))
+# 0 = endpoint wyłączony
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Przedziały histogramów czasu w milisekundach
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Ile różnych treści zapytań trzymać w statystykach per zapytanie
+MAX_STATEMENTS = 200
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on export, like Prometheus)"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        total, out = 0, []
+        for le, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            out.append((le, total))
+        return out
+
+
+class Registry:
+    """Thread-safe store of labelled counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.statements = {}  # znormalizowane zapytanie -> Histogram
+        self.collectors = []  # funkcje zwracające [(name, labels, value)] - gauge liczone przy odczycie
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    def observe_statement(self, statement: str, elapsed_ms: float):
+        with self._lock:
+            histogram = self.statements.get(statement)
+            if histogram is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    return
+                histogram = self.statements[statement] = Histogram()
+            histogram.observe(elapsed_ms)
+
+    def register_gauges(self, collector):
+        """
+        Add a callable returning [(name, labels dict, value)], evaluated on every
+        export. Bound methods are held weakly, so registering doesn't keep the object alive.
+        """
+        ref = weakref.WeakMethod(collector) if hasattr(collector, '__self__') else (lambda: collector)
+        with self._lock:
+            self.collectors.append(ref)
+
+    def gauges(self) -> list:
+        with self._lock:
+            collectors = [ref() for ref in self.collectors]
+        values = []
+        for collector in collectors:
+            if collector is None:
+                continue
+            try:
+                values.extend(collector())
+            except Exception as e:
+                logger.debug(f"Gauge collector failed: {e}")
+        return values
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.statements.clear()
+
+    def to_dict(self, top: int = 20) -> dict:
+        """JSON-friendly dump: counters, histogram summaries and the slowest statements by total time"""
+        with self._lock:
+            counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in self.counters.items()]
+            histograms = [
+                {'name': n, 'labels': dict(l), 'count': h.count, 'sum_ms': round(h.sum, 3),
+                 'avg_ms': round(h.sum / h.count, 3) if h.count else None, 'max_ms': round(h.max, 3)}
+                for (n, l), h in self.histograms.items()
+            ]
+            statements = sorted(self.statements.items(), key=lambda item: item[1].sum, reverse=True)[:top]
+            statements = [
+                {'statement': s, 'count': h.count, 'total_ms': round(h.sum, 3),
+                 'avg_ms': round(h.sum / h.count, 3), 'max_ms': round(h.max, 3)}
+                for s, h in statements
+            ]
+        gauges = [{'name': n, 'labels': labels, 'value': v} for n, labels, v in self.gauges()]
+        return {
+            'counters': counters, 'histograms': histograms, 'gauges': gauges,
+            'statements': statements, 'caches': cache_stats(),
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                for (n, labels), value in self.counters.items():
+                    if n == name:
+                        lines.append(f"{METRIC_PREFIX}{name}{_labels(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+                for (n, labels), histogram in self.histograms.items():
+                    if n != name:
+                        continue
+                    for le, count in histogram.cumulative():
+                        lines.append(f"{METRIC_PREFIX}{name}_bucket{_labels(labels + (('le', str(le)),))} {count}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+
+        gauges = self.gauges()
+        for name in sorted({n for n, _, _ in gauges}):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+            for n, labels, value in gauges:
+                if n == name:
+                    lines.append(f"{METRIC_PREFIX}{name}{_labels(tuple(sorted(labels.items())))} {value}")
+
+        # Liczniki cache z utils.cache jako gauge
+        for field in ('size', 'hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+            lines.append(f"# TYPE {METRIC_PREFIX}cache_{field} gauge")
+            for stats in cache_stats():
+                lines.append(f"{METRIC_PREFIX}cache_{field}{_labels((('cache', stats['name']),))} {stats[field]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+register_gauges = REGISTRY.register_gauges
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block into the span_duration_ms histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('span_duration_ms', (time.perf_counter() - started) * 1000, span=name, **labels)
+
+
+class PageTimer:
+    """
+    Sequential spans for a top-level script (Streamlit page): section(name)
+    closes the previous section and starts the next one, finish() closes the last.
+    """
+
+    def __init__(self, page: str):
+        self.page = page
+        self.current = None
+        self.started = self.page_started = time.perf_counter()
+
+    def section(self, name: str):
+        now = time.perf_counter()
+        if self.current:
+            observe('span_duration_ms', (now - self.started) * 1000, span=self.current, page=self.page)
+        self.current, self.started = name, now
+
+    def finish(self):
+        self.section(None)
+        observe('page_render_ms', (time.perf_counter() - self.page_started) * 1000, page=self.page)
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
+
+
+def record_statement(statement: str, elapsed_ms: float, rowcount: int = -1):
+    """
+    Record one executed statement: duration by operation, returned/affected rows,
+    per-statement totals and a WARNING for queries slower than SLOW_QUERY_MS.
+    """
+    operation = _operation(statement)
+    observe('db_query_duration_ms', elapsed_ms, op=operation)
+    if rowcount is not None and rowcount >= 0:
+        inc('db_query_rows_total', rowcount, op=operation)
+    normalized = _WHITESPACE.sub(' ', statement).strip()
+    REGISTRY.observe_statement(normalized[:300], elapsed_ms)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        inc('db_slow_queries_total', op=operation)
+        logger.warning(f"Slow query ({elapsed_ms:.0f} ms, {rowcount} rows): {normalized[:1000]}")
+
+
+class TimedCursor(PsycopgCursor):
+    """
+    psycopg2 cursor for raw pooled connections (COPY, merges, prepared upserts),
+    which bypass the SQLAlchemy events: every execute/executemany/copy_expert
+    is recorded like a statement of an instrumented engine.
+    """
+
+    def _timed(self, method, statement, *args):
+        started = time.perf_counter()
+        try:
+            result = method(statement, *args)
+        except Exception:
+            inc('db_query_errors_total')
+            raise
+        if isinstance(statement, bytes):
+            statement = statement.decode(errors='replace')
+        elif not isinstance(statement, str):
+            statement = statement.as_string(self)
+        record_statement(statement, (time.perf_counter() - started) * 1000, self.rowcount)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+def instrument_engine(engine):
+    """
+    Attach timing to a SQLAlchemy (sync) engine: every statement goes through
+    record_statement, failures count into db_query_errors_total. Raw DBAPI
+    connections are timed by TimedCursor instead (see DatabaseConnection.get_raw_connection).
+    """
+    if getattr(engine, '_fintech_instrumented', False):
+        return engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_started'].pop()) * 1000
+        record_statement(statement, elapsed_ms, getattr(cursor, 'rowcount', -1))
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        inc('db_query_errors_total')
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    engine._fintech_instrumented = True
+    return engine
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body, content_type = json.dumps(REGISTRY.to_dict(), default=str), 'application/json'
+        elif self.path.startswith('/metrics'):
+            body, content_type = REGISTRY.to_prometheus(), 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Serve /metrics (Prometheus) and /metrics.json from a daemon thread.
+    Idempotent per process (Streamlit reruns the script); port 0 disables it.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+            logger.info(f"Metrics endpoint listening on :{port}/metrics")
+        return _server
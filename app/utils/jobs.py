@@ -0,0 +1,348 @@
+"""
+Background job execution with run history and cross-process locking
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+from utils.cache import invalidate, ticker_tag
+from utils.instrumentation import inc, observe
+
+logger = logging.getLogger(__name__)
+
+# Liczniki zapisanych wierszy w wynikach poszczególnych jobów
+ROW_COUNT_KEYS = ('inserted', 'updated', 'rows_written')
+# Postęp zapisywany do bazy najwyżej raz na tyle sekund
+PROGRESS_INTERVAL_SECONDS = 1.0
+# Zakończone joby sprawdzane przez aplikację najwyżej raz na tyle sekund (na proces)
+SYNC_INTERVAL_SECONDS = float(os.getenv('CACHE_SYNC_INTERVAL_SECONDS', 10))
+
+# Blokada doradcza per job - drugi kontener/proces nie uruchomi tego samego joba równolegle
+TRY_LOCK_SQL = text("SELECT pg_try_advisory_lock(hashtext('fintech.job.' || :job))")
+UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('fintech.job.' || :job))")
+
+# Jedno aktywne (queued/running) uruchomienie joba - pilnuje tego indeks idx_job_runs_active
+ENQUEUE_SQL = text("""
+    INSERT INTO job_runs (job, status, trigger) VALUES (:job, 'queued', :trigger)
+    ON CONFLICT (job) WHERE status IN ('queued', 'running') DO NOTHING
+    RETURNING id
+""")
+
+# Każdy działający scheduler trzyma tę blokadę współdzieloną; wolna = żaden scheduler nie działa
+SCHEDULER_LOCK_SQL = text("SELECT pg_advisory_lock_shared(hashtext('fintech.scheduler'))")
+SCHEDULER_RELEASE_SQL = text("SELECT pg_advisory_unlock_shared(hashtext('fintech.scheduler'))")
+SCHEDULER_FREE_SQL = text("SELECT pg_try_advisory_lock(hashtext('fintech.scheduler'))")
+SCHEDULER_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('fintech.scheduler'))")
+
+# Bez schedulera 'queued' nigdy by się nie zakończył (i blokowałby kolejne zakolejkowania joba)
+ORPHANED_QUEUED_SQL = text("""
+    UPDATE job_runs SET status = 'failed', finished_at = NOW(), error = 'scheduler not running'
+    WHERE status = 'queued'
+""")
+
+FAIL_QUEUED_RUN_SQL = text("""
+    UPDATE job_runs SET status = 'failed', finished_at = NOW(), error = :error
+    WHERE id = :id AND status = 'queued'
+""")
+
+ACTIVE_RUN_SQL = text("SELECT id FROM job_runs WHERE job = :job AND status IN ('queued', 'running')")
+
+QUEUED_RUNS_SQL = text("SELECT id, job FROM job_runs WHERE status = 'queued' ORDER BY id")
+
+# Trzymamy blokadę joba, więc 'running' bez właściciela to pozostałość po przerwanym procesie
+INTERRUPTED_SQL = text("""
+    UPDATE job_runs SET status = 'failed', finished_at = NOW(), error = 'interrupted'
+    WHERE job = :job AND status = 'running'
+""")
+
+# Uruchomienie z harmonogramu przejmuje ewentualne zakolejkowane uruchomienie tego joba
+START_RUN_SQL = text("""
+    INSERT INTO job_runs (job, status, trigger) VALUES (:job, 'running', :trigger)
+    ON CONFLICT (job) WHERE status IN ('queued', 'running') DO UPDATE SET
+        status = 'running', started_at = NOW()
+    RETURNING id
+""")
+
+CLAIM_RUN_SQL = text("""
+    UPDATE job_runs SET status = 'running', started_at = NOW()
+    WHERE id = :id AND status = 'queued'
+    RETURNING id
+""")
+
+PROGRESS_SQL = text("""
+    UPDATE job_runs SET stage = :stage, progress = CAST(:progress AS JSONB) WHERE id = :id
+""")
+
+FINISH_RUN_SQL = text("""
+    UPDATE job_runs SET
+        status = :status,
+        finished_at = NOW(),
+        duration_ms = :duration_ms,
+        rows = :rows,
+        details = CAST(:details AS JSONB),
+        error = :error
+    WHERE id = :id
+""")
+
+RUN_SQL = text("""
+    SELECT id, job, status, trigger, stage, progress, started_at, finished_at, duration_ms, rows, error
+    FROM job_runs WHERE id = :id
+""")
+
+RECENT_RUNS_SQL = text("""
+    SELECT id, job, status, trigger, started_at, finished_at, duration_ms, rows, error
+    FROM job_runs
+    ORDER BY started_at DESC
+    LIMIT :limit
+""")
+
+FINISHED_SINCE_SQL = text("""
+    SELECT finished_at, details->'changed_tickers' AS changed_tickers
+    FROM job_runs
+    WHERE status IN ('success', 'failed') AND finished_at > :since
+    ORDER BY finished_at
+""")
+
+
+class JobProgress:
+    """
+    Progress reporter passed to job functions: progress(done, total, item) and
+    progress.stage(name). Writes to job_runs are throttled, so it is cheap to
+    call for every ticker.
+    """
+
+    def __init__(self, db, run_id: int):
+        self.db = db
+        self.run_id = run_id
+        self.current_stage = None
+        self._stage_started = None
+        self._last_write = 0.0
+
+    def stage(self, name: str):
+        now = time.perf_counter()
+        if self.current_stage:
+            observe('job_stage_duration_ms', (now - self._stage_started) * 1000, stage=self.current_stage)
+        self.current_stage, self._stage_started = name, now
+        self._write({}, force=True)
+
+    def __call__(self, done: int, total: Optional[int] = None, item: Optional[str] = None):
+        self._write({'done': done, 'total': total, 'item': item})
+
+    def _write(self, progress: dict, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_write = now
+        try:
+            with self.db.get_connection() as conn:
+                conn.execute(PROGRESS_SQL, {
+                    'id': self.run_id, 'stage': self.current_stage, 'progress': json.dumps(progress)
+                })
+        except Exception as e:
+            logger.warning(f"Could not record progress of run {self.run_id}: {e}")
+
+
+def result_rows(result) -> Optional[int]:
+    """Number of rows a job wrote, from the counters in its result dict"""
+    if not isinstance(result, dict):
+        return None
+    return sum(int(result.get(key) or 0) for key in ROW_COUNT_KEYS)
+
+
+@contextmanager
+def job_locks(db, names):
+    """
+    Hold the advisory locks of all names on one dedicated connection.
+    Yields False (holding nothing) if any of them is taken.
+    """
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        with ExitStack() as held:
+            for name in names:
+                if not conn.execute(TRY_LOCK_SQL, {'job': name}).scalar():
+                    yield False
+                    return
+                held.callback(conn.execute, UNLOCK_SQL, {'job': name})
+            yield True
+
+
+@contextmanager
+def scheduler_presence(db):
+    """
+    Hold the shared scheduler lock on a dedicated connection while the
+    scheduler runs, so enqueue_job can tell whether anything will pick up
+    a queued run.
+    """
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        conn.execute(SCHEDULER_LOCK_SQL)
+        try:
+            yield
+        finally:
+            # Połączenie wraca do puli - blokada sesyjna zostałaby na nim
+            conn.execute(SCHEDULER_RELEASE_SQL)
+
+
+def run_job(db, job: str, func: Callable, trigger: str = 'schedule', run_id: int = None, locks=None):
+    """
+    Run func(progress) as job, recorded in job_runs.
+
+    The job holds session-level advisory locks (its own name and any extra
+    locks, e.g. of the jobs it includes) for its whole run; if another process
+    holds one of them, nothing happens and None is returned. run_id claims an
+    already queued run instead of creating a new one. Job functions follow the
+    scripts' convention of returning None on failure, exceptions are recorded
+    as failures as well. A result listing 'failed_stages' is a partial failure:
+    the run is marked failed but keeps its details (rows, changed tickers).
+    Returns (status, result), or None when the job could not start.
+    """
+    with job_locks(db, [job] + [name for name in locks or () if name != job]) as acquired:
+        if not acquired:
+            logger.info(f"Job {job} is already running elsewhere, skipping")
+            return None
+
+        with db.get_connection() as conn:
+            conn.execute(INTERRUPTED_SQL, {'job': job})
+            if run_id is None:
+                run_id = conn.execute(START_RUN_SQL, {'job': job, 'trigger': trigger}).scalar()
+            elif conn.execute(CLAIM_RUN_SQL, {'id': run_id}).scalar() is None:
+                return None
+
+        logger.info(f"▶️ Job {job} started (run {run_id}, {trigger})")
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = func(JobProgress(db, run_id))
+            if result is None:
+                error = "job returned no result, see logs"
+            elif isinstance(result, dict) and result.get('failed_stages'):
+                error = f"stages failed: {', '.join(result['failed_stages'])}"
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Error in job {job}: {e}")
+
+        status = 'failed' if error else 'success'
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        with db.get_connection() as conn:
+            conn.execute(FINISH_RUN_SQL, {
+                'id': run_id,
+                'status': status,
+                'duration_ms': duration_ms,
+                'rows': result_rows(result),
+                'details': json.dumps(result, default=str) if result is not None else None,
+                'error': error,
+            })
+        inc('job_runs_total', job=job, status=status)
+        observe('job_duration_ms', duration_ms, job=job)
+        log = logger.error if error else logger.info
+        log(f"{'❌' if error else '✅'} Job {job} {status} in {duration_ms} ms")
+        return status, result
+
+
+def enqueue_job(db, job: str, trigger: str = 'manual'):
+    """
+    Queue a run of job for the scheduler, or attach to the one already queued
+    or running (from any session or process). With no scheduler running,
+    nothing is queued and runs left queued are marked failed.
+    Returns (run id, True if a new run was queued), or None on error.
+    """
+    try:
+        with db.get_connection() as conn:
+            if conn.execute(SCHEDULER_FREE_SQL).scalar():
+                conn.execute(SCHEDULER_UNLOCK_SQL)
+                conn.execute(ORPHANED_QUEUED_SQL)
+                logger.error(f"Cannot queue job {job}: the scheduler is not running")
+                return None
+            run_id = conn.execute(ENQUEUE_SQL, {'job': job, 'trigger': trigger}).scalar()
+            if run_id is not None:
+                return run_id, True
+            run_id = conn.execute(ACTIVE_RUN_SQL, {'job': job}).scalar()
+        # Aktywne uruchomienie mogło zakończyć się między INSERT a SELECT
+        return (run_id, False) if run_id is not None else enqueue_job(db, job, trigger)
+    except Exception as e:
+        logger.error(f"Error queueing job {job}: {e}")
+        return None
+
+
+def get_queued_runs(db):
+    """[(run id, job)] waiting for the scheduler, oldest first"""
+    with db.get_connection() as conn:
+        return conn.execute(QUEUED_RUNS_SQL).fetchall()
+
+
+def fail_queued_run(db, run_id: int, error: str):
+    """Mark a queued run that will never be run as failed"""
+    with db.get_connection() as conn:
+        conn.execute(FAIL_QUEUED_RUN_SQL, {'id': run_id, 'error': error})
+
+
+def get_run(db, run_id: int):
+    """One job_runs row (with stage and progress) as a dict"""
+    try:
+        with db.get_connection() as conn:
+            row = conn.execute(RUN_SQL, {'id': run_id}).mappings().fetchone()
+            return dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Error fetching job run {run_id}: {e}")
+        return None
+
+
+def get_recent_runs(db, limit: int = 20):
+    """Latest job_runs rows, newest first"""
+    try:
+        with db.get_connection() as conn:
+            return conn.execute(RECENT_RUNS_SQL, {'limit': limit}).mappings().all()
+    except Exception as e:
+        logger.error(f"Error fetching job runs: {e}")
+        return None
+
+
+# Znacznik czasu bazy (finished_at), do którego zmiany są już odzwierciedlone w cache
+_synced_until = None
+_last_sync = None
+_sync_lock = threading.Lock()
+
+
+def sync_invalidation(db, force: bool = False) -> int:
+    """
+    Invalidate cached query results for data written by jobs that finished
+    (successfully or partially) since the last check: the changed tickers' entries plus the cross-ticker
+    'snapshot' and 'prices' entries. Jobs run in the scheduler process, so
+    the app calls this on every rerun; the caches are process-wide, so the
+    database is checked at most once every SYNC_INTERVAL_SECONDS for all
+    sessions (force=True checks right away).
+    Returns the number of removed entries.
+    """
+    global _synced_until, _last_sync
+    with _sync_lock:
+        now = time.monotonic()
+        if not force and _last_sync is not None and now - _last_sync < SYNC_INTERVAL_SECONDS:
+            return 0
+        _last_sync = now
+    try:
+        with db.get_connection() as conn:
+            if _synced_until is None:
+                # Pierwsze wywołanie w procesie: cache jest pusty, nie ma czego unieważniać
+                _synced_until = conn.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+                return 0
+            runs = conn.execute(FINISHED_SINCE_SQL, {'since': _synced_until}).fetchall()
+    except Exception as e:
+        logger.error(f"Error checking finished jobs: {e}")
+        return 0
+    if not runs:
+        return 0
+
+    _synced_until = runs[-1].finished_at
+    tickers = {ticker for run in runs for ticker in run.changed_tickers or ()}
+    if not tickers:
+        return 0
+    removed = invalidate(*(ticker_tag(t) for t in tickers), 'snapshot', 'prices')
+    logger.info(f"Invalidated {removed} cache entries for {len(tickers)} changed tickers")
+    return removed
@@ -5,11 +5,43 @@ Financial metrics calculations
 import logging
 from typing import Optional
 
+import numpy as np
+import pandas as pd
+
 logger = logging.getLogger(__name__)
 
+# Kolumny financials potrzebne do wyliczenia wskaźników
+FINANCIAL_INPUTS = [
+    'przychody', 'ebitda', 'zysk_netto', 'kapital_wlasny', 'aktywa_razem', 'liczba_akcji',
+    'dlug_krotkoterminowy', 'dlug_dlugoterminowy', 'aktywa_obrotowe', 'zobowiazania_krotkoterminowe'
+]
+
+METRIC_COLUMNS = [
+    'pe_ratio', 'eps', 'roe', 'roa', 'ebitda_margin', 'net_margin', 'debt_to_equity', 'current_ratio'
+]
+
+
+def _column(data, name: str, length: int) -> np.ndarray:
+    """Column of a DataFrame / dict of arrays as float64 (missing column -> all NaN)"""
+    if name not in data or data[name] is None:
+        return np.full(length, np.nan)
+    values = data[name] if isinstance(data[name], pd.Series) else pd.Series(data[name])
+    if not pd.api.types.is_numeric_dtype(values):
+        # Decimal z kolumn NUMERIC, None, napisy
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def safe_divide(num: np.ndarray, denom: np.ndarray) -> np.ndarray:
+    """Element-wise num / denom with zero, NaN and infinite denominators masked to NaN"""
+    out = np.full(np.broadcast(num, denom).shape, np.nan)
+    np.divide(num, denom, out=out, where=np.isfinite(denom) & (denom != 0))
+    return out
+
+
 class MetricsCalculator:
     """Calculate financial metrics from price and financial data"""
-    
+
     def __init__(self, price_data: dict, financial_data: dict):
         """
         Args:
@@ -18,113 +50,78 @@ class MetricsCalculator:
         """
         self.price_data = price_data or {}
         self.financial_data = financial_data or {}
-    
-    def _safe_div(self, num, denom):
-        """Helper for safe division"""
-        if not num or not denom or denom == 0:
-            return None
-        return float(num) / float(denom)
+        self._metrics = None
+
+    @staticmethod
+    def calculate_batch(financials, close=None) -> pd.DataFrame:
+        """
+        Compute every ratio for many tickers/quarters in one vectorized pass.
+
+        Args:
+            financials: DataFrame or dict of arrays with FINANCIAL_INPUTS columns
+                        (and optionally 'close' if close is not given)
+            close: array-like of prices aligned with financials rows
+        Returns: DataFrame with METRIC_COLUMNS (division by zero -> NaN),
+                 indexed like financials when it is a DataFrame
+        """
+        index = financials.index if isinstance(financials, pd.DataFrame) else None
+        length = len(financials) if index is not None else len(next(iter(financials.values()), []))
+        f = {name: _column(financials, name, length) for name in FINANCIAL_INPUTS}
+        price = _column({'close': close} if close is not None else financials, 'close', length)
+
+        eps = safe_divide(f['zysk_netto'], f['liczba_akcji'])
+        pe_ratio = safe_divide(price, eps)
+        pe_ratio[~(pe_ratio > 0)] = np.nan
+        total_debt = np.nan_to_num(f['dlug_krotkoterminowy']) + np.nan_to_num(f['dlug_dlugoterminowy'])
+
+        metrics = {
+            'pe_ratio': pe_ratio,
+            'eps': eps,
+            'roe': safe_divide(f['zysk_netto'], f['kapital_wlasny']) * 100,
+            'roa': safe_divide(f['zysk_netto'], f['aktywa_razem']) * 100,
+            'ebitda_margin': safe_divide(f['ebitda'], f['przychody']) * 100,
+            'net_margin': safe_divide(f['zysk_netto'], f['przychody']) * 100,
+            'debt_to_equity': safe_divide(total_debt, f['kapital_wlasny']),
+            'current_ratio': safe_divide(f['aktywa_obrotowe'], f['zobowiazania_krotkoterminowe']),
+        }
+        return pd.DataFrame(metrics, index=index, columns=METRIC_COLUMNS)
+
+    def _metric(self, name: str) -> Optional[float]:
+        """Single-row view over calculate_batch (computed once per instance)"""
+        if self._metrics is None:
+            row = {col: [self.financial_data.get(col)] for col in FINANCIAL_INPUTS}
+            self._metrics = self.calculate_batch(row, close=[self.price_data.get('close')]).iloc[0]
+        value = self._metrics[name]
+        return None if pd.isna(value) else float(value)
 
     def calculate_pe_ratio(self) -> Optional[float]:
         """Price-to-Earnings Ratio = Price / EPS"""
-        try:
-            price = self.price_data.get('close')
-            liczba_akcji = self.financial_data.get('liczba_akcji')
-            zysk_netto = self.financial_data.get('zysk_netto')
-            
-            if not price or not liczba_akcji or not zysk_netto:
-                return None
-            
-            eps = self._safe_div(zysk_netto, liczba_akcji)
-            pe = self._safe_div(price, eps)
-            return pe if pe and pe > 0 else None
-        except Exception as e:
-            logger.error(f"Error calculating P/E: {e}")
-            return None
-    
+        return self._metric('pe_ratio')
+
     def calculate_roe(self) -> Optional[float]:
         """Return on Equity = Net Income / Shareholder Equity * 100"""
-        try:
-            zysk_netto = self.financial_data.get('zysk_netto')
-            kapital_wlasny = self.financial_data.get('kapital_wlasny')
-            
-            val = self._safe_div(zysk_netto, kapital_wlasny)
-            return val * 100 if val is not None else None
-        except Exception as e:
-            logger.error(f"Error calculating ROE: {e}")
-            return None
-    
+        return self._metric('roe')
+
     def calculate_roa(self) -> Optional[float]:
         """Return on Assets = Net Income / Total Assets * 100"""
-        try:
-            zysk_netto = self.financial_data.get('zysk_netto')
-            aktywa_razem = self.financial_data.get('aktywa_razem')
-            
-            val = self._safe_div(zysk_netto, aktywa_razem)
-            return val * 100 if val is not None else None
-        except Exception as e:
-            logger.error(f"Error calculating ROA: {e}")
-            return None
-    
+        return self._metric('roa')
+
     def calculate_ebitda_margin(self) -> Optional[float]:
         """EBITDA Margin = EBITDA / Revenue * 100"""
-        try:
-            ebitda = self.financial_data.get('ebitda')
-            przychody = self.financial_data.get('przychody')
-            
-            val = self._safe_div(ebitda, przychody)
-            return val * 100 if val is not None else None
-        except Exception as e:
-            logger.error(f"Error calculating EBITDA margin: {e}")
-            return None
-    
+        return self._metric('ebitda_margin')
+
     def calculate_net_margin(self) -> Optional[float]:
         """Net Margin = Net Income / Revenue * 100"""
-        try:
-            zysk_netto = self.financial_data.get('zysk_netto')
-            przychody = self.financial_data.get('przychody')
-            
-            val = self._safe_div(zysk_netto, przychody)
-            return val * 100 if val is not None else None
-        except Exception as e:
-            logger.error(f"Error calculating net margin: {e}")
-            return None
-    
+        return self._metric('net_margin')
+
     def calculate_debt_to_equity(self) -> Optional[float]:
         """Debt-to-Equity = Total Debt / Shareholder Equity"""
-        try:
-            dlug_krotkoterminowy = self.financial_data.get('dlug_krotkoterminowy') or 0
-            dlug_dlugoterminowy = self.financial_data.get('dlug_dlugoterminowy') or 0
-            kapital_wlasny = self.financial_data.get('kapital_wlasny')
-            
-            total_debt = dlug_krotkoterminowy + dlug_dlugoterminowy
-            return self._safe_div(total_debt, kapital_wlasny)
-        except Exception as e:
-            logger.error(f"Error calculating D/E: {e}")
-            return None
-    
+        return self._metric('debt_to_equity')
+
     def calculate_current_ratio(self) -> Optional[float]:
         """Current Ratio = Current Assets / Current Liabilities"""
-        try:
-            aktywa_obrotowe = self.financial_data.get('aktywa_obrotowe')
-            zobowiazania_krotkoterminowe = self.financial_data.get('zobowiazania_krotkoterminowe')
-            
-            return self._safe_div(aktywa_obrotowe, zobowiazania_krotkoterminowe)
-        except Exception as e:
-            logger.error(f"Error calculating current ratio: {e}")
-            return None
+        return self._metric('current_ratio')
+
     def calculate_eps(self) -> Optional[float]:
-        """Price-to-Earnings Ratio = Price / EPS"""
-        try:
-            price = self.price_data.get('close')
-            liczba_akcji = self.financial_data.get('liczba_akcji')
-            zysk_netto = self.financial_data.get('zysk_netto')
-            
-            if not price or not liczba_akcji or not zysk_netto:
-                return None
-            
-            eps = self._safe_div(zysk_netto, liczba_akcji)
-            return eps if eps and eps > 0 else None
-        except Exception as e:
-            logger.error(f"Error calculating EPS: {e}")
-            return None
\ No newline at end of file
+        """Earnings per Share = Net Income / Shares Outstanding"""
+        return self._metric('eps')
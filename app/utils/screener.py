@@ -0,0 +1,56 @@
+"""
+Cross-sectional stock screening
+"""
+
+import operator
+import logging
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Wskaźniki, po których można filtrować i sortować
+SCREENER_METRICS = [
+    'pe_ratio', 'eps', 'roe', 'roa', 'net_margin', 'ebitda_margin', 'debt_to_equity', 'current_ratio'
+]
+
+
+def screen(snapshot: pd.DataFrame, filters: List[Tuple[str, str, float]] = None,
+           sort_by: Optional[str] = None, ascending: bool = True, limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Filter and rank the universe snapshot with vectorized masks.
+
+    Args:
+        snapshot: DataFrame from DatabaseConnection.get_screener_snapshot()
+        filters: list of (column, operator, value), e.g. [('pe_ratio', '<', 15), ('roe', '>', 10)].
+                 Rows with a missing value in a filtered column are excluded.
+        sort_by: column to rank by (missing values go last)
+    Returns: filtered DataFrame
+    """
+    if snapshot is None or snapshot.empty:
+        return pd.DataFrame()
+
+    mask = pd.Series(True, index=snapshot.index)
+    for column, op, value in filters or []:
+        if column not in snapshot.columns:
+            raise ValueError(f"Unknown screener column: {column}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown screener operator: {op}")
+        mask &= OPERATORS[op](snapshot[column], value).fillna(False)
+
+    result = snapshot[mask]
+    if sort_by:
+        result = result.sort_values(sort_by, ascending=ascending, na_position='last')
+    if limit:
+        result = result.head(limit)
+    return result
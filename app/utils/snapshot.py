@@ -0,0 +1,240 @@
+"""
+Columnar Parquet snapshot of the database for fast cold starts and offline analytics
+"""
+
+import os
+import json
+import shutil
+import itertools
+import functools
+import time
+import logging
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from utils.cache import cached_query
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '/app/data/snapshot')
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv('SNAPSHOT_MAX_AGE_SECONDS', 24 * 3600))
+EXPORT_CHUNK_SIZE = 100000
+MANIFEST = 'manifest.json'
+
+# Tabela w snapshot -> (zapytanie, kolumny partycjonujące)
+SNAPSHOT_TABLES = {
+    'financials': ("SELECT * FROM financials", ['rok']),
+    'prices_daily': (
+        "SELECT ticker, date, open, high, low, close, volume, EXTRACT(YEAR FROM date)::INT AS year "
+        "FROM prices_daily ORDER BY date, ticker",
+        ['year']
+    ),
+    'financials_ttm': ("SELECT * FROM financials_ttm", None),
+    'latest_snapshot': ("SELECT * FROM latest_snapshot", None),
+}
+
+
+# OID typu Postgresa -> typ Arrow; NUMERIC czytany jako float (coerce_float), pozostałe typy jako tekst
+PG_ARROW_TYPES = {
+    16: pa.bool_(),                          # boolean
+    20: pa.int64(),                          # bigint
+    21: pa.int16(),                          # smallint
+    23: pa.int32(),                          # integer
+    700: pa.float64(),                       # real
+    701: pa.float64(),                       # double precision
+    1700: pa.float64(),                      # numeric
+    1082: pa.date32(),                       # date
+    1114: pa.timestamp('us'),                # timestamp
+    1184: pa.timestamp('us', tz='UTC'),      # timestamptz
+}
+
+
+def _arrow_schema(conn, query: str) -> pa.Schema:
+    """
+    Schema from the result column types of query (described with LIMIT 0),
+    so a chunk where a column is all NULL still gets the column's real type.
+    """
+    result = conn.execute(text(f"SELECT * FROM ({query}) AS q LIMIT 0"), execution_options={'stream_results': False})
+    return pa.schema([
+        pa.field(column.name, PG_ARROW_TYPES.get(column.type_code, pa.string()))
+        for column in result.cursor.description
+    ])
+
+
+def _record_batches(conn, query: str):
+    """Stream query results as Arrow record batches (server-side cursor, bounded memory)"""
+    schema = _arrow_schema(conn, query)
+    for chunk in pd.read_sql(text(query), conn, chunksize=EXPORT_CHUNK_SIZE, coerce_float=True):
+        yield from pa.Table.from_pandas(chunk, schema=schema, preserve_index=False).to_batches()
+
+
+def _export_table(conn, query: str, partition_cols, target: str) -> int:
+    """Write one query to a Parquet dataset directory. Returns the number of rows"""
+    batches = _record_batches(conn, query)
+    first = next(batches, None)
+    if first is None:
+        return 0
+
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for batch in itertools.chain([first], batches):
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        counted(),
+        target,
+        schema=first.schema,
+        format='parquet',
+        partitioning=partition_cols,
+        partitioning_flavor='hive' if partition_cols else None,
+        existing_data_behavior='overwrite_or_ignore',
+    )
+    return rows
+
+
+def _table_dirs(root: str, names) -> list:
+    """Directories under root that belong to snapshot tables: <name>, <name>.<export id>, <name>.tmp"""
+    try:
+        entries = os.listdir(root)
+    except OSError:
+        return []
+    return [
+        entry for entry in entries
+        if any(entry == name or entry.startswith(f"{name}.") for name in names)
+        and os.path.isdir(os.path.join(root, entry))
+    ]
+
+
+def export_snapshot(db, root: str = SNAPSHOT_DIR, tables=None) -> Optional[dict]:
+    """
+    Write SNAPSHOT_TABLES to Parquet under root (hive-partitioned where configured).
+    Every export writes each table to a new directory <name>.<export id>; the
+    manifest, which maps table names to these directories, is replaced last
+    in one os.replace. Readers resolve paths through the manifest, so they
+    see either the previous export or the new one, never a mix. Tables not
+    exported this time keep their previous directory; a table with no rows
+    has no directory and readers fall back to the database. Directories
+    referenced by neither the new nor the previous manifest are removed.
+    Returns the manifest, or None on error.
+    """
+    tables = tables or list(SNAPSHOT_TABLES)
+    os.makedirs(root, exist_ok=True)
+    previous = _read_manifest(root) or {'tables': {}}
+    export_id = str(time.time_ns())
+    manifest = {'exported_at': time.time(), 'tables': dict(previous['tables'])}
+    try:
+        with db.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True)
+            for name in tables:
+                query, partition_cols = SNAPSHOT_TABLES[name]
+                path = f"{name}.{export_id}"
+
+                started = time.perf_counter()
+                rows = _export_table(conn, query, partition_cols, os.path.join(root, path))
+                entry = {'rows': rows, 'seconds': round(time.perf_counter() - started, 2)}
+                if rows:
+                    entry['path'] = path
+                manifest['tables'][name] = entry
+                logger.info(f"Exported {name}: {rows} rows")
+
+        with open(os.path.join(root, f"{MANIFEST}.tmp"), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(root, f"{MANIFEST}.tmp"), os.path.join(root, MANIFEST))
+    except Exception as e:
+        logger.error(f"Error exporting Parquet snapshot: {e}")
+        for path in _table_dirs(root, tables):
+            if path.endswith(f".{export_id}"):
+                shutil.rmtree(os.path.join(root, path), ignore_errors=True)
+        return None
+
+    read_snapshot.cache_clear()
+    # Poprzednia wersja zostaje - czytelnik mógł rozwiązać ścieżkę ze starego manifestu
+    keep = {entry.get('path') for m in (manifest, previous) for entry in m['tables'].values()}
+    for path in _table_dirs(root, set(SNAPSHOT_TABLES) | set(manifest['tables'])):
+        if path not in keep:
+            shutil.rmtree(os.path.join(root, path), ignore_errors=True)
+    logger.info(f"✅ Parquet snapshot written to {root}")
+    return manifest
+
+
+def manifest_version(root: str = SNAPSHOT_DIR) -> Optional[float]:
+    """mtime of the manifest (changes with every complete export), None if there is no snapshot"""
+    try:
+        return os.stat(os.path.join(root, MANIFEST)).st_mtime
+    except OSError:
+        return None
+
+
+def _read_manifest(root: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=8)
+def _manifest(root: str, version: float) -> Optional[dict]:
+    """Manifest of one export (version = manifest_version), parsed once per process"""
+    return _read_manifest(root)
+
+
+def snapshot_age(root: str = SNAPSHOT_DIR) -> Optional[float]:
+    """Seconds since the last complete export, None if there is no snapshot"""
+    version = manifest_version(root)
+    manifest = _manifest(root, version) if version is not None else None
+    exported_at = manifest.get('exported_at') if manifest else None
+    return time.time() - exported_at if exported_at is not None else None
+
+
+def is_fresh(max_age: int = SNAPSHOT_MAX_AGE_SECONDS, root: str = SNAPSHOT_DIR) -> bool:
+    age = snapshot_age(root)
+    return age is not None and age <= max_age
+
+
+@cached_query(maxsize=64, ttl_seconds=SNAPSHOT_MAX_AGE_SECONDS, tags=lambda *a, **k: ['snapshot'])
+def read_snapshot(name: str, columns=None, filters=None, root: str = SNAPSHOT_DIR,
+                  version: float = None) -> Optional[pd.DataFrame]:
+    """
+    Load a snapshot table memory-mapped, reading only the requested columns.
+    filters use the pyarrow form, e.g. [('ticker', '=', 'PKN.WA'), ('year', '>=', 2020)];
+    filters on partition columns skip whole files.
+    The table's directory comes from the manifest of that version.
+    version (manifest_version) is part of the cache key: each export is read
+    from disk once per process and served from memory until the next one.
+    """
+    version = version if version is not None else manifest_version(root)
+    manifest = _manifest(root, version) if version is not None else None
+    path = (manifest or {}).get('tables', {}).get(name, {}).get('path')
+    if path is None:
+        return None
+    path = os.path.join(root, path)
+    try:
+        table = pq.read_table(
+            path,
+            columns=list(columns) if columns else None,
+            filters=[tuple(f) for f in filters] if filters else None,
+            memory_map=True,
+        )
+        return table.to_pandas()
+    except Exception as e:
+        logger.error(f"Error reading snapshot {name}: {e}")
+        return None
+
+
+def read_or_fallback(name: str, fallback, columns=None, filters=None, max_age: int = SNAPSHOT_MAX_AGE_SECONDS,
+                     root: str = SNAPSHOT_DIR):
+    """Serve from the Parquet snapshot when it is fresh, otherwise call fallback() (DB query)"""
+    if is_fresh(max_age, root):
+        df = read_snapshot(name, columns=columns, filters=filters, root=root, version=manifest_version(root))
+        if df is not None:
+            return df
+    return fallback()
@@ -0,0 +1,116 @@
+"""
+Trailing-twelve-month (TTM) and growth aggregation
+"""
+
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Pozycje przepływowe sumowane po 4 kwartałach
+TTM_ITEMS = [
+    'przychody', 'ebitda', 'zysk_netto', 'przeplywy_operacyjne', 'przeplywy_inwestycyjne',
+    'przeplywy_finansowe', 'capex', 'free_cash_flow'
+]
+
+# Pozycje, dla których liczona jest dynamika r/r i k/k (w %)
+GROWTH_ITEMS = ['przychody', 'ebitda', 'zysk_netto']
+
+
+def _growth(item: str, lag: int) -> str:
+    return (
+        f"CASE WHEN {item}_q{lag} = q - {lag} AND {item}_lag{lag} != 0 "
+        f"THEN ({item} - {item}_lag{lag}) / ABS({item}_lag{lag}) * 100 END"
+    )
+
+
+def _build_refresh_sql() -> str:
+    """
+    One statement for all tickers: find the earliest changed quarter per ticker,
+    read it together with 4 quarters of look-back, run the window functions and
+    upsert every quarter from the changed one onwards (later TTM/YoY values
+    depend on it). Windows only count when the quarters are consecutive.
+    """
+    lags = ',\n            '.join(
+        f"LAG({item}, {lag}) OVER w AS {item}_lag{lag}, LAG(q, {lag}) OVER w AS {item}_q{lag}"
+        for item in GROWTH_ITEMS for lag in (1, 4)
+    )
+    sums = ',\n            '.join(f"SUM({item}) OVER w4 AS {item}_sum" for item in TTM_ITEMS)
+    full_window = "window_n = 4 AND window_start = q - 3"
+
+    columns = (
+        [f"{item}_ttm" for item in TTM_ITEMS]
+        + ['eps_ttm', 'roe_ttm', 'net_margin_ttm']
+        + [f"{item}_yoy" for item in GROWTH_ITEMS]
+        + [f"{item}_qoq" for item in GROWTH_ITEMS]
+        + ['source_updated_at']
+    )
+    values = (
+        [f"CASE WHEN {full_window} THEN {item}_sum END" for item in TTM_ITEMS]
+        + [
+            f"CASE WHEN {full_window} AND liczba_akcji != 0 THEN zysk_netto_sum / liczba_akcji END",
+            f"CASE WHEN {full_window} AND kapital_wlasny != 0 THEN zysk_netto_sum / kapital_wlasny * 100 END",
+            f"CASE WHEN {full_window} AND przychody_sum != 0 THEN zysk_netto_sum / przychody_sum * 100 END",
+        ]
+        + [_growth(item, 4) for item in GROWTH_ITEMS]
+        + [_growth(item, 1) for item in GROWTH_ITEMS]
+        + ['updated_at']
+    )
+
+    return f"""
+        WITH changed AS (
+            SELECT ticker, MIN(quarter_index(rok, kwartal)) AS from_q
+            FROM financials
+            WHERE :full OR updated_at > :since
+            GROUP BY ticker
+        ),
+        src AS (
+            SELECT f.*, quarter_index(f.rok, f.kwartal) AS q, ch.from_q
+            FROM financials f
+            JOIN changed ch ON ch.ticker = f.ticker
+            WHERE quarter_index(f.rok, f.kwartal) >= ch.from_q - 4
+        ),
+        win AS (
+            SELECT src.*,
+            {sums},
+            {lags},
+            COUNT(*) OVER w4 AS window_n,
+            FIRST_VALUE(q) OVER w4 AS window_start
+            FROM src
+            WINDOW w AS (PARTITION BY ticker ORDER BY q),
+                   w4 AS (PARTITION BY ticker ORDER BY q ROWS BETWEEN 3 PRECEDING AND CURRENT ROW)
+        )
+        INSERT INTO financials_ttm (ticker, rok, kwartal, {', '.join(columns)})
+        SELECT ticker, rok, kwartal,
+            {', '.join(values)}
+        FROM win
+        WHERE q >= from_q
+        ON CONFLICT (ticker, rok, kwartal) DO UPDATE SET
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in columns)},
+            updated_at = NOW();
+    """
+
+
+REFRESH_TTM_SQL = _build_refresh_sql()
+
+
+def refresh_ttm(db, full: bool = False) -> int:
+    """
+    Bring financials_ttm up to date.
+
+    Only tickers with financials rows changed since the last run are touched,
+    starting from their earliest changed quarter, so importing one new quarter
+    does not recompute the full history. full=True rebuilds everything.
+    Returns the number of upserted quarters, or None on error.
+    """
+    try:
+        with db.get_connection() as conn:
+            since = None if full else conn.execute(text("SELECT MAX(source_updated_at) FROM financials_ttm")).scalar()
+            full = full or since is None
+            result = conn.execute(text(REFRESH_TTM_SQL), {'full': full, 'since': since})
+            logger.info(f"✅ TTM refreshed ({'full' if full else 'incremental'}): {result.rowcount} quarters")
+            return result.rowcount
+    except Exception as e:
+        logger.error(f"Error refreshing TTM aggregates: {e}")
+        return None
@@ -0,0 +1,195 @@
+"""
+Point-in-time valuation history: daily P/E, P/B, EV/EBITDA and earnings yield
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.db import DatabaseConnection
+from utils.instrumentation import inc
+
+logger = logging.getLogger(__name__)
+
+# Tickery liczone jedną porcją - pamięć rośnie z liczbą notowań w porcji
+BATCH_TICKERS = 100
+
+VALUATION_COLUMNS = [
+    'ticker', 'date', 'close', 'rok', 'kwartal', 'market_cap', 'enterprise_value',
+    'pe_ttm', 'pb', 'ev_ebitda', 'earnings_yield', 'source_updated_at',
+]
+
+# Znacznik ostatniego przebiegu; bez wiersza (baza sprzed refresh_watermarks) - z zapisanej historii
+WATERMARK_SQL = """
+    SELECT COALESCE(
+        (SELECT since FROM refresh_watermarks WHERE name = 'valuation'),
+        (SELECT MAX(source_updated_at) FROM valuation_daily)
+    )
+"""
+
+SAVE_WATERMARK_SQL = """
+    INSERT INTO refresh_watermarks (name, since) VALUES ('valuation', %(since)s)
+    ON CONFLICT (name) DO UPDATE SET since = EXCLUDED.since, updated_at = NOW()
+"""
+
+# Tickery do przeliczenia: od najwcześniejszego zmienionego notowania,
+# a po zmianie raportów (albo TTM) cała historia (from_date = NULL).
+# seen_until - najnowsza zmiana źródeł tickera, także gdy nie da żadnego wiersza wyceny
+CHANGED_SQL = """
+    WITH price_changes AS (
+        SELECT ticker, MIN(date) AS from_date, MAX(updated_at) AS seen_until
+        FROM prices_daily
+        WHERE %(full)s OR updated_at > %(since)s
+        GROUP BY ticker
+    ),
+    report_changes AS (
+        SELECT ticker, MAX(updated_at) AS seen_until
+        FROM (
+            SELECT ticker, updated_at FROM financials WHERE %(full)s OR updated_at > %(since)s
+            UNION ALL
+            SELECT ticker, updated_at FROM financials_ttm WHERE %(full)s OR updated_at > %(since)s
+        ) r
+        GROUP BY ticker
+    )
+    SELECT ticker, CASE WHEN r.ticker IS NULL THEN p.from_date END AS from_date,
+           GREATEST(p.seen_until, r.seen_until) AS seen_until
+    FROM price_changes p
+    FULL JOIN report_changes r USING (ticker)
+    ORDER BY ticker
+"""
+
+# Raporty bez daty publikacji nie mają miejsca na osi czasu - pomijane
+REPORTS_SQL = """
+    SELECT f.ticker, f.data_publikacji, f.rok, f.kwartal, quarter_index(f.rok, f.kwartal) AS q,
+           f.liczba_akcji::float8 AS liczba_akcji,
+           f.kapital_wlasny::float8 AS kapital_wlasny,
+           (COALESCE(f.dlug_krotkoterminowy, 0) + COALESCE(f.dlug_dlugoterminowy, 0))::float8 AS debt,
+           COALESCE(f.srodki_pieniezne, 0)::float8 AS cash,
+           t.eps_ttm::float8 AS eps_ttm,
+           t.zysk_netto_ttm::float8 AS zysk_netto_ttm,
+           t.ebitda_ttm::float8 AS ebitda_ttm,
+           GREATEST(f.updated_at, t.updated_at) AS report_updated_at
+    FROM financials f
+    LEFT JOIN financials_ttm t ON t.ticker = f.ticker AND t.rok = f.rok AND t.kwartal = f.kwartal
+    WHERE f.ticker = ANY(%(tickers)s) AND f.data_publikacji IS NOT NULL
+    ORDER BY f.data_publikacji, q
+"""
+
+PRICES_SQL = """
+    SELECT ch.ticker, p.date, p.close::float8 AS close, p.updated_at
+    FROM unnest(%(tickers)s::text[], %(from_dates)s::date[]) AS ch(ticker, from_date)
+    JOIN prices_daily p ON p.ticker = ch.ticker AND (ch.from_date IS NULL OR p.date >= ch.from_date)
+    ORDER BY p.date
+"""
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE staging_valuation (LIKE valuation_daily INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+
+MERGE_SQL = f"""
+    INSERT INTO valuation_daily ({', '.join(VALUATION_COLUMNS)})
+    SELECT {', '.join(VALUATION_COLUMNS)} FROM staging_valuation
+    ON CONFLICT (ticker, date) DO UPDATE SET
+        {', '.join(f'{c} = EXCLUDED.{c}' for c in VALUATION_COLUMNS[2:])},
+        updated_at = NOW();
+    TRUNCATE staging_valuation;
+"""
+
+
+def compute_valuation(prices: pd.DataFrame, reports: pd.DataFrame) -> pd.DataFrame:
+    """
+    Valuation of every bar in prices (ticker, date, close, updated_at) from
+    the latest report published strictly before that day, found with one
+    as-of join across all tickers. Reports published on the bar's own day
+    count from the next session, so no value uses data that was not public
+    yet. Restated reports replace the originals in financials, so history
+    reflects the current figures of each quarter.
+    Bars without an earlier report are dropped.
+    """
+    frame = pd.merge_asof(
+        prices.sort_values('date'),
+        reports.sort_values(['data_publikacji', 'q']),
+        left_on='date',
+        right_on='data_publikacji',
+        by='ticker',
+        direction='backward',
+        allow_exact_matches=False,
+    )
+    frame = frame[frame['data_publikacji'].notna()].copy()
+
+    market_cap = frame['close'] * frame['liczba_akcji'].where(frame['liczba_akcji'] > 0)
+    enterprise_value = market_cap + frame['debt'] - frame['cash']
+    frame['market_cap'] = market_cap
+    frame['enterprise_value'] = enterprise_value
+    # Jak pe_ratio w latest_snapshot: tylko dodatnie zyski i kapitały
+    frame['pe_ttm'] = frame['close'] / frame['eps_ttm'].where(frame['eps_ttm'] > 0)
+    frame['pb'] = market_cap / frame['kapital_wlasny'].where(frame['kapital_wlasny'] > 0)
+    frame['ev_ebitda'] = enterprise_value / frame['ebitda_ttm'].where(frame['ebitda_ttm'] > 0)
+    frame['earnings_yield'] = frame['zysk_netto_ttm'] / market_cap * 100
+    frame['rok'] = frame['rok'].astype('Int64')
+    frame['source_updated_at'] = frame[['updated_at', 'report_updated_at']].max(axis=1)
+    frame = frame.replace([np.inf, -np.inf], np.nan)
+    return frame.sort_values(['ticker', 'date'])[VALUATION_COLUMNS]
+
+
+def refresh_valuation(db, full: bool = False, progress=None):
+    """
+    Bring valuation_daily up to date.
+
+    New or corrected prices recompute their ticker from the earliest changed
+    bar; a new or restated report (or its TTM row) recomputes that ticker's
+    whole history, since it can move the as-of match of any later bar.
+    full=True rebuilds everything. Everything is written in one transaction.
+
+    The next run starts from the newest source change this run saw, kept in
+    refresh_watermarks, so tickers that yield no rows (no prices, or reports
+    without data_publikacji) are not picked up again on every run.
+    progress(done, total, ticker) is called after every batch of tickers.
+    Returns a dict with the written rows and the tickers that got rows, or None on error.
+    """
+    try:
+        with db.get_raw_connection() as conn:
+            with conn.cursor() as cur:
+                since = None
+                if not full:
+                    cur.execute(WATERMARK_SQL)
+                    since = cur.fetchone()[0]
+                full = full or since is None
+                cur.execute(CHANGED_SQL, {'full': full, 'since': since})
+                changed = cur.fetchall()
+                if not changed:
+                    logger.info("Valuation history up to date, no changed prices or reports")
+                    return {'rows_written': 0, 'changed_tickers': []}
+                cur.execute(STAGING_TABLE_SQL)
+
+                written, written_tickers = 0, set()
+                for i in range(0, len(changed), BATCH_TICKERS):
+                    batch = changed[i:i + BATCH_TICKERS]
+                    params = {'tickers': [t for t, _, _ in batch], 'from_dates': [d for _, d, _ in batch]}
+                    cur.execute(REPORTS_SQL, params)
+                    reports = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+                    cur.execute(PRICES_SQL, params)
+                    prices = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+                    if not reports.empty and not prices.empty:
+                        prices['date'] = pd.to_datetime(prices['date'])
+                        reports['data_publikacji'] = pd.to_datetime(reports['data_publikacji'])
+                        frame = compute_valuation(prices, reports)
+                        DatabaseConnection.copy_dataframe(cur, frame, 'staging_valuation', VALUATION_COLUMNS)
+                        cur.execute(MERGE_SQL)
+                        written += len(frame)
+                        written_tickers.update(frame['ticker'])
+                    if progress:
+                        progress(i + len(batch), len(changed), batch[-1][0])
+
+                cur.execute(SAVE_WATERMARK_SQL, {'since': max(seen for _, _, seen in changed)})
+
+        inc('valuation_rows_total', written)
+        logger.info(
+            f"✅ Valuation history refreshed ({'full' if full else 'incremental'}): "
+            f"{written} rows for {len(written_tickers)} of {len(changed)} changed tickers"
+        )
+        return {'rows_written': written, 'changed_tickers': sorted(written_tickers)}
+    except Exception as e:
+        logger.error(f"Error refreshing valuation history: {e}")
+        return None
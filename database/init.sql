@@ -1,3 +1,6 @@
+-- Uruchamiany tylko przy tworzeniu wolumenu. Nowe tabele, kolumny i indeksy
+-- trafiają też do app/scripts/migrate_schema.py (istniejące bazy).
+
 -- Tabela spółek
 CREATE TABLE IF NOT EXISTS companies (
     ticker VARCHAR(10) PRIMARY KEY,
@@ -78,6 +81,9 @@ CREATE TABLE IF NOT EXISTS financials (
     current_ratio NUMERIC,
     eps NUMERIC,
     ebitda_margin NUMERIC,
+
+    -- md5 wartości z Excela; import nadpisuje wiersz tylko gdy się zmienił
+    row_hash CHAR(32),
     
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
@@ -85,6 +91,32 @@ CREATE TABLE IF NOT EXISTS financials (
     CONSTRAINT unique_financial_report UNIQUE (ticker, rok, kwartal)
 );
 
+-- Skróty plików źródłowych ostatniego udanego importu - niezmieniony plik jest pomijany
+CREATE TABLE IF NOT EXISTS import_fingerprints (
+    source VARCHAR(255) PRIMARY KEY,
+    file_hash CHAR(64) NOT NULL,
+    imported_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Historia uruchomień jobów (scripts/run_scheduler.py, utils/jobs.py)
+CREATE TABLE IF NOT EXISTS job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL, -- queued / running / success / failed
+    trigger VARCHAR(20) NOT NULL DEFAULT 'schedule',
+    started_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP,
+    duration_ms INT,
+    rows INT,
+    stage VARCHAR(50),
+    progress JSONB,
+    details JSONB,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs(job, started_at DESC);
+-- Najwyżej jedno zakolejkowane lub trwające uruchomienie danego joba (deduplikacja "Force Update")
+CREATE UNIQUE INDEX IF NOT EXISTS idx_job_runs_active ON job_runs(job) WHERE status IN ('queued', 'running');
+
 -- Daily prices
 CREATE TABLE IF NOT EXISTS prices_daily (
     id SERIAL PRIMARY KEY,
@@ -96,15 +128,120 @@ CREATE TABLE IF NOT EXISTS prices_daily (
     close DECIMAL(10,2) NOT NULL,
     volume BIGINT,
     created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
     
     UNIQUE(ticker, date)
 );
 
+-- Dla dużych historii: scripts/migrate_prices_partitioned.py przenosi prices_daily
+-- do partycji rocznych z indeksem BRIN na date
+
 -- Indeksy dla szybszego wyszukiwania
 CREATE INDEX IF NOT EXISTS idx_financials_ticker ON financials(ticker);
-CREATE INDEX IF NOT EXISTS idx_financials_ticker ON financials(rok, kwartal);
+CREATE INDEX IF NOT EXISTS idx_financials_period ON financials(rok, kwartal);
+-- Najnowszy raport spółki (screener, get_latest_financials) jednym skanem indeksu
+CREATE INDEX IF NOT EXISTS idx_financials_ticker_period ON financials(ticker, rok DESC, kwartal DESC);
 CREATE INDEX IF NOT EXISTS idx_prices_ticker_date ON prices_daily(ticker, date DESC);
 CREATE INDEX IF NOT EXISTS idx_prices_date ON prices_daily(date DESC);
+-- Notowania zmienione od ostatniego przeliczenia wskaźników (updated_at rośnie razem z fizyczną kolejnością)
+CREATE INDEX IF NOT EXISTS idx_prices_updated_brin ON prices_daily USING BRIN (updated_at);
+
+-- Ciągły numer kwartału (rok * 4 + kwartał - 1), do okien TTM / YoY
+CREATE OR REPLACE FUNCTION quarter_index(rok INT, kwartal VARCHAR)
+RETURNS INT AS $$
+    SELECT rok * 4 + substring(kwartal FROM '[1-4]')::INT - 1
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Sumy kroczące 4 kwartałów (TTM) i dynamika r/r, k/k - utrzymywane przyrostowo przez utils/ttm.py
+CREATE TABLE IF NOT EXISTS financials_ttm (
+    ticker VARCHAR(10) NOT NULL,
+    rok INT NOT NULL,
+    kwartal VARCHAR(10) NOT NULL,
+
+    przychody_ttm NUMERIC,
+    ebitda_ttm NUMERIC,
+    zysk_netto_ttm NUMERIC,
+    przeplywy_operacyjne_ttm NUMERIC,
+    przeplywy_inwestycyjne_ttm NUMERIC,
+    przeplywy_finansowe_ttm NUMERIC,
+    capex_ttm NUMERIC,
+    free_cash_flow_ttm NUMERIC,
+
+    eps_ttm NUMERIC,
+    roe_ttm NUMERIC,
+    net_margin_ttm NUMERIC,
+
+    przychody_yoy NUMERIC,
+    ebitda_yoy NUMERIC,
+    zysk_netto_yoy NUMERIC,
+    przychody_qoq NUMERIC,
+    ebitda_qoq NUMERIC,
+    zysk_netto_qoq NUMERIC,
+
+    source_updated_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (ticker, rok, kwartal)
+);
+
+-- Wskaźniki techniczne per notowanie - utrzymywane przyrostowo przez utils/indicators.py.
+-- ema_*, avg_gain_14, avg_loss_14 i running_max to stan przenoszony na kolejne dni.
+CREATE TABLE IF NOT EXISTS price_indicators (
+    ticker VARCHAR(10) NOT NULL REFERENCES companies(ticker) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    close NUMERIC,
+
+    sma_20 DOUBLE PRECISION,
+    sma_50 DOUBLE PRECISION,
+    sma_200 DOUBLE PRECISION,
+    ema_12 DOUBLE PRECISION,
+    ema_26 DOUBLE PRECISION,
+    rsi_14 DOUBLE PRECISION,
+    avg_gain_14 DOUBLE PRECISION,
+    avg_loss_14 DOUBLE PRECISION,
+    volatility_20 DOUBLE PRECISION, -- roczna, w %
+    running_max DOUBLE PRECISION,
+    drawdown DOUBLE PRECISION,      -- od szczytu, w %
+    high_52w DOUBLE PRECISION,
+    low_52w DOUBLE PRECISION,
+
+    source_updated_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (ticker, date)
+);
+-- MAX(source_updated_at) = znacznik, od którego szukać zmienionych notowań
+CREATE INDEX IF NOT EXISTS idx_price_indicators_source_updated ON price_indicators(source_updated_at);
+
+-- Dzienna historia wycen (P/E, P/B, EV/EBITDA) z raportu opublikowanego przed danym dniem
+-- (as-of join po data_publikacji) - utrzymywana przyrostowo przez utils/valuation.py
+CREATE TABLE IF NOT EXISTS valuation_daily (
+    ticker VARCHAR(10) NOT NULL REFERENCES companies(ticker) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    close NUMERIC,
+    rok INT,
+    kwartal VARCHAR(10),
+
+    market_cap DOUBLE PRECISION,
+    enterprise_value DOUBLE PRECISION,
+    pe_ttm DOUBLE PRECISION,
+    pb DOUBLE PRECISION,
+    ev_ebitda DOUBLE PRECISION,
+    earnings_yield DOUBLE PRECISION, -- zysk netto TTM / kapitalizacja, w %
+
+    source_updated_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (ticker, date)
+);
+CREATE INDEX IF NOT EXISTS idx_valuation_daily_source_updated ON valuation_daily(source_updated_at);
+
+-- Znaczniki przyrostowych przeliczeń: zmiany źródeł do "since" są już uwzględnione
+CREATE TABLE IF NOT EXISTS refresh_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    since TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
 
 -- Function to calculate metrics
 CREATE OR REPLACE FUNCTION calculate_metrics_trigger_func()
@@ -122,7 +259,53 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger to run the function after insert or update
+-- Bulk imports compute the metrics set-based and disable it with
+-- SET LOCAL fintech.skip_metrics_trigger = 'on'
 CREATE TRIGGER metrics_trigger
 BEFORE INSERT OR UPDATE ON financials
 FOR EACH ROW
-EXECUTE FUNCTION calculate_metrics_trigger_func();
\ No newline at end of file
+WHEN (current_setting('fintech.skip_metrics_trigger', true) IS DISTINCT FROM 'on')
+EXECUTE FUNCTION calculate_metrics_trigger_func();
+
+-- Najnowsze notowanie, najnowszy raport i wskaźniki każdej spółki.
+-- Odświeżany (CONCURRENTLY) przez skrypty importu po udanym załadowaniu danych,
+-- odczyt w aplikacji to wyszukiwanie po kluczu ticker.
+CREATE MATERIALIZED VIEW IF NOT EXISTS latest_snapshot AS
+SELECT
+    c.ticker, c.name, c.sector,
+
+    -- Notowanie
+    p.date AS price_date, p.open, p.high, p.low, p.close, p.volume,
+
+    -- Raport
+    f.waluta, f.data_publikacji, f.rok, f.kwartal,
+    f.przychody, f.koszty_sprzedanych_produktow, f.zysk_brutto_ze_sprzedazy, f.koszty_operacyjne,
+    f.ebitda, f.amortyzacja, f.ebit, f.przychody_finansowe, f.koszty_finansowe, f.zysk_brutto,
+    f.podatek_dochodowy, f.zysk_netto, f.zysk_netto_jednostki_dominujacej,
+    f.aktywa_obrotowe, f.srodki_pieniezne, f.naleznosci_krotkoterminowe, f.zapasy, f.pozostale_aktywa_obrotowe,
+    f.aktywa_trwale, f.rzeczowe_aktywa_trwale, f.wartosci_niematerialne, f.inwestycje_dlugoterminowe,
+    f.pozostale_aktywa_trwale, f.aktywa_razem,
+    f.zobowiazania_krotkoterminowe, f.dlug_krotkoterminowy, f.zobowiazania_handlowe, f.pozostale_zobowiazania_krotkoterminowe,
+    f.zobowiazania_dlugoterminowe, f.dlug_dlugoterminowy, f.pozostale_zobowiazania_dlugoterminowe,
+    f.kapital_wlasny, f.kapital_zakladowy, f.kapital_zapasowy, f.zyski_zatrzymane, f.pasywa_razem,
+    f.przeplywy_operacyjne, f.przeplywy_inwestycyjne, f.przeplywy_finansowe, f.zmiana_stanu_srodkow,
+    f.capex, f.free_cash_flow, f.liczba_akcji,
+
+    -- Wskaźniki
+    f.roe, f.roa, f.net_margin, f.debt_to_equity, f.current_ratio, f.eps, f.ebitda_margin,
+    CASE WHEN f.eps > 0 THEN p.close / f.eps END AS pe_ratio
+FROM companies c
+LEFT JOIN LATERAL (
+    SELECT date, open, high, low, close, volume FROM prices_daily
+    WHERE ticker = c.ticker
+    ORDER BY date DESC LIMIT 1
+) p ON TRUE
+LEFT JOIN LATERAL (
+    SELECT * FROM financials
+    WHERE ticker = c.ticker
+    ORDER BY rok DESC, kwartal DESC LIMIT 1
+) f ON TRUE
+WITH DATA;
+
+-- Unikalny indeks jest wymagany przez REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_latest_snapshot_ticker ON latest_snapshot(ticker);